@@ -0,0 +1,174 @@
+import os
+import asyncio
+import logging
+from collections import defaultdict, deque
+from typing import Optional
+
+from discord.ext import commands
+from discord.ext.commands import Context
+
+from metrics import Metrics, Samples, sample_name
+
+logger = logging.getLogger("admission")
+
+# how much a piece of work matters, commands set it with extras={"priority": ...} or their cog's admission_priority
+LOW = "low"  # replybot echoes, fun commands
+NORMAL = "normal"
+HEAVY = "heavy"  # renders and searches, worth queueing but not worth running on an overloaded loop
+CRITICAL = "critical"  # admin and music controls
+PRIORITIES = (LOW, NORMAL, HEAVY, CRITICAL)
+
+PRESSURE_LEVELS = ("normal", "elevated", "high", "critical")
+DEFAULT_THRESHOLDS = (0.1, 0.5, 2.0)  # in seconds of event loop lag, for elevated, high and critical
+
+SERVE = "serve"
+QUEUE = "queue"  # wait for the pressure to drop below high
+REJECT = "reject"  # with a short notice
+SHED = "shed"  # dropped silently
+# what each priority gets at each pressure level
+POLICY = {
+    LOW: (SERVE, SHED, SHED, SHED),
+    NORMAL: (SERVE, SERVE, SERVE, REJECT),
+    HEAVY: (SERVE, SERVE, QUEUE, REJECT),
+    CRITICAL: (SERVE, SERVE, SERVE, SERVE),
+}
+
+HOLD = 5.0  # in seconds, the pressure only drops a level once the lag stayed below it this long
+MAX_QUEUED = 20
+QUEUE_TIMEOUT = 15.0  # in seconds, queued commands are rejected past it
+DRAIN_INTERVAL = 0.25  # in seconds
+RELEASE_PER_DRAIN = 2  # queued commands let through per drain, so they don't all land on the loop at once
+NOTICE = "Furret is overloaded right now, try again in a bit"
+
+
+def parse_thresholds(value: Optional[str]) -> tuple[float, float, float]:
+    """OVERLOAD_LAG as elevated,high,critical in milliseconds"""
+    if not value:
+        return DEFAULT_THRESHOLDS
+    try:
+        elevated, high, critical = sorted(float(part) / 1000 for part in value.split(","))
+    except ValueError:
+        logger.warning(f"OVERLOAD_LAG should be 3 comma separated milliseconds, not {value}, using the defaults")
+        return DEFAULT_THRESHOLDS
+    return elevated, high, critical
+
+
+def command_priority(command: commands.Command) -> str:
+    """The command's own priority, or its closest parent's, or its cog's"""
+    for parent in (command, *command.parents):
+        if priority := parent.extras.get("priority"):
+            return priority
+    return getattr(command.cog, "admission_priority", NORMAL)
+
+
+class Overloaded(commands.CheckFailure):
+    def __init__(self, priority: str, notice: Optional[str] = NOTICE):
+        super().__init__(f"Overloaded, turned away {priority} priority work")
+        self.notice: Optional[str] = notice  # None when shed silently
+
+
+class Admission:
+    """Admission control driven by event loop lag, low priority work is shed first and heavy commands queued
+
+    Pressure rises as soon as the lag crosses a threshold, and drops one level at a time once it stayed under it
+    for HOLD seconds, so a single quiet probe in the middle of a raid doesn't let everything back in.
+    """
+
+    def __init__(self, metrics: Metrics, thresholds: Optional[tuple[float, float, float]] = None):
+        self.metrics: Metrics = metrics
+        self.thresholds: tuple[float, float, float] = thresholds or parse_thresholds(os.getenv("OVERLOAD_LAG"))
+        self._level: int = 0
+        self._calm_since: Optional[float] = None  # loop time the lag went under the current level
+        self._queue: deque[asyncio.Future] = deque()
+        self._drain_task: Optional[asyncio.Task] = None
+        self.shed: dict[tuple[str, str], int] = defaultdict(int)  # (kind, priority) to count
+        self.rejected: dict[str, int] = defaultdict(int)  # priority to count
+        self.queued: int = 0
+
+    def pressure(self) -> int:
+        """0 to 3, an index into PRESSURE_LEVELS"""
+        lag = self.metrics.current_loop_lag()
+        level = sum(lag >= threshold for threshold in self.thresholds)
+        now = asyncio.get_running_loop().time()
+        if level >= self._level:
+            if level > self._level:
+                logger.warning(f"Pressure up to {PRESSURE_LEVELS[level]}, event loop lag {lag * 1000:.0f}ms")
+            self._level = level
+            self._calm_since = None
+        elif self._calm_since is None:
+            self._calm_since = now
+        elif now - self._calm_since >= HOLD:
+            self._level -= 1
+            self._calm_since = now if level < self._level else None
+            logger.info(f"Pressure down to {PRESSURE_LEVELS[self._level]}")
+        return self._level
+
+    def action(self, priority: str) -> str:
+        return POLICY[priority][self.pressure()]
+
+    def admit(self, priority: str, kind: str = "trigger") -> bool:
+        """Whether work that can't wait or tell anyone should run, counts it as shed if not"""
+        if self.action(priority) == SERVE:
+            return True
+        self.shed[(kind, priority)] += 1
+        return False
+
+    async def check(self, ctx: Context) -> bool:
+        """Global check run once per invoke, raises Overloaded for commands turned away"""
+        priority = command_priority(ctx.command)
+        action = self.action(priority)
+        if action == SHED:
+            self.shed[("command", priority)] += 1
+            raise Overloaded(priority, notice=None)
+        elif action == REJECT:
+            self.rejected[priority] += 1
+            raise Overloaded(priority)
+        elif action == QUEUE:
+            await self._wait_turn(priority)
+        return True
+
+    async def _wait_turn(self, priority: str) -> None:
+        if len(self._queue) >= MAX_QUEUED:
+            self.rejected[priority] += 1
+            raise Overloaded(priority)
+
+        turn = asyncio.get_running_loop().create_future()
+        self._queue.append(turn)
+        self.queued += 1
+        if self._drain_task is None or self._drain_task.done():
+            self._drain_task = asyncio.create_task(self._drain())
+        try:
+            await asyncio.wait_for(turn, QUEUE_TIMEOUT)
+        except (asyncio.TimeoutError, Overloaded):
+            self.rejected[priority] += 1
+            raise Overloaded(priority) from None
+        finally:
+            if turn in self._queue:
+                self._queue.remove(turn)
+
+    async def _drain(self) -> None:
+        while self._queue:
+            await asyncio.sleep(DRAIN_INTERVAL)
+            level = self.pressure()
+            if level == len(PRESSURE_LEVELS) - 1:  # queued commands won't get a turn any time soon
+                while self._queue:
+                    if not (turn := self._queue.popleft()).done():
+                        turn.set_exception(Overloaded(HEAVY))
+            elif level < PRESSURE_LEVELS.index("high"):
+                released = 0
+                while self._queue and released < RELEASE_PER_DRAIN:
+                    if not (turn := self._queue.popleft()).done():
+                        turn.set_result(None)
+                        released += 1
+
+    async def collect_metrics(self) -> Samples:
+        samples = {
+            "admission_pressure": self._level,
+            "admission_queue_length": len(self._queue),
+            "admission_queued_total": self.queued,
+        }
+        for (kind, priority), count in self.shed.items():
+            samples[sample_name("admission_shed_total", kind=kind, priority=priority)] = count
+        for priority, count in self.rejected.items():
+            samples[sample_name("admission_rejected_total", priority=priority)] = count
+        return samples
@@ -0,0 +1,91 @@
+"""The same workload on every event loop configuration this python can run, to pick EVENT_LOOP and EAGER_TASKS by
+
+Each configuration runs in its own process, a few times interleaved with the others, and the best run counts:
+- timers: tasks ticking like bonk timers and tasks.loop, arming and cancelling timeouts
+- the replay workloads: gateway messages dispatched to the cogs, answered by the fake REST API
+
+usage: python -m benchmarks.event_loop [--events N] [--runs N] [workload ...]
+"""
+import io
+import sys
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+from contextlib import redirect_stdout
+
+from event_loop import LoopConfig, available_configs
+
+DEFAULT_WORKLOADS = ("chatty", "bonks")
+TIMER_TASKS = 2000
+TIMER_TICKS = 50
+
+
+async def timers() -> tuple[int, float]:
+    """Callbacks run and seconds taken"""
+    loop = asyncio.get_running_loop()
+
+    async def ticking() -> None:
+        for _ in range(TIMER_TICKS):
+            timeout = loop.call_later(60, lambda: None)  # like the timeout of a request that answers in time
+            await asyncio.sleep(0)
+            timeout.cancel()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(asyncio.create_task(ticking()) for _ in range(TIMER_TASKS)))
+    return TIMER_TASKS * TIMER_TICKS, time.perf_counter() - start
+
+
+async def measure(workloads: list[str], events: int) -> dict[str, tuple[int, float]]:
+    from benchmarks import replay  # imports the bot, only in the worker processes
+
+    results = {"timers": await timers()}
+    with redirect_stdout(io.StringIO()):  # only the numbers are reported, not every listener
+        results.update(await replay.run(workloads, events))
+    return results
+
+
+def worker(config: LoopConfig, workloads: list[str], events: int) -> None:
+    print(json.dumps(config.run(measure(workloads, events))))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare event loop configurations on the same workload")
+    parser.add_argument("workloads", nargs="*", default=[*DEFAULT_WORKLOADS], help="replay workloads to run")
+    parser.add_argument("--events", type=int, default=3000, help="events per replay workload")
+    parser.add_argument("--runs", type=int, default=3, help="runs of every configuration, the best one counts")
+    parser.add_argument("--worker", nargs=2, metavar=("LOOP", "EAGER"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        loop, eager = args.worker
+        worker(LoopConfig(loop, eager == "1"), args.workloads, args.events)
+        return
+
+    configs = available_configs()
+    best: dict[LoopConfig, dict[str, tuple[int, float]]] = {config: {} for config in configs}
+    for _ in range(args.runs):
+        for config in configs:
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.event_loop", *args.workloads, "--events", str(args.events),
+                 "--worker", config.loop, "1" if config.eager_tasks else "0"],
+                capture_output=True, text=True, check=True
+            ).stdout
+            for name, (count, elapsed) in json.loads(output.splitlines()[-1]).items():
+                if name not in best[config] or elapsed < best[config][name][1]:
+                    best[config][name] = (count, elapsed)
+
+    baseline = best[configs[0]]
+    for name in baseline:
+        print(f"{name}:")
+        for config in configs:
+            count, elapsed = best[config][name]
+            print(f"  {str(config):<26} {count / elapsed:>10.0f}/s {elapsed * 1000:8.1f}ms "
+                  f"| {baseline[name][1] / elapsed:4.2f}x")
+    if len(configs) < 4:
+        print("uvloop isn't installed, or eager tasks need python 3.12, the missing configurations were skipped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Gateway payloads and an in process stand-in for discord's REST API, so a Furret instance can run offline"""
+import re
+import json
+import itertools
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from discord.http import Route
+from discord.utils import time_snowflake
+
+BOT_USER_ID = 1
+_snowflakes = itertools.count(time_snowflake(datetime.now(timezone.utc)))  # ids double as creation times
+
+TEXT_CHANNEL = 0
+VOICE_CHANNEL = 2
+PUBLIC_THREAD = 11
+MESSAGE_ID_PATTERN = re.compile(r"/messages/(\d+)")
+MEMBER_ID_PATTERN = re.compile(r"/members/(\d+)")
+
+
+def snowflake() -> int:
+    return next(_snowflakes)
+
+
+def timestamp() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def user_payload(user_id: int, *, bot: bool = False) -> dict:
+    return {"id": str(user_id), "username": f"user{user_id}", "discriminator": "0", "global_name": None,
+            "avatar": None, "bot": bot}
+
+
+def member_payload(user_id: int, role_ids: tuple[int, ...] = (), *, bot: bool = False) -> dict:
+    return {"user": user_payload(user_id, bot=bot), "roles": [str(r) for r in role_ids], "joined_at": timestamp(),
+            "deaf": False, "mute": False, "flags": 0}
+
+
+def channel_payload(channel_id: int, guild_id: int, kind: int = TEXT_CHANNEL, position: int = 0) -> dict:
+    data = {"id": str(channel_id), "guild_id": str(guild_id), "type": kind, "name": f"channel{channel_id}",
+            "position": position, "permission_overwrites": [], "nsfw": False, "parent_id": None}
+    if kind == VOICE_CHANNEL:
+        data.update(bitrate=64000, user_limit=0, rtc_region=None)
+    return data
+
+
+def voice_state_payload(guild_id: int, channel_id: Optional[int], user_id: int) -> dict:
+    return {"guild_id": str(guild_id), "channel_id": str(channel_id) if channel_id else None,
+            "user_id": str(user_id), "session_id": f"session{user_id}", "deaf": False, "mute": False,
+            "self_deaf": False, "self_mute": False, "self_video": False, "suppress": False,
+            "request_to_speak_timestamp": None}
+
+
+def guild_payload(
+        guild_id: int,
+        *,
+        owner_id: int,
+        channels: list[dict],
+        members: list[dict],
+        roles: list[dict] = (),
+        voice_states: list[dict] = (),
+        afk_channel_id: Optional[int] = None) -> dict:
+    everyone = {"id": str(guild_id), "name": "@everyone", "permissions": "1071698660929", "position": 0,
+                "color": 0, "hoist": False, "managed": False, "mentionable": False, "flags": 0}
+    return {
+        "id": str(guild_id), "name": f"guild{guild_id}", "owner_id": str(owner_id), "icon": None,
+        "afk_channel_id": str(afk_channel_id) if afk_channel_id else None, "afk_timeout": 300,
+        "verification_level": 0, "default_message_notifications": 0, "explicit_content_filter": 0,
+        "features": [], "mfa_level": 0, "premium_tier": 0, "preferred_locale": "en-US", "nsfw_level": 0,
+        "roles": [everyone, *roles], "emojis": [], "stickers": [], "channels": channels, "threads": [],
+        # every member given is cached, so the guild counts as chunked
+        "members": members, "member_count": len(members), "voice_states": voice_states,
+        "presences": [], "stage_instances": [], "guild_scheduled_events": [], "unavailable": False,
+    }
+
+
+def role_payload(role_id: int, position: int = 1) -> dict:
+    return {"id": str(role_id), "name": f"role{role_id}", "permissions": "0", "position": position, "color": 0,
+            "hoist": False, "managed": False, "mentionable": True, "flags": 0}
+
+
+def message_payload(message_id: int, channel_id: int, guild_id: Optional[int], author_id: int, content: str = "",
+                    *, bot: bool = False, embeds: list[dict] = ()) -> dict:
+    data = {
+        "id": str(message_id), "channel_id": str(channel_id), "author": user_payload(author_id, bot=bot),
+        "content": content, "timestamp": timestamp(), "edited_timestamp": None, "tts": False,
+        "mention_everyone": False, "mentions": [], "mention_roles": [], "attachments": [], "embeds": list(embeds),
+        "pinned": False, "type": 0, "flags": 0,
+    }
+    if guild_id is not None:
+        data["guild_id"] = str(guild_id)
+        data["member"] = {"roles": [], "joined_at": timestamp(), "deaf": False, "mute": False, "flags": 0}
+    return data
+
+
+def reaction_payload(guild_id: int, channel_id: int, message_id: int, user_id: int, emoji: str) -> dict:
+    return {"guild_id": str(guild_id), "channel_id": str(channel_id), "message_id": str(message_id),
+            "user_id": str(user_id), "member": member_payload(user_id), "emoji": {"id": None, "name": emoji},
+            "type": 0, "burst": False}
+
+
+def presence_payload(guild_id: int, user_id: int, status: str) -> dict:
+    return {"guild_id": str(guild_id), "user": {"id": str(user_id)}, "status": status,
+            "activities": [], "client_status": {"desktop": status}}
+
+
+def typing_payload(guild_id: int, channel_id: int, user_id: int) -> dict:
+    return {"guild_id": str(guild_id), "channel_id": str(channel_id), "user_id": str(user_id),
+            "timestamp": int(datetime.now(timezone.utc).timestamp()), "member": member_payload(user_id)}
+
+
+def members_chunk_payload(guild_id: int, members: list[dict], index: int, count: int, nonce: str) -> dict:
+    return {"guild_id": str(guild_id), "members": members, "chunk_index": index, "chunk_count": count,
+            "nonce": nonce}
+
+
+class FakeHTTP:
+    """Answers REST calls in process instead of sending them to discord, and records them.
+
+    Messages the bot creates are queued in echoes, to be fed back as MESSAGE_CREATE like the gateway would.
+    """
+
+    def __init__(self):
+        self.requests: Counter[str] = Counter()  # route key to count
+        self.echoes: list[dict] = []
+        self.last_message_ids: dict[int, int] = {}  # channel id to the last message the bot created in it
+        self._guild_ids: dict[int, int] = {}  # channel id to guild id
+
+    def install(self, client) -> None:
+        client.http.request = self.request
+
+    def add_guild(self, data: dict) -> None:
+        for channel in data["channels"]:
+            self._guild_ids[int(channel["id"])] = int(data["id"])
+
+    @staticmethod
+    def _payload(kwargs: dict) -> dict:
+        if "json" in kwargs:
+            return kwargs["json"] or {}
+        for field in kwargs.get("form") or ():  # messages with files
+            if field["name"] == "payload_json":
+                return json.loads(field["value"])
+        return {}
+
+    async def request(self, route: Route, **kwargs: Any) -> Any:
+        self.requests[route.key] += 1
+        channel_id = int(route.channel_id) if route.channel_id else None
+        guild_id = self._guild_ids.get(channel_id)
+
+        match route.method, route.path:
+            case "POST", "/channels/{channel_id}/messages":
+                payload = self._payload(kwargs)
+                data = message_payload(snowflake(), channel_id, guild_id, BOT_USER_ID, payload.get("content") or "",
+                                       bot=True, embeds=payload.get("embeds") or [])
+                self.last_message_ids[channel_id] = int(data["id"])
+                self.echoes.append(data)
+                return data
+            case "PATCH", "/channels/{channel_id}/messages/{message_id}":
+                payload = self._payload(kwargs)
+                message_id = int(MESSAGE_ID_PATTERN.search(route.url).group(1))
+                return message_payload(message_id, channel_id, guild_id, BOT_USER_ID, payload.get("content") or "",
+                                       bot=True, embeds=payload.get("embeds") or [])
+            case "POST", "/channels/{channel_id}/messages/{message_id}/threads":
+                thread_id = int(MESSAGE_ID_PATTERN.search(route.url).group(1))  # threads share their message's id
+                return {
+                    **channel_payload(thread_id, guild_id, PUBLIC_THREAD), "parent_id": str(channel_id),
+                    "owner_id": str(BOT_USER_ID), "name": self._payload(kwargs).get("name", ""),
+                    "thread_metadata": {"archived": False, "auto_archive_duration": 1440,
+                                        "archive_timestamp": timestamp(), "locked": False},
+                    "member_count": 1, "message_count": 0,
+                }
+            case "PATCH", "/guilds/{guild_id}/members/{user_id}":  # moving members between voice channels
+                return member_payload(int(MEMBER_ID_PATTERN.search(route.url).group(1)))
+            case _:  # reactions, pins and deletes, nothing the bot reads back
+                return None
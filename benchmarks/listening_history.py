@@ -0,0 +1,70 @@
+"""Listening history at scale, how fast batches are written and how fast the stats answer from the rollups
+
+usage: python -m benchmarks.listening_history [plays]
+"""
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+
+from cogs.music.history import ListeningHistory, Play, DAY, BATCH_SIZE, SEED_DAYS
+
+PLAYS = 1_000_000
+GUILDS = 5
+TRACKS = 20000
+REQUESTERS = 500
+DAYS = 365
+
+
+def plays(count: int) -> list[Play]:
+    now = int(time.time())
+    tracks = [(f"track{i:06}", json.dumps({"encoded": f"QAAA{i}", "info": {"identifier": f"track{i:06}"}}))
+              for i in range(TRACKS)]
+    weights = [1 / (rank + 1) for rank in range(TRACKS)]  # a few hits, a long tail
+    picked = random.choices(tracks, weights, k=count)
+    return [
+        Play(guild_id=random.randrange(GUILDS) + 1, requester_id=random.randrange(REQUESTERS), identifier=identifier,
+             title=f"title of {identifier}", author="someone", uri=f"https://youtu.be/{identifier}", data=data,
+             started_at=now - random.randrange(DAYS * DAY), seconds=random.randrange(30, 300))
+        for identifier, data in picked
+    ]
+
+
+def timed(call, repeat: int = 20) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(count: int) -> None:
+    random.seed(0)
+    generated = plays(count)
+    with tempfile.TemporaryDirectory() as directory:
+        history = ListeningHistory(os.path.join(directory, "history.db"))
+        start = time.perf_counter()
+        for i in range(0, count, BATCH_SIZE):
+            history.write_sync(generated[i:i + BATCH_SIZE])
+        elapsed = time.perf_counter() - start
+        print(f"wrote {count} plays in batches of {BATCH_SIZE}: {elapsed:.1f}s, {count / elapsed:.0f} plays/s, "
+              f"{os.path.getsize(os.path.join(directory, 'history.db')) / 2 ** 20:.0f}MiB")
+
+        for name, call in (
+                ("top tracks, week", lambda: history.top_tracks_sync(1, 7)),
+                ("top tracks, month", lambda: history.top_tracks_sync(1, 30)),
+                ("top tracks, all time", lambda: history.top_tracks_sync(1, None)),
+                ("top requesters, month", lambda: history.top_requesters_sync(1, 30)),
+                ("top requesters, all time", lambda: history.top_requesters_sync(1, None)),
+                ("listening time, all time", lambda: history.listening_time_sync(1, None)),
+                (f"autoplay seeds, {SEED_DAYS} days", lambda: history.seeds_sync(1, 3)),
+        ):
+            print(f"  {name:<26} {timed(call) * 1000:7.2f}ms")
+        history.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else PLAYS)
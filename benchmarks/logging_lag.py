@@ -0,0 +1,86 @@
+"""Event loop lag under a synthetic flood of debug log records, synchronous file handler vs the queued pipeline
+
+usage: python -m benchmarks.logging_lag [records]
+"""
+import sys
+import atexit
+import time
+import asyncio
+import logging
+import tempfile
+import statistics
+from logging.handlers import TimedRotatingFileHandler
+
+from setup_logging import setup_logging
+
+PROBE_INTERVAL = 0.005
+BURST = 200
+
+
+async def probe(lags: list[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+
+async def flood(records: int, logger_name: str) -> None:
+    logger = logging.getLogger(logger_name)
+    for i in range(records):
+        logger.debug("synthetic gateway event %s with payload %r", i, {"op": 0, "s": i, "t": "MESSAGE_CREATE"})
+        if i % BURST == 0:
+            await asyncio.sleep(0)
+
+
+async def measure(records: int, logger_name: str = "bench.flood") -> tuple[float, list[float]]:
+    lags: list[float] = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(lags, stop))
+
+    start = time.perf_counter()
+    await flood(records, logger_name)
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await probe_task
+    return elapsed, lags
+
+
+def reset_root() -> None:
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+
+
+def report(name: str, elapsed: float, lags: list[float]) -> None:
+    lags_ms = sorted(lag * 1000 for lag in lags) or [0.0]
+    print(
+        f"{name:<8} flood {elapsed * 1000:8.1f}ms | "
+        f"lag mean {statistics.fmean(lags_ms):6.2f}ms "
+        f"p99 {lags_ms[int(len(lags_ms) * 0.99)]:6.2f}ms "
+        f"max {lags_ms[-1]:6.2f}ms"
+    )
+
+
+def main(records: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        # what setup_logging used to do, file io on the event loop thread
+        handler = TimedRotatingFileHandler(f"{directory}/direct.log", when="midnight", encoding="utf-8")
+        handler.setFormatter(logging.Formatter('[{asctime}] [{levelname:<8}] {name}: {message}', style='{'))
+        logging.getLogger().addHandler(handler)
+        logging.getLogger().setLevel(logging.DEBUG)
+        report("direct", *asyncio.run(measure(records)))
+        reset_root()
+
+        listener = setup_logging(log_directory=directory, filename="queued.log", queue_size=records)
+        report("queued", *asyncio.run(measure(records)))
+        # same flood through a rate limited logger, what discord.gateway debug spam goes through
+        report("limited", *asyncio.run(measure(records, "discord.gateway")))
+        atexit.unregister(listener.stop)
+        listener.stop()
+        reset_root()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
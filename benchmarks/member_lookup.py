@@ -0,0 +1,123 @@
+"""Looking members up by name, the stock converter vs the member index, with the bot's own member cache flags
+
+Only members in voice are cached, so both ask the gateway once per lookup, the stock converter by name and the index by
+the id it found. The fake gateway here answers instantly, the times leave out that round trip. Discord only matches
+usernames and nicknames, so the stock converter can't find members by their global name, the index can.
+
+usage: python -m benchmarks.member_lookup [sizes ...]
+"""
+import sys
+import random
+import asyncio
+import timeit
+from types import SimpleNamespace
+from collections import Counter
+
+from discord import Member
+from discord.ext import commands
+from discord.ext.commands import MemberConverter, MemberNotFound
+
+from bot import EXTENSIONS_TO_LOAD, LAZY_EXTENSIONS
+from intents import resolve_intents, resolve_member_cache_flags
+from member_index import MemberIndex, IndexedMember
+from benchmarks.fake_discord import BOT_USER_ID, snowflake, member_payload, guild_payload, channel_payload
+
+SIZES = (1000, 10000, 50000)
+LOOKUPS = 200
+
+
+def named_member(user_id: int) -> dict:
+    data = member_payload(user_id)
+    data["user"]["global_name"] = f"Display {user_id}"
+    data["nick"] = f"nick{user_id}" if user_id % 3 == 0 else None
+    return data
+
+
+def best(call, number: int) -> float:
+    return min(timeit.repeat(call, repeat=5, number=number)) / number
+
+
+def fake_gateway(bot: commands.Bot, members: list[Member]) -> Counter:
+    """Answer member queries and chunk requests from the members, like discord would minus the round trip
+
+    Queries are answered from dicts of ids and whole usernames and nicknames, so the numbers are the converters' own
+    work. Discord matches name prefixes, the converters are only given whole names so the results are the same.
+    Returns the count of queries answered.
+    """
+    by_id = {member.id: member for member in members}
+    named: dict[str, list[Member]] = {}
+    for member in members:
+        for name in {member.name, member.nick} - {None}:
+            named.setdefault(name.casefold(), []).append(member)
+    queries = Counter()
+
+    async def query_members(guild, query, limit, user_ids, cache, presences) -> list[Member]:
+        queries["gateway"] += 1
+        if user_ids:
+            return [by_id[user_id] for user_id in user_ids if user_id in by_id]
+        return named.get(query.casefold(), [])[:limit]
+
+    async def chunk_guild(guild, *, wait=True, cache=None) -> list[Member]:
+        return members
+
+    bot._connection.query_members = query_members
+    bot._connection.chunk_guild = chunk_guild
+    bot._get_websocket = lambda *_, **__: SimpleNamespace(is_ratelimited=lambda: False)
+    return queries
+
+
+def main(sizes: list[int]) -> None:
+    intents = resolve_intents((*EXTENSIONS_TO_LOAD, *LAZY_EXTENSIONS))
+    bot = commands.Bot(command_prefix="!", intents=intents, member_cache_flags=resolve_member_cache_flags(intents),
+                       chunk_guilds_at_startup=False)
+    bot.member_index = MemberIndex(bot)
+    loop = asyncio.new_event_loop()
+    random.seed(0)
+
+    for size in sizes:
+        guild_id = snowflake()
+        members = [named_member(snowflake()) for _ in range(size)]
+        guild = bot._connection._add_guild_from_data(guild_payload(
+            guild_id, owner_id=BOT_USER_ID, channels=[channel_payload(snowflake(), guild_id)], members=members
+        ))
+        ctx = SimpleNamespace(bot=bot, guild=guild, message=SimpleNamespace(mentions=[]),
+                              current_parameter=SimpleNamespace(converter=IndexedMember))
+        # usernames, global names and nicknames, spread over the member list
+        names = [random.choice([data["user"]["username"], data["user"]["global_name"], data["nick"]] if data["nick"]
+                               else [data["user"]["username"], data["user"]["global_name"]])
+                 for data in random.sample(members, LOOKUPS)]
+
+        async def lookup_all(converter) -> int:
+            found = 0
+            for name in names:
+                try:
+                    await converter.convert(ctx, name)
+                    found += 1
+                except MemberNotFound:
+                    pass
+            return found
+
+        queries = fake_gateway(bot, [Member(data=data, guild=guild, state=bot._connection) for data in members])
+
+        async def build_index() -> None:
+            bot.member_index._guilds.pop(guild.id, None)
+            bot.member_index.get(guild)
+            await bot.member_index._building[guild.id]
+
+        build = best(lambda: loop.run_until_complete(build_index()), 1)
+        assert bot.member_index.get(guild).complete and not guild.chunked  # none of the members are cached
+        results = []
+        for converter in (MemberConverter, IndexedMember):
+            queries.clear()
+            found = loop.run_until_complete(lookup_all(converter()))
+            results.append((found, queries["gateway"] / LOOKUPS,
+                            best(lambda: loop.run_until_complete(lookup_all(converter())), 1) / LOOKUPS))
+        print(f"{size:>6} members, index built in {build * 1e3:.1f}ms | " + " | ".join(
+            f"{name} {elapsed * 1e6:5.1f}us, {found}/{LOOKUPS} found, {per_lookup:.1f} gateway queries each"
+            for name, (found, per_lookup, elapsed) in zip(("stock", "indexed"), results)))
+        bot._connection._remove_guild(guild)
+    loop.close()
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or [*SIZES])
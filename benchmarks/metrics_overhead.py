@@ -0,0 +1,29 @@
+"""Per command overhead of the metrics hooks, fails if it goes over the budget
+
+usage: python -m benchmarks.metrics_overhead [iterations]
+"""
+import sys
+import time
+
+from metrics import Metrics
+
+COMMAND_OVERHEAD_BUDGET = 10e-6  # in seconds, per command invocation
+COMMAND_NAMES = ("play", "skip", "queue", "bonk", "owo", "walcc", "replybot blacklist")
+
+
+def main(iterations: int) -> None:
+    metrics = Metrics()
+    start = time.perf_counter()
+    for i in range(iterations):
+        name = COMMAND_NAMES[i % len(COMMAND_NAMES)]
+        started = metrics.command_started(name)
+        metrics.command_finished(name, started)
+    per_command = (time.perf_counter() - start) / iterations
+
+    print(f"metrics overhead {per_command * 1e6:.2f}us per command (budget {COMMAND_OVERHEAD_BUDGET * 1e6:.0f}us)")
+    if per_command > COMMAND_OVERHEAD_BUDGET:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,202 @@
+"""Micro benchmarks of the pure helpers on the message and render hot paths, no discord connection or network needed
+
+usage: python -m benchmarks.micro [case ...] [--save] [--compare] [--baseline path] [--tolerance 0.25]
+
+--save writes the results into the baseline file, --compare fails if any case got slower than its baseline by more
+than the tolerance. Baselines only mean something on the machine they were taken on.
+Cases whose imports are missing (numpy and scipy for the game cog) are skipped.
+"""
+import sys
+import json
+import random
+import timeit
+import argparse
+import platform
+from pathlib import Path
+from typing import Callable
+
+DEFAULT_BASELINE = Path(__file__).with_name("micro_baseline.json")
+DEFAULT_TOLERANCE = 0.25  # slower than the baseline by more than this share is a regression
+REPEAT = 5
+WORDS = ("furret", "walk", "music", "play", "the", "a", "bonk", "lol", "owo", "qotd", "hi", "really", "hello.")
+
+Setup = Callable[[int], Callable[[], object]]  # builds the call to time for an input size
+CASES: dict[str, tuple[Setup, tuple[int, ...]]] = {}
+
+
+def case(name: str, *sizes: int):
+    def register(setup: Setup) -> Setup:
+        CASES[name] = (setup, sizes)
+        return setup
+    return register
+
+
+def text(length: int) -> str:
+    words = []
+    while sum(map(len, words)) + len(words) < length:
+        words.append(random.choice(WORDS))
+    return " ".join(words)[:length]
+
+
+@case("tm.from_millis", 59_000, 3_599_000, 86_400_000)  # sizes are durations in ms, minutes up to a day long
+def from_millis(ms: int):
+    from cogs.music.utils import tm
+    return lambda: tm.from_millis(ms)
+
+
+@case("tm.to_timestamp", 59_000, 3_599_000, 86_400_000)
+def to_timestamp(ms: int):
+    from cogs.music.utils import tm
+    duration = tm.from_millis(ms)
+    return lambda: duration.to_timestamp()
+
+
+@case("QueueEmbed.generate_row", 10, 100, 500)  # title length
+def generate_row(length: int):
+    from wavelink import Playable
+    from cogs.music.embed import QueueEmbed
+    song = Playable({
+        "encoded": "track",
+        "info": {"identifier": "id", "isSeekable": True, "author": "artist", "length": 213000, "isStream": False,
+                 "position": 0, "title": text(length), "uri": "https://youtu.be/id", "artworkUrl": None,
+                 "isrc": None, "sourceName": "youtube"},
+        "pluginInfo": {},
+        "userData": {},
+    })
+    return lambda: QueueEmbed.generate_row(song)
+
+
+@case("trim_string_keep_words", 100, 1000, 10000)  # message length, trimmed to a thread name
+def trim_string_keep_words(length: int):
+    from cogs.qotd import trim_string_keep_words, THREAD_NAME_LENGTH_LIMIT
+    content = text(length)
+    return lambda: trim_string_keep_words(content, THREAD_NAME_LENGTH_LIMIT - 3)
+
+
+@case("is_qotd", 10, 200, 2000)  # message length, chatter that isn't a QOTD like most messages
+def is_qotd(length: int):
+    from cogs.qotd import is_qotd
+    content = text(length)
+    return lambda: is_qotd(content)
+
+
+@case("time_format_to_timedelta", 1, 4, 9)  # digits in the duration
+def time_format_to_timedelta(digits: int):
+    from cogs.admin import time_format_to_timedelta
+    time_format = "9" * digits + "h"
+    return lambda: time_format_to_timedelta(time_format)
+
+
+@case("translate_board_on_dict", 10, 50, 200)  # board side
+def translate_board_on_dict(side: int):
+    import numpy as np
+    from cogs.game import translate_board_on_dict
+    np.random.seed(0)
+    board = np.random.randint(-1, 9, (side, side), dtype=np.int8)
+    dictionary = {i: f"<:{i}_:892802357954506872>" for i in range(-1, 9)}
+    return lambda: translate_board_on_dict(board, dictionary)
+
+
+@case("Minesweeper", 10, 50, 200)  # board side, 20% mines
+def minesweeper(side: int):
+    import numpy as np
+    from cogs.game.minesweeper import Minesweeper
+    np.random.seed(0)
+    return lambda: Minesweeper(side, side, mines=0.2, starting_tile=(side // 2, side // 2))
+
+
+@case("owo", 100, 2000, 10000)  # message length
+def owo(length: int):
+    from cogs.fun import owo_translate
+    content = text(length)
+    return lambda: owo_translate(content)
+
+
+def measure(call: Callable[[], object]) -> float:
+    """Best of REPEAT runs in seconds per call, each run long enough to time reliably"""
+    timer = timeit.Timer(call)
+    number, _ = timer.autorange()
+    return min(timer.repeat(REPEAT, number)) / number
+
+
+def run(names: list[str]) -> dict[str, float]:
+    results = {}
+    for name in names:
+        setup, sizes = CASES[name]
+        for size in sizes:
+            random.seed(0)
+            try:
+                call = setup(size)
+            except ImportError as e:
+                print(f"{name:<28} skipped, {e}")
+                break
+            key = f"{name}[{size}]"
+            results[key] = measure(call)
+            print(f"{key:<36} {results[key] * 1e6:>12.3f}us")
+    return results
+
+
+def load(path: Path) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(path: Path, results: dict[str, float]) -> None:
+    """Merge the results into the baseline, cases that weren't run keep their old numbers"""
+    baseline = load(path) if path.exists() else {"results": {}}
+    baseline.update(python=platform.python_version(), machine=platform.platform())
+    baseline["results"].update(results)
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"saved {len(results)} results to {path}")
+
+
+def compare(path: Path, results: dict[str, float], tolerance: float) -> list[str]:
+    """Print every result against its baseline, returns the keys that regressed"""
+    baseline = load(path)
+    if baseline.get("machine") != platform.platform() or baseline.get("python") != platform.python_version():
+        print(f"baseline was taken on {baseline.get('machine')} python {baseline.get('python')}, "
+              f"numbers may not be comparable")
+
+    regressions = []
+    for key, seconds in results.items():
+        before = baseline["results"].get(key)
+        if before is None:
+            print(f"{key:<36} new, no baseline")
+            continue
+        change = seconds / before - 1
+        regressed = change > tolerance
+        if regressed:
+            regressions.append(key)
+        print(f"{key:<36} {before * 1e6:>12.3f}us -> {seconds * 1e6:>12.3f}us {change:>+8.1%}"
+              f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Micro benchmarks of the pure hot path helpers")
+    parser.add_argument("cases", nargs="*", help=f"any of {', '.join(CASES)}, all of them by default")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="baseline file to save or compare to")
+    parser.add_argument("--save", action="store_true", help="write the results into the baseline")
+    parser.add_argument("--compare", action="store_true", help="fail on regressions against the baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help=f"allowed slowdown as a share of the baseline, {DEFAULT_TOLERANCE} by default")
+    args = parser.parse_args()
+    if unknown := set(args.cases) - set(CASES):
+        parser.error(f"unknown cases {', '.join(sorted(unknown))}")
+    if args.compare and not args.baseline.exists():
+        parser.error(f"no baseline at {args.baseline}, take one with --save first")
+
+    results = run(args.cases or [*CASES])
+    if args.compare:
+        regressions = compare(args.baseline, results, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions over {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+    if args.save:
+        save(args.baseline, results)
+
+
+if __name__ == "__main__":
+    main()
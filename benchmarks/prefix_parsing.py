@@ -0,0 +1,69 @@
+"""Message handling cost of prefix command parsing, every guild parsed vs only the guilds that opted in
+
+usage: python -m benchmarks.prefix_parsing [messages]
+"""
+import sys
+import time
+import random
+import asyncio
+import tempfile
+from types import SimpleNamespace
+
+from discord import Intents
+
+from bot import Furret, resolve_prefix
+from store import SharedStore
+
+GUILDS = 1000
+OPTED_IN = 0.05  # share of guilds that turned prefix commands on
+WORDS = ("furret", "walk", "music", "play", "the", "a", "bonk", "lol", "owo", "qotd", "hi")
+
+
+def make_messages(n: int) -> list[SimpleNamespace]:
+    author = SimpleNamespace(id=1, bot=False)
+    guilds = [SimpleNamespace(id=guild_id << 22) for guild_id in range(1, GUILDS + 1)]
+    return [
+        SimpleNamespace(
+            # chatter, none of it starts with the prefix
+            content=" ".join((random.choice(WORDS[1:]), *random.choices(WORDS, k=random.randint(0, 19)))),
+            author=author,
+            guild=random.choice(guilds),
+            _state=None
+        )
+        for _ in range(n)
+    ]
+
+
+async def handle(bot: Furret, messages: list[SimpleNamespace]) -> float:
+    start = time.process_time()
+    for message in messages:
+        await bot.on_message(message)
+    return (time.process_time() - start) / len(messages)
+
+
+async def run(messages: int) -> None:
+    random.seed(0)
+    contents = make_messages(messages)
+
+    with tempfile.TemporaryDirectory() as directory:
+        bot = Furret(command_prefix=resolve_prefix, intents=Intents.none(), store=SharedStore(f"{directory}/bench.db"))
+        bot._connection.user = SimpleNamespace(id=0)  # never logs in
+        for guild_id in random.sample(range(1, GUILDS + 1), int(GUILDS * OPTED_IN)):
+            bot.guild_settings.update(guild_id << 22, prefix_commands=True)
+
+        bot.prefix_commands_default = True
+        everywhere = await handle(bot, contents)
+        bot.prefix_commands_default = False
+        opt_in = await handle(bot, contents)
+        bot.store.close()
+
+    print(f"every guild {everywhere * 1e6:.2f}us | opt-in ({OPTED_IN:.0%} of guilds) {opt_in * 1e6:.2f}us "
+          f"CPU per message, {1 - opt_in / everywhere:.0%} less")
+
+
+def main(messages: int) -> None:
+    asyncio.run(run(messages))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,497 @@
+"""End to end throughput of an offline Furret, gateway events replayed at full speed and REST calls answered in process
+
+Reports events per second, the time spent in every listener, REST calls made and memory for each workload.
+Outbound pacing is turned off, it's discord's rate limits and not the bot's own cost.
+
+usage: python -m benchmarks.replay [workload ...] [--events N] [--file recorded.jsonl] [--all-intents]
+workloads: chatty, qotd, bonks, pagination, large_guild, all of them by default
+
+--all-intents runs the bot as it was before its intents were derived from the extensions, every intent on, every
+member cached and guilds chunked at startup. Run large_guild alone with and without it to compare peak RSS.
+
+A recorded file has one gateway dispatch per line as {"t": "MESSAGE_CREATE", "d": {...}},
+with the GUILD_CREATE of every guild the other events refer to before them.
+Runs on the event loop EVENT_LOOP and EAGER_TASKS pick, like the bot.
+"""
+import gc
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import tempfile
+import weakref
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from types import SimpleNamespace
+from typing import Awaitable, Callable, Optional
+
+from discord import ClientUser, Intents, MemberCacheFlags
+from wavelink import Playable, Queue
+
+from bot import Furret, create_bot
+from event_loop import resolve_loop_config
+from store import SharedStore
+from dispatcher import Dispatcher
+from cogs.music import Music
+from benchmarks.fake_discord import FakeHTTP, BOT_USER_ID, VOICE_CHANNEL, snowflake, user_payload, member_payload, \
+    channel_payload, role_payload, guild_payload, voice_state_payload, message_payload, reaction_payload, \
+    presence_payload, typing_payload, members_chunk_payload
+
+EXTENSIONS = ("cogs.admin", "cogs.fun", "cogs.qotd")  # music is added as OfflineMusic, it can't reach lavalink
+IDLE_ROUNDS = 10  # loop iterations without progress before a workload counts as done
+TOP_LISTENERS = 10
+WORDS = ("furret", "walk", "music", "play", "the", "a", "bonk", "lol", "owo", "hi", "sinned", "father", "please")
+LEFT = '⬅️'
+RIGHT = '➡️'
+LARGE_GUILD_MEMBERS = 25000
+LARGE_GUILD_VOICE = 200  # members in voice, the only ones cached
+LARGE_GUILD_ROLE = 50  # members of the role that gets bonked
+CHUNK_SIZE = 1000  # members per GUILD_MEMBERS_CHUNK, like discord
+# what a large guild sends over the gateway, with the intent it needs and how often it comes relative to the others
+LARGE_GUILD_TRAFFIC = {
+    "PRESENCE_UPDATE": ("presences", 60),
+    "TYPING_START": ("guild_typing", 15),
+    "MESSAGE_CREATE": ("guild_messages", 10),
+    "GUILD_MEMBER_UPDATE": ("members", 5),
+    "VOICE_STATE_UPDATE": ("voice_states", 5),
+    "MESSAGE_REACTION_ADD": ("guild_reactions", 5),
+}
+
+# the listener a callback ultimately runs for, tasks created by listeners inherit it
+LISTENER: ContextVar[Optional[str]] = ContextVar("listener", default=None)
+
+
+class ReplayFurret(Furret):
+    """Furret tagging every listener it runs, and keeping their tasks"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.listener_time: Counter[str] = Counter()
+        self.listener_calls: Counter[str] = Counter()
+        self.listener_tasks: weakref.WeakSet[asyncio.Task] = weakref.WeakSet()
+        self.progress: int = 0  # listeners finished
+
+    def _schedule_event(self, coro, event_name, *args, **kwargs) -> asyncio.Task:
+        name = f"{event_name} {coro.__qualname__}"
+        self.listener_calls[name] += 1
+        token = LISTENER.set(name)  # copied into the task's context
+        try:
+            task = super()._schedule_event(coro, event_name, *args, **kwargs)
+        finally:
+            LISTENER.reset(token)
+        self.listener_tasks.add(task)
+        return task
+
+    async def _run_event(self, coro, event_name, *args, **kwargs) -> None:
+        try:
+            await super()._run_event(coro, event_name, *args, **kwargs)
+        finally:
+            self.progress += 1
+
+
+@contextmanager
+def time_listeners(listener_time: Counter[str]):
+    """Add the time of every event loop callback to the listener it runs for, like the slow callback detector
+    wall time would also count whatever ran while a listener was waiting"""
+    run = asyncio.Handle._run
+
+    def timed_run(handle: asyncio.Handle) -> None:
+        start = time.perf_counter()
+        try:
+            run(handle)
+        finally:
+            if handle._context is not None and (listener := handle._context.get(LISTENER)) is not None:
+                listener_time[listener] += time.perf_counter() - start
+
+    asyncio.Handle._run = timed_run
+    try:
+        yield
+    finally:
+        asyncio.Handle._run = run
+
+
+class AllIntentsFurret(ReplayFurret):
+    """Furret configured like before its intents were derived from the extensions"""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.update(intents=Intents.all(), member_cache_flags=MemberCacheFlags.all(), chunk_guilds_at_startup=True)
+        super().__init__(*args, **kwargs)
+
+
+class OfflineMusic(Music):
+    async def cog_load(self) -> None:
+        pass  # no lavalink, players are stand-ins holding a queue
+
+
+class Replayer:
+    def __init__(self, bot: ReplayFurret, http: FakeHTTP):
+        self.bot: ReplayFurret = bot
+        self.http: FakeHTTP = http
+        self.events: int = 0
+        self.notes: list[str] = []  # reported after the workload
+
+    def feed(self, kind: str, data: dict) -> None:
+        self.events += 1
+        if kind == "GUILD_CREATE":
+            self.http.add_guild(data)
+            guild = self.bot._connection._add_guild_from_data(data)
+            self.bot.dispatch("guild_available", guild)
+        else:
+            self.bot._connection.parsers[kind](data)
+
+    def echo(self) -> bool:
+        """Feed the messages the bot created back as MESSAGE_CREATE, like the gateway would"""
+        echoed = bool(self.http.echoes)
+        while self.http.echoes:
+            self.feed("MESSAGE_CREATE", self.http.echoes.pop(0))
+        return echoed
+
+    async def step(self) -> None:
+        """Let the loop run once, as the gateway reader would between events"""
+        await asyncio.sleep(0)
+        self.echo()
+
+    async def settle(self) -> None:
+        """Run the loop until nothing makes progress anymore, timers like bonk loops or unpin tasks aside"""
+        idle = 0
+        while idle < IDLE_ROUNDS:
+            before = (self.bot.progress, self.http.requests.total())
+            await asyncio.sleep(0)
+            idle = 0 if self.echo() or (self.bot.progress, self.http.requests.total()) != before else idle + 1
+
+
+def chatter() -> str:
+    return " ".join((random.choice(WORDS[1:]), *random.choices(WORDS, k=random.randint(0, 19))))  # never a command
+
+
+def text_guild(members: int, text_channels: int) -> tuple[dict, list[int], list[int]]:
+    """Guild payload with only the bot cached, like guilds without anyone in voice. Returns it with its channel and
+    member ids"""
+    guild_id = snowflake()
+    channel_ids = [snowflake() for _ in range(text_channels)]
+    member_ids = [snowflake() for _ in range(members)]
+    data = guild_payload(
+        guild_id,
+        owner_id=member_ids[0],
+        channels=[channel_payload(c, guild_id, position=i) for i, c in enumerate(channel_ids)],
+        members=[member_payload(BOT_USER_ID, bot=True)]
+    )
+    return data, channel_ids, member_ids
+
+
+async def chatty(replayer: Replayer, events: int) -> None:
+    """Busy guilds chatting, with the replybot replying more than usual, half of them with the markov replybot"""
+    guilds = [text_guild(members=50, text_channels=5) for _ in range(20)]
+    for i, (data, _, _) in enumerate(guilds):
+        replayer.feed("GUILD_CREATE", data)
+        replayer.bot.guild_settings.update(int(data["id"]), reply_rate=0.05, replybot_mode=("echo", "markov")[i % 2])
+
+    for _ in range(events):
+        data, channel_ids, member_ids = random.choice(guilds)
+        replayer.feed("MESSAGE_CREATE", message_payload(
+            snowflake(), random.choice(channel_ids), int(data["id"]), random.choice(member_ids), chatter()))
+        await replayer.step()
+
+
+async def qotd(replayer: Replayer, events: int) -> None:
+    """A guild with a QOTD channel, every 20th message in it is a QOTD getting a thread and pinned"""
+    data, channel_ids, member_ids = text_guild(members=200, text_channels=3)
+    replayer.feed("GUILD_CREATE", data)
+    replayer.bot.guild_settings.update(int(data["id"]), qotd_channel_ids=(channel_ids[0],))
+
+    for i in range(events):
+        content = f"QOTD: {chatter()}?" if i % 20 == 0 else chatter()
+        replayer.feed("MESSAGE_CREATE", message_payload(
+            snowflake(), channel_ids[0] if i % 2 == 0 else random.choice(channel_ids), int(data["id"]),
+            random.choice(member_ids), content))
+        await replayer.step()
+
+
+async def bonks(replayer: Replayer, events: int) -> None:
+    """A full voice guild where a role gets mass bonked, then everyone keeps hopping between voice channels"""
+    guild_id, role_id, afk_channel_id = snowflake(), snowflake(), snowflake()
+    text_channel_id = snowflake()
+    voice_channel_ids = [snowflake() for _ in range(5)]
+    member_ids = [snowflake() for _ in range(200)]
+    replayer.feed("GUILD_CREATE", guild_payload(
+        guild_id,
+        owner_id=member_ids[0],
+        channels=[
+            channel_payload(text_channel_id, guild_id),
+            channel_payload(afk_channel_id, guild_id, VOICE_CHANNEL),
+            *(channel_payload(c, guild_id, VOICE_CHANNEL, position=i) for i, c in enumerate(voice_channel_ids, 1)),
+        ],
+        members=[member_payload(BOT_USER_ID, bot=True), *(member_payload(m, (role_id,)) for m in member_ids)],
+        roles=[role_payload(role_id)],
+        voice_states=[voice_state_payload(guild_id, random.choice(voice_channel_ids), m) for m in member_ids],
+        afk_channel_id=afk_channel_id
+    ))
+
+    replayer.feed("MESSAGE_CREATE", message_payload(
+        snowflake(), text_channel_id, guild_id, member_ids[0], f"furret bonk <@&{role_id}> 10m"))
+    await replayer.settle()
+    for i in range(events - 1):
+        if i % 100 == 0:
+            replayer.feed("MESSAGE_CREATE", message_payload(
+                snowflake(), text_channel_id, guild_id, member_ids[0], "furret bonk list"))
+        else:
+            replayer.feed("VOICE_STATE_UPDATE", voice_state_payload(
+                guild_id, random.choice(voice_channel_ids), random.choice(member_ids)))
+        await replayer.step()
+
+
+def track_payload(i: int) -> dict:
+    return {
+        "encoded": f"track{i}",
+        "info": {"identifier": f"id{i}", "isSeekable": True, "author": f"artist {i}", "length": 180000 + i * 1000,
+                 "isStream": False, "position": 0, "title": f"song {i}", "uri": f"https://youtu.be/id{i}",
+                 "artworkUrl": None, "isrc": None, "sourceName": "youtube"},
+        "pluginInfo": {},
+        "userData": {},
+    }
+
+
+async def pagination(replayer: Replayer, events: int) -> None:
+    """Someone flipping through the pages of a long music queue"""
+    data, channel_ids, member_ids = text_guild(members=10, text_channels=1)
+    guild_id, channel_id = int(data["id"]), channel_ids[0]
+    replayer.feed("GUILD_CREATE", data)
+
+    queue = Queue()
+    for i in range(500):
+        queue.put(Playable(track_payload(i)))
+    replayer.bot._connection._add_voice_client(guild_id, SimpleNamespace(queue=queue))
+
+    replayer.feed("MESSAGE_CREATE", message_payload(snowflake(), channel_id, guild_id, member_ids[1], "furret queue"))
+    await replayer.settle()
+    message_id = replayer.http.last_message_ids[channel_id]
+
+    for i in range(events - 1):
+        emoji = RIGHT if (i // 20) % 2 == 0 else LEFT  # flip 20 pages forward, then 20 back
+        replayer.feed("MESSAGE_REACTION_ADD", reaction_payload(guild_id, channel_id, message_id, member_ids[1], emoji))
+        await replayer.settle()  # the command only waits for the next reaction once it's done with the last one
+
+    replayer.bot._connection._remove_voice_client(guild_id)
+
+
+def answer_chunk_requests(replayer: Replayer, members: dict[int, Callable[[], list[dict]]]) -> Counter[int]:
+    """Answer the bot's member requests with GUILD_MEMBERS_CHUNK events, like the gateway would. The members of each
+    guild are made when they're requested, and dropped chunk by chunk. Returns the count of requests per guild id"""
+    requests = Counter()
+
+    async def chunker(guild_id: int, *_, nonce: Optional[str] = None, **__) -> None:
+        requests[guild_id] += 1
+        guild_members = members[guild_id]()
+        count = -(-len(guild_members) // CHUNK_SIZE)
+
+        def send() -> None:
+            for i in range(count):
+                replayer.feed("GUILD_MEMBERS_CHUNK", members_chunk_payload(
+                    guild_id, guild_members[i * CHUNK_SIZE:(i + 1) * CHUNK_SIZE], i, count, nonce))
+
+        asyncio.get_running_loop().call_soon(send)
+
+    replayer.bot._connection.chunker = chunker
+    return requests
+
+
+def resident_set_size() -> int:
+    """In bytes, unlike the peak it goes down again"""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+async def large_guild(replayer: Replayer, events: int) -> None:
+    """A large guild sending everything a large guild does, minus what the bot's intents don't subscribe to, like
+    discord. Halfway through a role gets bonked twice, its members aren't cached so they're chunked if they aren't
+    already. RSS is taken right before, with only what the bot keeps around, and at the end"""
+    bot = replayer.bot
+    guild_id, role_id, afk_channel_id, text_channel_id = snowflake(), snowflake(), snowflake(), snowflake()
+    voice_channel_ids = [snowflake() for _ in range(5)]
+    member_ids = [snowflake() for _ in range(LARGE_GUILD_MEMBERS)]
+    role_member_ids = set(member_ids[-LARGE_GUILD_ROLE:])
+    in_voice = member_ids[:LARGE_GUILD_VOICE]
+
+    def members(ids: list[int]) -> list[dict]:
+        return [member_payload(m, (role_id,) if m in role_member_ids else ()) for m in ids]
+
+    data = guild_payload(
+        guild_id,
+        owner_id=member_ids[0],
+        channels=[
+            channel_payload(text_channel_id, guild_id),
+            channel_payload(afk_channel_id, guild_id, VOICE_CHANNEL),
+            *(channel_payload(c, guild_id, VOICE_CHANNEL, position=i) for i, c in enumerate(voice_channel_ids, 1)),
+        ],
+        # large guilds come with the members in voice, the others have to be chunked
+        members=[member_payload(BOT_USER_ID, bot=True), *members(in_voice)],
+        roles=[role_payload(role_id)],
+        voice_states=[voice_state_payload(guild_id, random.choice(voice_channel_ids), m) for m in in_voice],
+        afk_channel_id=afk_channel_id
+    )
+    data.update(member_count=LARGE_GUILD_MEMBERS + 1, large=True)
+    chunk_requests = answer_chunk_requests(
+        replayer, {guild_id: lambda: [member_payload(BOT_USER_ID, bot=True), *members(member_ids)]})
+
+    replayer.feed("GUILD_CREATE", data)
+    guild = bot.get_guild(guild_id)
+    if bot._connection._guild_needs_chunking(guild):  # at startup, the guild isn't ready before it's chunked
+        await bot._connection.chunk_guild(guild)
+
+    subscribed = [kind for kind, (intent, _) in LARGE_GUILD_TRAFFIC.items() if getattr(bot.intents, intent)]
+    kinds = random.choices([*LARGE_GUILD_TRAFFIC], [weight for _, weight in LARGE_GUILD_TRAFFIC.values()], k=events)
+    received, rss_before = 0, 0
+    for i, kind in enumerate(kinds):
+        if i in (events // 2, events // 2 + 1):
+            if not rss_before:
+                gc.collect()
+                rss_before = resident_set_size()
+            replayer.feed("MESSAGE_CREATE", message_payload(
+                snowflake(), text_channel_id, guild_id, member_ids[0], f"furret bonk <@&{role_id}> 10m"))
+            await replayer.settle()
+            continue
+        if kind not in subscribed:
+            continue
+        received += 1
+        member_id = random.choice(member_ids)
+        match kind:
+            case "PRESENCE_UPDATE":
+                payload = presence_payload(guild_id, member_id, random.choice(("online", "idle", "dnd")))
+            case "TYPING_START":
+                payload = typing_payload(guild_id, text_channel_id, member_id)
+            case "MESSAGE_CREATE":
+                payload = message_payload(snowflake(), text_channel_id, guild_id, member_id, chatter())
+            case "GUILD_MEMBER_UPDATE":
+                payload = {**member_payload(member_id), "guild_id": str(guild_id), "nick": f"nick{random.random()}"}
+            case "VOICE_STATE_UPDATE":
+                payload = voice_state_payload(guild_id, random.choice(voice_channel_ids), random.choice(in_voice))
+            case _:
+                payload = reaction_payload(guild_id, text_channel_id, snowflake(), member_id, RIGHT)
+        replayer.feed(kind, payload)
+        await replayer.step()
+
+    gc.collect()
+    replayer.notes.append(f"{received} of {len(kinds) - 2} gateway events subscribed to, "
+                          f"{chunk_requests[guild_id]} member chunk requests, {len(guild.members)} of "
+                          f"{guild.member_count} members cached, RSS {rss_before / 2 ** 20:.1f}MiB before the bonks and "
+                          f"{resident_set_size() / 2 ** 20:.1f}MiB after")
+    bot._connection._remove_guild(guild)
+    await bot.member_index.on_guild_remove(guild)
+
+
+WORKLOADS: dict[str, Callable[[Replayer, int], Awaitable[None]]] = {
+    "chatty": chatty,
+    "qotd": qotd,
+    "bonks": bonks,
+    "pagination": pagination,
+    "large_guild": large_guild,  # last, its peak RSS would hide the others'
+}
+
+
+def recorded(path: str) -> Callable[[Replayer, int], Awaitable[None]]:
+    async def replay_file(replayer: Replayer, events: int) -> None:
+        with open(path) as f:
+            for line, _ in zip(f, range(events)):
+                dispatch = json.loads(line)
+                replayer.feed(dispatch["t"], dispatch["d"])
+                await replayer.step()
+
+    return replay_file
+
+
+def stop_timers(bot: ReplayFurret) -> None:
+    """Cancel what workloads leave running, commands waiting on reactions, bonk loops and unpin tasks"""
+    for task in list(bot.listener_tasks):
+        task.cancel()
+    if admin := bot.get_cog("Admin"):
+        admin.export_state()
+        admin.bonked.clear()
+    if question_of_the_day := bot.get_cog("QuestionOfTheDay"):
+        question_of_the_day.pinned_qotd.export()
+
+
+def report(name: str, replayer: Replayer, elapsed: float) -> None:
+    bot = replayer.bot
+    usage = bot.memory.totals(bot.memory.usage())
+    accounted = sum(size for _, size in usage.values())
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on linux
+
+    listeners = sum(bot.listener_time.values())
+
+    print(f"{name}: {replayer.events} events in {elapsed:.2f}s, {replayer.events / elapsed:.0f} events/s | "
+          f"peak RSS {peak_rss:.1f}MiB, accounted {accounted / 1024:.1f}KiB")
+    print(f"  listeners {listeners * 1000:.1f}ms, gateway parsing and the rest {(elapsed - listeners) * 1000:.1f}ms")
+    for note in replayer.notes:
+        print(f"  {note}")
+    print("  REST " + ", ".join(f"{route} {count}" for route, count in replayer.http.requests.most_common()))
+    for listener, total in bot.listener_time.most_common(TOP_LISTENERS):
+        calls = bot.listener_calls[listener]
+        print(f"  {listener} - {calls} calls / {total * 1000:.1f}ms / {total / calls * 1e6:.1f}us each")
+
+
+async def run(workloads: list[str], events: int, path: str = None,
+              all_intents: bool = False) -> dict[str, tuple[int, float]]:
+    """Events replayed and seconds taken by each workload"""
+    random.seed(0)
+    os.environ["METRICS_PORT"] = "0"
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        http = FakeHTTP()
+        bot = create_bot(cls=AllIntentsFurret if all_intents else ReplayFurret, store=SharedStore(f"{directory}/replay.db"))
+        async with bot:
+            http.install(bot)
+            bot._connection.user = ClientUser(state=bot._connection, data=user_payload(BOT_USER_ID, bot=True))
+            bot.dispatcher = Dispatcher(rate=1e9, burst=10 ** 9)
+            await bot.start_metrics()
+            for extension in EXTENSIONS:
+                await bot.load_extension(extension)
+            await bot.add_cog(OfflineMusic(bot))
+
+            runs = {name: WORKLOADS[name] for name in workloads}
+            if path:
+                runs[os.path.basename(path)] = recorded(path)
+
+            for name, workload in runs.items():
+                replayer = Replayer(bot, http)
+                bot.listener_time.clear()
+                bot.listener_calls.clear()
+                http.requests.clear()
+
+                with time_listeners(bot.listener_time):
+                    start = time.perf_counter()
+                    await workload(replayer, events)
+                    await replayer.settle()
+                    elapsed = time.perf_counter() - start
+
+                report(name, replayer, elapsed)
+                results[name] = (replayer.events, elapsed)
+                stop_timers(bot)
+                await replayer.settle()
+
+            bot.store.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay gateway events into an offline Furret")
+    parser.add_argument("workloads", nargs="*", help=f"any of {', '.join(WORKLOADS)}, all of them by default")
+    parser.add_argument("--events", type=int, default=5000, help="events per workload")
+    parser.add_argument("--file", help="recorded gateway dispatches to replay as well, one JSON object per line")
+    parser.add_argument("--all-intents", action="store_true",
+                        help="every intent, every member cached and guilds chunked at startup, like before")
+    args = parser.parse_args()
+    if unknown := set(args.workloads) - set(WORKLOADS):
+        parser.error(f"unknown workloads {', '.join(sorted(unknown))}")
+
+    workloads = args.workloads or ([] if args.file else [*WORKLOADS])
+    resolve_loop_config().run(run(workloads, args.events, args.file, args.all_intents))
+
+
+if __name__ == "__main__":
+    main()
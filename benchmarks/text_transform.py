@@ -0,0 +1,51 @@
+"""owo of a long paste, the old per character string building vs the table driven transform
+
+usage: python -m benchmarks.text_transform [sizes ...]
+"""
+import sys
+import random
+import timeit
+
+from cogs.fun import transform
+
+SIZES = (1000, 10000, 100000)
+WORDS = ("hello", "there,", "the", "lord", "rules.", "really", "hmm", "furret", "walk.", "RHYTHM", "Owo")
+
+
+def per_character(msg: str) -> str:
+    """owo as it was before the transform engine"""
+    translated = ""
+    for letter in msg:
+        uwu_faces = [' OwO', ' UwU', ' :3', '']
+        if letter in "lr":
+            translated += "w"
+        elif letter in "LR":
+            translated += "W"
+        elif letter in "h":
+            translated += "hw"
+        elif letter in "H":
+            translated += "Hw"
+        elif letter in ".,":
+            translated += random.choice(uwu_faces) + letter
+        else:
+            translated += letter
+    return translated
+
+
+def best(call, number: int) -> float:
+    return min(timeit.repeat(call, repeat=5, number=number)) / number
+
+
+def main(sizes: list[int]) -> None:
+    random.seed(0)
+    for size in sizes:
+        text = " ".join(random.choices(WORDS, k=size // 5))[:size]
+        number = max(1, 100000 // size)
+        before = best(lambda: per_character(text), number)
+        after = best(lambda: transform.owo(text), number)
+        print(f"{size:>7} chars: per character {before * 1e3:8.3f}ms | table {after * 1e3:8.3f}ms "
+              f"| {before / after:5.1f}x faster")
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or [*SIZES])
@@ -0,0 +1,61 @@
+"""Per message dispatch cost as the number of content triggers grows, first character index vs one re.match per trigger
+
+usage: python -m benchmarks.triggers [messages]
+"""
+import re
+import sys
+import time
+import random
+
+from triggers import TriggerRegistry
+from cogs.fun import SIN_PATTERN, SORRY_DADDY_PATTERN
+from cogs.qotd import QOTD_PATTERN
+
+TRIGGER_COUNTS = (3, 10, 100, 500)
+WORDS = ("furret", "father", "sorry", "walk", "qotd", "music", "play", "the", "a", "bonk", "sinned", "lol", "owo")
+CHANNEL_ID = 1
+
+
+async def handler(_msg):
+    pass
+
+
+def make_patterns(n: int) -> list[tuple[str, int]]:
+    patterns = [(SIN_PATTERN, re.IGNORECASE), (SORRY_DADDY_PATTERN, re.IGNORECASE), (QOTD_PATTERN, re.IGNORECASE)]
+    for i in range(n - len(patterns)):
+        patterns.append((rf"(hey |yo )?{random.choice(WORDS)}{i}\b.+(please|now)", re.IGNORECASE))
+    return patterns[:n]
+
+
+def make_messages(n: int) -> list[str]:
+    return [" ".join(random.choices(WORDS, k=random.randint(1, 20))) for _ in range(n)]
+
+
+def main(messages: int) -> None:
+    random.seed(0)
+    contents = make_messages(messages)
+
+    for count in TRIGGER_COUNTS:
+        patterns = make_patterns(count)
+
+        registry = TriggerRegistry()
+        for i, (pattern, flags) in enumerate(patterns):
+            registry.add(f"t{i}", pattern, handler, flags=flags)
+        registry.match("", CHANNEL_ID)  # compile outside the timing
+
+        start = time.perf_counter()
+        for content in contents:
+            registry.match(content, CHANNEL_ID)
+        indexed = (time.perf_counter() - start) / messages
+
+        compiled = [re.compile(pattern, flags) for pattern, flags in patterns]
+        start = time.perf_counter()
+        for content in contents:
+            [p for p in compiled if p.match(content)]
+        naive = (time.perf_counter() - start) / messages
+
+        print(f"{count:>4} triggers | indexed {indexed * 1e6:7.2f}us | per trigger {naive * 1e6:7.2f}us per message")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
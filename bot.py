@@ -1,64 +1,378 @@
 import os
 import asyncio
+import time
+import math
+import json
+import hashlib
+import importlib.util
+import multiprocessing
+from pathlib import Path
+from typing import Iterable, Optional
+from collections import defaultdict
 
-from discord import Intents, Game
-from discord.ext.commands import Bot, Context, errors
+from discord import Game, Message, Interaction, InteractionType, app_commands
+from discord.ext import commands
+from discord.ext.commands import AutoShardedBot, Command, Context, errors
 
-from setup_logging import setup_logging
+from setup_logging import setup_logging, collect_logging_metrics
+from intents import resolve_intents, resolve_member_cache_flags, intents_report
+from store import SharedStore
+from metrics import Metrics, Samples
+from profiler import SlowCallbackDetector
+from memory import MemoryAccounting, Usage, estimate
+from dispatcher import Dispatcher
+from triggers import TriggerRegistry
+from guild_settings import GuildSettingsStore
+from event_loop import resolve_loop_config, describe_running_loop
+from member_index import MemberIndex
+from admission import Admission, Overloaded, PRESSURE_LEVELS, CRITICAL
 import logging
 import traceback
 
 logger = logging.getLogger("bot")
 
+STARTED_AT = time.perf_counter()  # used to report time-to-ready after restarts
+
+DEFAULT_METRICS_HOST = "127.0.0.1"
+DEFAULT_METRICS_PORT = 9120  # offset by the first shard id in each worker process, 0 to disable
+
 DEFAULT_PREFIX = "furret "
+APP_COMMANDS_NAMESPACE = "app_commands"  # hash of the last synced application command definitions
 DEFAULT_ACTIVITY_MESSAGE = "Furret | furret help"
 EXTENSIONS_TO_LOAD = (
     "cogs.admin",
     "cogs.fun",
     # "cogs.game",
     "cogs.music",
-    "cogs.qotd"
+    "cogs.qotd",
+    "cogs.debug"
 )
+# seldom used extensions, only imported when one of their commands is first invoked,
+# ie {"cogs.game": ("minesweeper",)} once the game is enabled again
+LAZY_EXTENSIONS: dict[str, tuple[str, ...]] = {}
+
 
+class FurretTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: Interaction, /) -> bool:
+        """Load lazy extensions when one of their application commands is first used"""
+        if interaction.type in (InteractionType.application_command, InteractionType.autocomplete):
+            extension = self.client.lazy_commands.get(interaction.data.get("name"))
+            if extension is not None:
+                await self.client.load_lazy_extension(extension)
+        return True
 
-class Furret(Bot):
-    def __init__(self, *args, **kwargs):
-        setup_logging()
+
+class Furret(AutoShardedBot):
+    def __init__(self, *args, store: Optional[SharedStore] = None, **kwargs):
+        shard_ids = kwargs.get("shard_ids")
+        # every worker process gets its own log file, rotating a shared one from multiple processes breaks
+        setup_logging(
+            filename=f"bot.shard{shard_ids[0]}-{shard_ids[-1]}.log" if shard_ids else "bot.log",
+            json_format=os.getenv("LOG_FORMAT") == "json"
+        )
         super().__init__(*args, **kwargs)
+        self.store: SharedStore = store or SharedStore()
+        self.metrics: Metrics = Metrics()
+        self.slow_callbacks: SlowCallbackDetector = SlowCallbackDetector()
+        self.memory: MemoryAccounting = MemoryAccounting()
+        self.dispatcher: Dispatcher = Dispatcher()
+        self.admission: Admission = Admission(self.metrics)
+        self.triggers: TriggerRegistry = TriggerRegistry(admit=self.admission.admit)
+        self.guild_settings: GuildSettingsStore = GuildSettingsStore(self.store)
+        self.member_index: MemberIndex = MemberIndex(self)
+        # with PREFIX_COMMANDS=opt-in, only guilds that turned them on get their messages parsed for commands
+        self.prefix_commands_default: bool = os.getenv("PREFIX_COMMANDS") != "opt-in"
+        self.lazy_commands: dict[str, str] = {}  # command name to its lazy extension
+        self._lazy_lock: asyncio.Lock = asyncio.Lock()
+        self.add_listener(self.triggers.dispatch, "on_message")
+        for event in ("on_member_join", "on_member_update", "on_raw_member_remove", "on_user_update", "on_guild_remove"):
+            self.add_listener(getattr(self.member_index, event), event)
+        self.add_check(self.admission.check, call_once=True)  # once per invoke, not for every command help filters
+        self.before_invoke(self.metrics_before_invoke)
+        self.after_invoke(self.metrics_after_invoke)
+
+    def owns_guild(self, guild_id: int) -> bool:
+        """Whether the guild is handled by one of the shards in this process"""
+        if self.shard_ids is None or not self.shard_count:
+            return True
+        return (guild_id >> 22) % self.shard_count in self.shard_ids
+
+    def prefix_commands_enabled(self, guild_id: int) -> bool:
+        enabled = self.guild_settings.prefix_commands(guild_id)
+        return self.prefix_commands_default if enabled is None else enabled
+
+    async def on_message(self, message: Message, /) -> None:
+        # guilds using application commands only skip prefix parsing entirely
+        if message.guild is not None and not self.prefix_commands_enabled(message.guild.id):
+            return
+        await self.process_commands(message)
+
+    async def close(self) -> None:
+        await super().close()
+        await self.metrics.close()
+        self.slow_callbacks.stop()
+        self.store.close()
+
+    async def metrics_before_invoke(self, ctx: Context) -> None:
+        ctx.metrics_started = self.metrics.command_started(ctx.command.qualified_name)
+
+    async def metrics_after_invoke(self, ctx: Context) -> None:
+        self.metrics.command_finished(ctx.command.qualified_name, ctx.metrics_started)
+
+    async def collect_cache_metrics(self) -> Samples:
+        return {
+            "cached_guilds": len(self.guilds),
+            "cached_users": len(self.users),
+            "cached_members": sum(len(guild.members) for guild in self.guilds),
+            "cached_messages": len(self.cached_messages),
+            "voice_clients": len(self.voice_clients),
+        }
+
+    async def collect_profiler_metrics(self) -> Samples:
+        return {"slow_callbacks_total": self.slow_callbacks.slow_callbacks}
+
+    def account_members(self) -> Usage:
+        return {guild.id: estimate(guild.members) for guild in self.guilds}
+
+    def account_messages(self) -> Usage:
+        messages = defaultdict(list)
+        for message in self.cached_messages:
+            messages[message.guild.id if message.guild else None].append(message)
+        return {guild_id: estimate(guild_messages) for guild_id, guild_messages in messages.items()}
+
+    async def start_metrics(self) -> None:
+        self.metrics.start_lag_probe()
+        self.metrics.add_collector("cache", self.collect_cache_metrics)
+        self.metrics.add_collector("logging", collect_logging_metrics)
+        self.metrics.add_collector("profiler", self.collect_profiler_metrics)
+        self.metrics.add_collector("memory", self.memory.collect_metrics)
+        self.metrics.add_collector("dispatcher", self.dispatcher.collect_metrics)
+        self.metrics.add_collector("admission", self.admission.collect_metrics)
+        self.memory.add_accountant("discord.members", self.account_members)
+        self.memory.add_accountant("discord.messages", self.account_messages)
+        self.memory.add_accountant("member_index", self.member_index.account_memory)
+
+        port = int(os.getenv("METRICS_PORT") or DEFAULT_METRICS_PORT)
+        if port:
+            port += self.shard_ids[0] if self.shard_ids else 0
+            await self.metrics.start_server(os.getenv("METRICS_HOST") or DEFAULT_METRICS_HOST, port)
 
     async def on_ready(self):
-        logger.info(f"Logged in as {self.user}")
+        logger.info(f"Logged in as {self.user} ({time.perf_counter() - STARTED_AT:.2f}s since startup)")
 
     async def on_command_error(self, ctx: Context, exc: errors.CommandError, /) -> None:
+        if isinstance(exc, Overloaded):  # turned away on purpose, already counted by admission
+            if exc.notice is not None:
+                await ctx.reply(exc.notice, ephemeral=True)
+            return
+        if ctx.command:
+            self.metrics.command_failed(ctx.command.qualified_name)
         logger.error(
             f'Ignoring exception in command {ctx.command}:\n'
             f'{"".join(traceback.format_exception(type(exc), exc, exc.__traceback__))}'
         )
 
     async def setup_hook(self) -> None:
+        logger.info(intents_report((*EXTENSIONS_TO_LOAD, *LAZY_EXTENSIONS)))
+        logger.info(describe_running_loop())
+        await self.start_metrics()
+        self.guild_settings.load_all(self.owns_guild)  # so prefixes resolve from memory
+        if threshold := float(os.getenv("PROFILE_SLOW_CALLBACKS") or 0):  # in milliseconds
+            self.slow_callbacks.threshold = threshold / 1000
+            self.slow_callbacks.start()
         await self.autoload_extension()
+        try:
+            await self.sync_app_commands()
+        except Exception as exc:  # the prefix commands still work
+            logger.error(
+                f'Failed to sync application commands:\n'
+                f'{"".join(traceback.format_exception(type(exc), exc, exc.__traceback__))}'
+            )
 
     async def autoload_extension(self) -> None:
-        for module in EXTENSIONS_TO_LOAD:
-            await self.load_extension(module)
+        """Load the extensions concurrently, so slow cog_load (ie lavalink connecting) doesn't hold up the rest"""
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(self.timed_load_extension(module) for module in EXTENSIONS_TO_LOAD),
+            return_exceptions=True
+        )
 
+        breakdown = []
+        for module, result in zip(EXTENSIONS_TO_LOAD, results):
+            if isinstance(result, BaseException):
+                logger.error(
+                    f'Failed to load extension {module}:\n'
+                    f'{"".join(traceback.format_exception(type(result), result, result.__traceback__))}'
+                )
+                breakdown.append(f"{module} failed")
+            else:
+                breakdown.append(f"{module} {result * 1000:.0f}ms")
 
-bot = Furret(
-    intents=Intents.all(),
-    command_prefix=DEFAULT_PREFIX,
-    activity=Game(name=DEFAULT_ACTIVITY_MESSAGE)
-)
+        for module, command_names in LAZY_EXTENSIONS.items():
+            self.add_lazy_extension(module, command_names)
+
+        logger.info(f"Loaded extensions in {(time.perf_counter() - start) * 1000:.0f}ms: {', '.join(breakdown)}")
+
+    async def timed_load_extension(self, name: str) -> float:
+        """Load an extension, returns the time taken in seconds"""
+        start = time.perf_counter()
+        await self.load_extension(name)
+        return time.perf_counter() - start
+
+    async def hot_reload_extension(self, name: str) -> float:
+        """Reload an extension, handing live state over from its old cogs to the new ones.
+        Returns the time taken in seconds.
 
+        Cogs opt in by defining export_state, which stops anything still running and returns its state,
+        and import_state, which gets that state on the new cog. The state can hold builtins and discord objects
+        like members, but no instances of the extension's own classes, those would be of the old module.
+        Exported state is also imported when the reload fails and discord.py rolls back to the old module.
+        """
+        start = time.perf_counter()
+        states = {
+            cog_name: cog.export_state()
+            for cog_name, cog in self.cogs.items()
+            if (cog.__module__ == name or cog.__module__.startswith(f"{name}.")) and hasattr(cog, "export_state")
+        }
+        try:
+            await self.reload_extension(name)
+        finally:
+            for cog_name, state in states.items():
+                if (cog := self.get_cog(cog_name)) is not None and hasattr(cog, "import_state"):
+                    cog.import_state(state)
 
-@bot.command()
+        elapsed = time.perf_counter() - start
+        logger.info(f"Reloaded extension {name} in {elapsed * 1000:.0f}ms")
+        return elapsed
+
+    def add_lazy_extension(self, name: str, command_names: Iterable[str]) -> None:
+        """Register stub commands that load the extension on first invocation, then rerun the message"""
+        async def load_and_reinvoke(ctx: Context) -> None:
+            await self.load_lazy_extension(name)
+            await self.invoke(await self.get_context(ctx.message))
+
+        for command_name in command_names:
+            self.lazy_commands[command_name] = name
+            self.add_command(Command(load_and_reinvoke, name=command_name, help=f"Loads {name} on first use"))
+
+    async def load_lazy_extension(self, name: str) -> None:
+        """Load a lazy extension in place of its stub commands, if it isn't loaded yet"""
+        async with self._lazy_lock:  # multiple stubs invoked at the same time should only load once
+            if name in self.extensions:
+                return
+
+            stubs = [self.remove_command(command) for command, extension in self.lazy_commands.items() if extension == name]
+            try:
+                elapsed = await self.timed_load_extension(name)
+            except Exception:
+                for stub in stubs:
+                    if stub is not None:
+                        self.add_command(stub)
+                raise
+            logger.info(f"Lazy loaded extension {name} in {elapsed * 1000:.0f}ms")
+
+    def app_commands_key(self) -> str:
+        """Hash of the application command definitions, lazy extensions are hashed by their source so they aren't loaded"""
+        digest = hashlib.sha256()
+        payload = [command.to_dict(self.tree) for command in self.tree.get_commands()]
+        digest.update(json.dumps(payload, sort_keys=True).encode())
+
+        for name in sorted(LAZY_EXTENSIONS):
+            spec = importlib.util.find_spec(name)
+            if spec.submodule_search_locations:
+                paths = sorted(path for location in spec.submodule_search_locations for path in Path(location).glob("*.py"))
+            else:
+                paths = [Path(spec.origin)]
+            for path in paths:
+                digest.update(path.read_bytes())
+        return digest.hexdigest()
+
+    async def sync_app_commands(self) -> None:
+        """Sync the global application commands, only when their definitions changed since the last sync"""
+        if self.shard_ids is not None and 0 not in self.shard_ids:
+            return  # they're global, one process is enough
+
+        key = self.app_commands_key()
+        if self.store.get(APP_COMMANDS_NAMESPACE, "global") == key:
+            logger.info("Application commands unchanged, skipped syncing")
+            return
+
+        # what gets synced has to include the lazy extensions' commands
+        for name in LAZY_EXTENSIONS:
+            await self.load_lazy_extension(name)
+
+        start = time.perf_counter()
+        synced = await self.tree.sync()
+        await self.store.set_soon(APP_COMMANDS_NAMESPACE, "global", key)
+        logger.info(f"Synced {len(synced)} application commands in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+
+def resolve_prefix(bot: Furret, msg: Message) -> str:
+    """Runs on every message, only ever reads from memory"""
+    if msg.guild is None:
+        return DEFAULT_PREFIX
+    return bot.guild_settings.prefix(msg.guild.id) or DEFAULT_PREFIX
+
+
+@commands.hybrid_command(extras={"priority": CRITICAL})
 async def ping(ctx: Context):
     """Ping the bot"""
-    await ctx.reply(f'Pong! {round(bot.latency * 1000)}ms')
+    # the gateway latency looks fine while the event loop is drowning, so show both
+    pressure = ctx.bot.admission.pressure()
+    await ctx.reply(
+        f'Pong! {round(ctx.bot.latency * 1000)}ms, event loop lag {round(ctx.bot.metrics.current_loop_lag() * 1000)}ms'
+        + (f', {PRESSURE_LEVELS[pressure]} pressure' if pressure else '')
+    )
+
+
+def create_bot(
+        shard_ids: Optional[list[int]] = None,
+        shard_count: Optional[int] = None,
+        *,
+        cls: type[Furret] = Furret,
+        **kwargs) -> Furret:
+    intents = resolve_intents((*EXTENSIONS_TO_LOAD, *LAZY_EXTENSIONS))
+    bot = cls(
+        intents=intents,
+        member_cache_flags=resolve_member_cache_flags(intents),
+        chunk_guilds_at_startup=False,
+        command_prefix=resolve_prefix,
+        tree_cls=FurretTree,
+        activity=Game(name=DEFAULT_ACTIVITY_MESSAGE),
+        shard_ids=shard_ids,
+        shard_count=shard_count,
+        **kwargs
+    )
+    bot.add_command(ping)
+    return bot
+
+
+def run(shard_ids: Optional[list[int]] = None, shard_count: Optional[int] = None) -> None:
+    async def runner():
+        async with create_bot(shard_ids, shard_count) as bot:
+            await bot.start(os.getenv("DISCORD_BOT_TOKEN"))
+
+    resolve_loop_config().run(runner())
+
+
+def main():
+    """Run every shard in this process, or spread shard ranges across SHARD_PROCESSES worker processes"""
+    shard_count = int(os.getenv("SHARD_COUNT") or 0) or None
+    processes = int(os.getenv("SHARD_PROCESSES") or 1)
 
+    if processes <= 1 or shard_count is None:
+        run(shard_count=shard_count)
+        return
 
-async def main():
-    token = os.getenv("DISCORD_BOT_TOKEN")
-    await bot.start(token)
+    per_process = math.ceil(shard_count / processes)
+    shard_ranges = [list(range(i, min(i + per_process, shard_count))) for i in range(0, shard_count, per_process)]
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=run, args=(ids, shard_count), name=f"shards-{ids[0]}-{ids[-1]}") for ids in shard_ranges]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
 
 
-asyncio.run(main())
+if __name__ == "__main__":
+    main()
@@ -4,11 +4,16 @@ from typing import Optional, Union  # discordpy dont support pipe as union
 import asyncio
 
 # for bonk command
-from datetime import timedelta
+from datetime import datetime, timedelta
 from cogs.admin.bonk import Bonked
+from memory import Usage, account_many
+from guild_settings import MUSIC_HOME_POLICIES
+from member_index import IndexedMember
+from admission import CRITICAL
 
-from discord import TextChannel, VoiceChannel, Member, Role
-from discord.ext import commands
+from discord import TextChannel, VoiceChannel, Member, Role, Guild, NotFound
+from discord import app_commands
+from discord.ext import commands, tasks
 from discord.ext.commands import has_permissions, Greedy
 from discord.ext.commands import MissingPermissions
 
@@ -43,34 +48,121 @@ def time_format_to_timedelta(time_format) -> timedelta:
     return timedelta(seconds=seconds)
 
 
+class Duration(commands.Converter[timedelta]):
+    """time_format_to_timedelta as a converter, application commands don't take plain functions"""
+
+    async def convert(self, ctx, argument: str) -> timedelta:
+        try:
+            return time_format_to_timedelta(argument)
+        except ValueError as e:
+            raise commands.BadArgument(str(e)) from e
+
+
+async def role_members(bot: commands.Bot, role: Role) -> list[Member]:
+    """Get the members of a role, members aren't all cached so the guild is chunked, at most once a minute"""
+    return [member for member in await bot.member_index.members(role.guild) if role in member.roles]
+
+
+BONKED_NAMESPACE = 'bonked'
+
+
+def bonk_key(guild_id: int, member_id: int) -> str:
+    return f'{guild_id}:{member_id}'
+
+
 class Admin(commands.Cog):
+    admission_priority = CRITICAL
 
     __slots__ = ('bot', 'bonked')
 
     def __init__(self, bot):
         self.bot = bot
-        self.bonked = {}
+        self.bonked: dict[tuple[int, int], Bonked] = {}  # (guild id, member id) to bonk
+        bot.memory.add_accountant('admin.bonked', self.account_memory)
+
+    async def cog_unload(self) -> None:
+        self.bot.memory.remove_accountant('admin.bonked')
+
+    def account_memory(self) -> Usage:
+        return account_many(
+            ((guild_id, (bonked, bonked.bonk_task)) for (guild_id, _), bonked in self.bonked.items()),
+            follow=(Bonked, tasks.Loop)
+        )
+
+    def export_state(self) -> dict:
+        """Stop the bonk loops and hand over what they were enforcing"""
+        state = {}
+        for key, bonked in self.bonked.items():
+            if bonked.bonked:
+                bonked.bonk_task.cancel()
+                state[key] = (bonked.member, bonked.channel, bonked.start_time, bonked.duration, bonked.reason)
+        return state
+
+    def import_state(self, state: dict) -> None:
+        for key, (member, channel, start_time, duration, reason) in state.items():
+            self.bonked[key] = Bonked(member, channel, duration, start_time=start_time, reason=reason)
+
+    def _save_bonk(self, bonked: Bonked) -> None:
+        """Persist the bonk to the shared store, so it survives restarts and is visible to every shard process"""
+        self.bot.store.set_soon(BONKED_NAMESPACE, bonk_key(bonked.member.guild.id, bonked.member.id), {
+            'channel_id': bonked.channel.id,
+            'end_time': bonked.end_time.timestamp(),
+            'reason': bonked.reason
+        })
+
+    def _forget_bonk(self, guild_id: int, member_id: int) -> None:
+        self.bonked.pop((guild_id, member_id), None)
+        self.bot.store.delete_soon(BONKED_NAMESPACE, bonk_key(guild_id, member_id))
+
+    @commands.Cog.listener()
+    async def on_guild_available(self, guild: Guild):
+        """Resume stored bonks of the guild, the guild is only ever available on the shard that handles it"""
+        prefix = f'{guild.id}:'
+        for key, data in self.bot.store.items(BONKED_NAMESPACE).items():
+            if not key.startswith(prefix):
+                continue
+            member_id = int(key[len(prefix):])
+            if (guild.id, member_id) in self.bonked:
+                continue
+
+            remaining = datetime.fromtimestamp(data['end_time']) - datetime.now()
+            channel = guild.get_channel(data['channel_id'])
+            if remaining <= timedelta() or channel is None:
+                self._forget_bonk(guild.id, member_id)
+                continue
+
+            try:
+                member = guild.get_member(member_id) or await guild.fetch_member(member_id)
+            except NotFound:  # left the guild
+                self._forget_bonk(guild.id, member_id)
+                continue
+            self.bonked[(guild.id, member_id)] = Bonked(member, channel, remaining, reason=data['reason'])
 
-    @commands.command()
+    @commands.hybrid_command()
     @has_permissions(administrator=True)
+    @app_commands.default_permissions(administrator=True)
     async def nuke(self, ctx, channel: Optional[Union[TextChannel, VoiceChannel]] = None, countdown: int = 30):
         """Starts a nuke countdown in a channel for specified amount of time"""
         if channel is None:  # defaults to ctx.channel if channel is not specified
             channel = ctx.channel
+        if ctx.interaction is not None:  # the countdown isn't a response to the interaction
+            await ctx.send(f'Nuking {channel.mention}', ephemeral=True)
 
         message = await channel.send(f'**NUKING CHANNEL IN {countdown} SECONDS**')
         for _ in range(countdown):
             await asyncio.sleep(1)
             countdown -= 1
             if countdown != 0:
-                await message.edit(content=f'**NUKING CHANNEL IN {countdown} SECONDS**')
+                # not awaited, if the edits fall behind the rate limit they're coalesced into the latest countdown
+                self.bot.dispatcher.edit(message, content=f'**NUKING CHANNEL IN {countdown} SECONDS**')
             else:
-                await message.reply('*happy furret noises*')
+                await self.bot.dispatcher.send(channel, content='*happy furret noises*', reference=message)
         # await channel.delete(reason='Nuked')
 
-    @commands.group()
+    @commands.hybrid_group(fallback='add')
     @has_permissions(administrator=True)
-    async def bonk(self, ctx, mentions: Greedy[Union[Member, Role]], channel: Optional[VoiceChannel] = None, duration: Optional[time_format_to_timedelta] = timedelta(seconds=30), *, reason=''):
+    @app_commands.default_permissions(administrator=True)
+    async def bonk(self, ctx, mentions: Greedy[Union[IndexedMember, Role]], channel: Optional[VoiceChannel] = None, duration: Optional[Duration] = timedelta(seconds=30), *, reason=''):
         """Lock mentioned members / roles in the server's inactive channel
 
         Default to 30 seconds. Time formats are (case sensitive):
@@ -97,10 +189,12 @@ class Admin(commands.Cog):
                 return
 
         def silence(member):
-            if member.id in self.bonked:
-                self.bonked[member.id].add_time(duration)
+            key = (member.guild.id, member.id)
+            if key in self.bonked:
+                self.bonked[key].add_time(duration)
             else:
-                self.bonked[member.id] = Bonked(member, channel, duration, reason=reason)
+                self.bonked[key] = Bonked(member, channel, duration, reason=reason)
+            self._save_bonk(self.bonked[key])
 
         added = []
         for mention in mentions:
@@ -115,25 +209,29 @@ class Admin(commands.Cog):
                             silence(member)
                             added.append(member)
                     case Role():
-                        for member in mention.members:
+                        for member in await role_members(self.bot, mention):
                             silence(member)
                             added.append(member)
 
         await ctx.reply(f'***BONK!!!*** Go to {channel.mention} {", ".join(x.mention for x in added)} for {duration}')
 
     @bonk.command(name='list', aliases=['ls'])
+    @commands.guild_only()
+    @has_permissions(administrator=True)
     async def _list(self, ctx):
-        if not self.bonked:
+        bonked = [v for (guild_id, _), v in self.bonked.items() if guild_id == ctx.guild.id and v.bonked]
+        if not bonked:
             await ctx.reply('No one was being naughty')
             return
-        await ctx.reply('Bonked list:\n' '\n'.join(f'{v.member} - <t:{v.end_time.timestamp()}:R>' for v in self.bonked.values()))
+        await ctx.reply('Bonked list:\n' + '\n'.join(f'{v.member} - <t:{int(v.end_time.timestamp())}:R>' for v in bonked))
 
-    @commands.command(aliases=['release'])
-    async def unbonk(self, ctx, mentions: Greedy[Member]):
+    @commands.hybrid_command(aliases=['release'])
+    async def unbonk(self, ctx, mentions: Greedy[IndexedMember]):
         released = []
         for member in mentions:
-            if member.id in self.bonked:
-                self.bonked[member.id].unbonk()
+            if (member.guild.id, member.id) in self.bonked:
+                self.bonked[(member.guild.id, member.id)].unbonk()
+                self._forget_bonk(member.guild.id, member.id)
                 released.append(member)
 
         if released:
@@ -141,6 +239,66 @@ class Admin(commands.Cog):
         else:
             await ctx.reply(f'{", ".join(x.mention for x in mentions)} is not bonked.')
 
+    @commands.hybrid_group(fallback='show')  # slash subcommands don't run the group's checks, each has its own
+    @commands.guild_only()
+    @has_permissions(administrator=True)
+    @app_commands.default_permissions(administrator=True)
+    async def config(self, ctx):
+        """Show this server's settings"""
+        if ctx.invoked_subcommand:
+            return
+
+        settings = self.bot.guild_settings.get(ctx.guild.id)
+        await ctx.reply(
+            f'Prefix: `{settings.prefix or "default"}`\n'
+            f'Prefix commands: `{"default" if settings.prefix_commands is None else "on" if settings.prefix_commands else "off"}`\n'
+            f'QOTD channels: {" ".join(f"<#{x}>" for x in settings.qotd_channel_ids) or "none"}\n'
+            f'Music home channel: `{settings.music_home_policy}`'
+        )
+
+    @config.command(name='prefix')
+    @commands.guild_only()
+    @has_permissions(administrator=True)
+    async def config_prefix(self, ctx, prefix: Optional[str] = None):
+        """Change the prefix, quote it to include spaces. Resets to the default prefix if not given"""
+        self.bot.guild_settings.update(ctx.guild.id, prefix=prefix or None)
+        await ctx.reply(f'Prefix changed to `{prefix}`' if prefix else 'Prefix reset to default')
+
+    @config.command(name='prefix_commands')
+    @commands.guild_only()
+    @has_permissions(administrator=True)
+    async def config_prefix_commands(self, ctx, enabled: Optional[bool] = None):
+        """Turn prefix commands on or off, slash commands keep working. Resets to the default if not given"""
+        self.bot.guild_settings.update(ctx.guild.id, prefix_commands=enabled)
+        await ctx.reply('Prefix commands reset to default' if enabled is None else f'Prefix commands turned {"on" if enabled else "off"}')
+
+    @config.command(name='qotd')
+    @commands.guild_only()
+    @has_permissions(administrator=True)
+    async def config_qotd(self, ctx, channels: Greedy[TextChannel] = None):
+        """Toggle channels watched for QOTDs, defaults to the current channel"""
+        channel_ids = list(self.bot.guild_settings.get(ctx.guild.id).qotd_channel_ids)
+        for channel in channels or [ctx.channel]:
+            if channel.id in channel_ids:
+                channel_ids.remove(channel.id)
+            else:
+                channel_ids.append(channel.id)
+
+        self.bot.guild_settings.update(ctx.guild.id, qotd_channel_ids=tuple(channel_ids))
+        await ctx.reply(f'QOTD channels: {" ".join(f"<#{x}>" for x in channel_ids) or "none"}')
+
+    @config.command(name='music_home')
+    @commands.guild_only()
+    @has_permissions(administrator=True)
+    async def config_music_home(self, ctx, policy: str):
+        """Whether the music player stays in the channel it started in (lock) or moves to the latest one (follow)"""
+        if policy not in MUSIC_HOME_POLICIES:
+            await ctx.reply(f'Policy can only be one of {", ".join(MUSIC_HOME_POLICIES)}')
+            return
+
+        self.bot.guild_settings.update(ctx.guild.id, music_home_policy=policy)
+        await ctx.reply(f'Music home channel set to `{policy}`')
+
     @bonk.error
     async def bonk_error(self, ctx, exc):
         match exc:
@@ -152,9 +310,9 @@ class Admin(commands.Cog):
     @bonk.before_invoke
     @unbonk.before_invoke
     async def auto_clear(self, _ctx):
-        for k, v in list(self.bonked.items()):
+        for (guild_id, member_id), v in list(self.bonked.items()):
             if not v.bonked:
-                del self.bonked[k]
+                self._forget_bonk(guild_id, member_id)
 
 
 async def setup(bot):
@@ -32,5 +32,7 @@ class Bonked:
             self.bonk_task.cancel()
             return
 
-        if self.member.voice is not None and self.member.voice.channel != self.channel:
-            await self.member.move_to(self.channel, reason=self.reason)
+        # only members in voice are cached, so look up the cached one to get up to date voice state
+        member = self.member.guild.get_member(self.member.id) or self.member
+        if member.voice is not None and member.voice.channel != self.channel:
+            await member.move_to(self.channel, reason=self.reason)
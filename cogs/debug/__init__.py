@@ -0,0 +1,145 @@
+import io
+import time
+from typing import Optional
+
+from discord import File
+from discord.ext import commands
+from discord.ext.commands import Bot, Context
+
+from profiler import profile_loop
+from admission import CRITICAL
+
+CHARACTER_LIMIT = 2000
+TOP_COMMANDS = 15
+TOP_GUILDS = 10
+MAX_PROFILE_SECONDS = 120
+
+
+def code_block(lines: list[str]) -> str:
+    """Join lines into a code block, trimmed to fit in a message"""
+    msg = "\n".join(lines)
+    if len(msg) > CHARACTER_LIMIT - 8:
+        msg = msg[:CHARACTER_LIMIT - 12] + "\n..."
+    return f"```\n{msg}\n```"
+
+
+class Debug(commands.Cog):
+    """Bot internals, only usable by the bot owner"""
+
+    admission_priority = CRITICAL  # for looking into why the bot is overloaded
+
+    def __init__(self, bot: Bot):
+        self.bot: Bot = bot
+
+    async def cog_check(self, ctx: Context) -> bool:
+        return await self.bot.is_owner(ctx.author)
+
+    @commands.command()
+    async def metrics(self, ctx: Context):
+        """Show command latencies, event loop lag and cache sizes"""
+        metrics = self.bot.metrics
+
+        lines = ["command - count / errors / p50 / p95"]
+        for name, count in sorted(metrics.command_invocations.items(), key=lambda x: x[1], reverse=True)[:TOP_COMMANDS]:
+            latency = metrics.command_latency.get(name)
+            p50, p95 = (latency.quantile(0.5), latency.quantile(0.95)) if latency else (0.0, 0.0)
+            lines.append(f"{name} - {count} / {metrics.command_errors.get(name, 0)} / {p50 * 1000:.0f}ms / {p95 * 1000:.0f}ms")
+
+        lines.append("")
+        lines.append(
+            f"event loop lag - last {metrics.last_loop_lag * 1000:.1f}ms / "
+            f"p95 {metrics.loop_lag.quantile(0.95) * 1000:.1f}ms"
+        )
+        lines.extend(f"{name} - {value:g}" for name, value in (await metrics.collect()).items())
+
+        await ctx.reply(code_block(lines))
+
+    @commands.group(invoke_without_command=True)
+    async def memory(self, ctx: Context):
+        """Show approximate memory used by each subsystem and the top guilds"""
+        accounting = self.bot.memory
+        usage = accounting.usage()
+
+        lines = ["subsystem - objects / approx size"]
+        for name, (count, size) in accounting.totals(usage).items():
+            lines.append(f"{name} - {count} / {size / 1024:.1f}KiB")
+
+        lines.append("")
+        lines.append("guild - objects / approx size")
+        guilds = sorted(accounting.by_guild(usage).items(), key=lambda x: x[1][1], reverse=True)[:TOP_GUILDS]
+        for guild_id, (count, size) in guilds:
+            guild = self.bot.get_guild(guild_id) if guild_id else None
+            lines.append(f"{guild or guild_id or 'no guild'} - {count} / {size / 1024:.1f}KiB")
+
+        await ctx.reply(code_block(lines))
+
+    @memory.command(name="snapshot")
+    async def memory_snapshot(self, ctx: Context):
+        """Take a tracemalloc snapshot, and show what grew since the last one"""
+        diff = self.bot.memory.snapshot()
+        if diff is None:
+            await ctx.reply("Tracing started and took the first snapshot, run it again later to compare.")
+            return
+        await ctx.reply(code_block(diff))
+
+    @memory.command(name="stop")
+    async def memory_stop(self, ctx: Context):
+        """Stop tracemalloc tracing"""
+        self.bot.memory.stop_tracing()
+        await ctx.message.add_reaction("\u2705")
+
+    @commands.command()
+    async def slow_callbacks(self, ctx: Context, threshold_ms: Optional[float] = None):
+        """Toggle logging of event loop callbacks slower than the threshold, in milliseconds"""
+        detector = self.bot.slow_callbacks
+        if threshold_ms is None and detector.active:
+            detector.stop()
+            await ctx.reply(f"Slow callback detection off, {detector.slow_callbacks} caught so far")
+            return
+
+        if threshold_ms is not None:
+            detector.threshold = threshold_ms / 1000
+        if not detector.start():
+            await ctx.reply("Slow callbacks can't be detected on this event loop, run with EVENT_LOOP=asyncio")
+            return
+        await ctx.reply(f"Logging callbacks slower than {detector.threshold * 1000:g}ms")
+
+    @commands.command()
+    async def reload(self, ctx: Context, *extensions: str):
+        """Hot reload extensions, every loaded one if none are given. Music keeps playing through it"""
+        names = [name if name.startswith("cogs.") else f"cogs.{name}" for name in extensions] or [*self.bot.extensions]
+
+        lines = []
+        for name in names:
+            try:
+                elapsed = await self.bot.hot_reload_extension(name)
+            except Exception as e:
+                lines.append(f"{name} - failed, {e!r}")
+            else:
+                lines.append(f"{name} - {elapsed * 1000:.0f}ms")
+        try:
+            await self.bot.sync_app_commands()  # only syncs if their definitions changed
+        except Exception as e:  # the reload itself went through, the prefix commands are already updated
+            lines.append(f"app commands - sync failed, {e!r}")
+
+        await ctx.reply(code_block(lines))
+
+    @commands.command()
+    async def profile(self, ctx: Context, seconds: float = 10):
+        """Sample the event loop for some seconds, replies with a collapsed stack file for flame graphs"""
+        seconds = min(max(seconds, 1), MAX_PROFILE_SECONDS)
+        await ctx.message.add_reaction("\u23f3")
+
+        start = time.perf_counter()
+        stacks = await profile_loop(seconds)
+        elapsed = time.perf_counter() - start
+
+        collapsed = "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+        await ctx.reply(
+            f"Took {sum(stacks.values())} samples over {elapsed:.1f}s",
+            file=File(io.BytesIO(collapsed.encode()), filename=f"profile-{int(time.time())}.collapsed")
+        )
+
+
+async def setup(bot):
+    await bot.add_cog(Debug(bot))
@@ -1,76 +1,169 @@
 import discord
-from discord.ext import commands
-from discord.ext.commands import MemberConverter
+from discord.ext import commands, tasks
+import os
 import re
 import json
 import random
 import typing
-from collections import defaultdict
+import asyncio
 from cogs.admin import Bonked
+from cogs.fun import transform
+from cogs.fun.leaderboard import Leaderboard, PAGE_SIZE
+from cogs.fun.markov import MarkovModels
+from cogs.fun.media import MediaCache
+from guild_settings import REPLYBOT_MODES
+from admission import LOW
+from memory import Usage, add_usage
+
+SIN_COUNTER_NAMESPACE = 'sin_counter'
+SIN_PATTERN = r'(sorry |forgive me )?(father|furret).+(i have sinned)'
+SORRY_DADDY_PATTERN = r'sorry daddy.+i.+been.+(bad|naughty)'
+TRIGGERS = ('fun.sin', 'fun.sorry_daddy', 'fun.replybot')
+MARKOV_SAVE_INTERVAL = 300  # in seconds
+WALCC_GIF = './media/furret_walcc.gif'
+
+
+def owo_translate(msg: str) -> str:
+    return transform.owo(msg)
 
 
 class Fun(commands.Cog):
     CONFIG_PATH = r'./cogs/fun/fun.json'
+    admission_priority = LOW  # the first to go when the bot is overloaded
 
     def __init__(self, bot):
         self.bot = bot
         with open(self.CONFIG_PATH, 'r') as f:
             config = json.load(f)
-            self._reply_rate: int = config['replybot']['reply_rate']
+            # defaults for guilds that haven't configured the replybot
+            self._reply_rate: float = config['replybot']['reply_rate']
             self._blacklist: list[int] = config['replybot']['blacklist']
             self._choices: dict[str, list[str]] = config['choices']
-            self._sin_counter: dict[str, int] = defaultdict(int, config['sin_counter'])
-
-    async def _blacklisted(self, ctx):
-        for channel_id in self._blacklist:
-            channel = await commands.TextChannelConverter().convert(ctx, str(channel_id))
-            yield channel
-
-    def _commit(self):
-        config = {
-            'replybot': {
-                'reply_rate': self._reply_rate,
-                'blacklist': self._blacklist
-            },
-            'choices': self._choices,
-            'sin_counter': self._sin_counter
+            # sin counts live in the shared store so every shard process agrees, fun.json only seeds it
+            bot.store.seed_counters(SIN_COUNTER_NAMESPACE, config.get('sin_counter', {}))
+        self.sin_leaderboard: Leaderboard = Leaderboard(bot, lambda: self._sin_counter)
+        # kept next to the shared store, one file per channel
+        self.markov: MarkovModels = MarkovModels(os.path.join(os.path.dirname(bot.store.path), 'markov'))
+        bot.memory.add_accountant('fun.markov', self.account_memory)
+        self.media: MediaCache = MediaCache()
+        bot.memory.add_accountant('fun.media', lambda: {None: (1, self.media.nbytes())})
+        bot.metrics.add_collector('fun.media', self.collect_metrics)
+
+        # same group, so only the first one that handles a message runs, like an if elif chain
+        bot.triggers.add('fun.sin', SIN_PATTERN, self._on_sin, group='fun', flags=re.IGNORECASE)
+        bot.triggers.add('fun.sorry_daddy', SORRY_DADDY_PATTERN, self._on_sorry_daddy, group='fun', flags=re.IGNORECASE,
+                         priority=LOW)
+        bot.triggers.add('fun.replybot', None, self._on_replybot, group='fun', priority=LOW)
+
+    async def cog_load(self) -> None:
+        self.save_markov.start()
+
+    async def cog_unload(self) -> None:
+        self.bot.triggers.remove(*TRIGGERS)
+        self.bot.memory.remove_accountant('fun.markov')
+        self.bot.memory.remove_accountant('fun.media')
+        self.bot.metrics.remove_collector('fun.media')
+        self.save_markov.cancel()
+        await self.markov.save()
+
+    def account_memory(self) -> Usage:
+        usage: Usage = {}
+        for _, model in self.markov:
+            add_usage(usage, model.guild_id, 1, model.nbytes())
+        return usage
+
+    async def collect_metrics(self) -> dict[str, float]:
+        return {
+            'media_cache_uploads_total': self.media.uploads,
+            'media_cache_reuses_total': self.media.reuses,
+            'media_cache_uploaded_bytes_total': self.media.bytes_uploaded,
+            'media_cache_saved_bytes_total': self.media.bytes_saved,
         }
-        with open(self.CONFIG_PATH, 'w') as f:
-            json.dump(config, f, indent=4)
 
     @commands.Cog.listener()
-    async def on_message(self, msg):
-        # grab context from the message
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        self.media.forget({payload.message_id})
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        self.media.forget(payload.message_ids)
+
+    @tasks.loop(seconds=MARKOV_SAVE_INTERVAL)
+    async def save_markov(self):
+        await self.markov.save()
+
+    @property
+    def _sin_counter(self) -> dict[str, int]:
+        return self.bot.store.counters(SIN_COUNTER_NAMESPACE)
+
+    def _replybot_settings(self, guild) -> tuple[float, list[int]]:
+        """Reply rate and blacklisted channel ids of the guild, fun.json's replybot section is the default"""
+        if guild is None:
+            return self._reply_rate, self._blacklist
+
+        settings = self.bot.guild_settings.get(guild.id)
+        rate = self._reply_rate if settings.reply_rate is None else settings.reply_rate
+        blacklist = self._blacklist if settings.replybot_blacklist is None else list(settings.replybot_blacklist)
+        return rate, blacklist
+
+    async def _on_sin(self, msg) -> typing.Optional[bool]:
+        if not msg.author.voice:
+            return False
+
+        Bonked(msg.author, msg.guild.afk_channel, reason='Sinner')
+        await msg.reply(random.choice(['Very well.', 'Thy sins shalt not be forgiven.']))
+        await self.bot.store.increment_soon(SIN_COUNTER_NAMESPACE, str(msg.author.id))
+        self.sin_leaderboard.invalidate()
+
+    async def _on_sorry_daddy(self, msg) -> typing.Optional[bool]:
+        if not msg.author.voice:
+            return False
+
+        await msg.reply('For the last time, it\'s "Forgive me father, for I have sinned"')
+
+    async def _on_replybot(self, msg):
+        # cheap checks first, so the context is only parsed for messages that would get a reply
+        reply_rate, blacklist = self._replybot_settings(msg.guild)
+        if msg.channel.id in blacklist:
+            return
+
+        model = None
+        if msg.guild is not None and self.bot.guild_settings.get(msg.guild.id).replybot_mode == 'markov':
+            model = await self.markov.get(msg.channel.id, msg.guild.id)
+            prefix = await self.bot.get_prefix(msg)
+            if not msg.content.startswith(prefix if isinstance(prefix, str) else tuple(prefix)):  # commands aren't chatter
+                model.learn(msg.content)
+
+        if random.random() >= reply_rate:
+            return
+
         ctx = await self.bot.get_context(msg)
+        if ctx.valid:  # check if message didn't invoke a command
+            return
 
-        if not msg.author.bot:  # check if message didn't invoke a command
-            if re.match(r'(sorry |forgive me )?(father|furret).+(i have sinned)', msg.content.casefold()) and msg.author.voice:
-                Bonked(msg.author, msg.guild.afk_channel, reason='Sinner')
-                await msg.reply(random.choice(['Very well.', 'Thy sins shalt not be forgiven.']))
-                self._sin_counter[str(msg.author.id)] += 1
-                self._commit()
-            elif re.match(r'sorry daddy.+i.+been.+(bad|naughty)', msg.content.casefold()) and msg.author.voice:
-                await msg.reply('For the last time, it\'s "Forgive me father, for I have sinned"')
-            elif not ctx.valid:
-                # replybot part
-                if ctx.channel.id not in self._blacklist:
-                    if random.random() < self._reply_rate:
-                        if random.random() < 0.01:
-                            await msg.channel.send('*happy furret noises*')
-                        else:
-                            await msg.channel.send(f'{msg.content}')
+        if random.random() < 0.01:
+            await msg.channel.send('*happy furret noises*')
+        elif model is not None:
+            await msg.channel.send(model.generate() or '*confused furret noises*')
+        else:
+            await msg.channel.send(f'{msg.content}')
 
     @commands.group()
+    @commands.guild_only()
     async def replybot(self, ctx):
         """Replybot"""
 
         if not ctx.invoked_subcommand:
+            reply_rate, blacklist = self._replybot_settings(ctx.guild)
             # Reply rate - reply_rate * 100, and add '%'
-            # Blacklists - joins all the channel mentions after using the converter to get the TextChannel object from ids
+            # Blacklists - joins all the channel mentions of the blacklisted channels in this guild
             await ctx.reply('Reply rate: `{reply_rate}%`\n'
+                            'Mode: `{mode}`\n'
                             'Blacklisted channels: {channels}'.format
-                            (reply_rate=self._reply_rate * 100,
-                             channels=' '.join([channel.mention async for channel in self._blacklisted(ctx)])))
+                            (reply_rate=reply_rate * 100,
+                             mode=self.bot.guild_settings.get(ctx.guild.id).replybot_mode,
+                             channels=' '.join(channel.mention for channel_id in blacklist
+                                               if (channel := ctx.guild.get_channel(channel_id)))))
 
     @replybot.command(aliases=['rate'])
     async def reply_rate(self, ctx, num_in_percentage: typing.Union[int | float]):
@@ -82,10 +175,20 @@ class Fun(commands.Cog):
         0.1 = 0.1%
         """
 
-        self._reply_rate = num_in_percentage / 100
+        self.bot.guild_settings.update(ctx.guild.id, reply_rate=num_in_percentage / 100)
 
         await ctx.reply(f'Changed to {num_in_percentage}%')
 
+    @replybot.command()
+    async def mode(self, ctx, mode: str):
+        """Whether replybot repeats messages (echo) or says something it learnt from the channel (markov)"""
+        if mode not in REPLYBOT_MODES:
+            await ctx.reply(f'Mode can only be one of {", ".join(REPLYBOT_MODES)}')
+            return
+
+        self.bot.guild_settings.update(ctx.guild.id, replybot_mode=mode)
+        await ctx.reply(f'Replybot mode set to `{mode}`')
+
     @replybot.command()
     async def blacklist(self, ctx, channels: commands.Greedy[discord.TextChannel] = None):
         """Blacklist channels from replybot"""
@@ -93,11 +196,14 @@ class Fun(commands.Cog):
         if not channels:  # if no channels is found
             channels = [ctx.channel]  # set current channel as channel
 
+        _, blacklist = self._replybot_settings(ctx.guild)
+        blacklist = list(blacklist)
         blacklisted = list()
         for channel in channels:
-            if channel.id not in self._blacklist:
-                self._blacklist.append(channel.id)
+            if channel.id not in blacklist:
+                blacklist.append(channel.id)
                 blacklisted.append(channel)
+        self.bot.guild_settings.update(ctx.guild.id, replybot_blacklist=tuple(blacklist))
 
         await ctx.reply('Blacklisted {channels}'.format(channels=" ".join(channel.mention for channel in blacklisted)))
 
@@ -108,23 +214,26 @@ class Fun(commands.Cog):
         if not channels:  # if no channels is found
             channels = [ctx.channel]  # set current channel as channel
 
+        _, blacklist = self._replybot_settings(ctx.guild)
+        blacklist = list(blacklist)
         unblacklisted = list()
         for channel in channels:
             try:
-                self._blacklist.remove(channel.id)
+                blacklist.remove(channel.id)
             except ValueError:
                 pass
             else:
                 unblacklisted.append(channel)
+        self.bot.guild_settings.update(ctx.guild.id, replybot_blacklist=tuple(blacklist))
 
         await ctx.reply(
             'Unblacklisted {channels}'.format(channels=" ".join(channel.mention for channel in unblacklisted)))
 
-    @reply_rate.after_invoke
-    @blacklist.after_invoke
-    @unblacklist.after_invoke
-    async def commit_changes(self, _):
-        self._commit()
+    async def reply_long(self, ctx, text: str) -> None:
+        """Reply with text over the character limit, the overflow is paced on the dispatcher"""
+        first, *rest = transform.split_message(text)
+        await ctx.reply(first)
+        await asyncio.gather(*(self.bot.dispatcher.send(ctx.channel, content=chunk) for chunk in rest))
 
     @commands.command(aliases=['say'])
     async def send(self, ctx, num: typing.Optional[int] = 1, *, msg: str):
@@ -132,8 +241,7 @@ class Fun(commands.Cog):
 
         Yoy can optionally specify the amount of time to resend the message, up to 20
         """
-        for _ in range(min(20, num)):
-            await ctx.send(msg)
+        await asyncio.gather(*(self.bot.dispatcher.send(ctx.channel, content=msg) for _ in range(min(20, num))))
 
     @commands.command()
     async def approval(self, ctx):
@@ -143,23 +251,17 @@ class Fun(commands.Cog):
     @commands.command(aliases=['uwu', 'uwo', 'owu'])
     async def owo(self, ctx, *, msg: str):
         """Owo-fy any words or sentences"""
+        await self.reply_long(ctx, owo_translate(msg))
 
-        translated = ""
-        for letter in msg:
-            uwu_faces = [' OwO', ' UwU', ' :3', '']
-            if letter in "lr":
-                translated += "w"
-            elif letter in "LR":
-                translated += "W"
-            elif letter in "h":
-                translated += "hw"
-            elif letter in "H":
-                translated += "Hw"
-            elif letter in ".,":
-                translated += random.choice(uwu_faces) + letter
-            else:
-                translated += letter
-        await ctx.reply(translated)
+    @commands.command(aliases=['spongebob'])
+    async def mock(self, ctx, *, msg: str):
+        """mOcK aNy WoRdS oR sEnTeNcEs"""
+        await self.reply_long(ctx, transform.mock(msg))
+
+    @commands.command(aliases=['1337'])
+    async def leet(self, ctx, *, msg: str):
+        """L337-ify any words or sentences"""
+        await self.reply_long(ctx, transform.leet(msg))
 
     @commands.command()
     async def pick(self, ctx, num1: int, num2: int):
@@ -200,7 +302,7 @@ class Fun(commands.Cog):
 
         if suffix is not None and suffix.lower() in ('gif', 'gif2', 'emote', 'c', 'e', 'f'):
             if suffix.lower() == 'gif':
-                await ctx.reply(file=discord.File('./media/furret_walcc.gif'))
+                await self.media.reply(ctx, WALCC_GIF)
             elif suffix.lower() == 'gif2':
                 await ctx.reply('https://tenor.com/view/furret-walk-fast-speed-space-gif-17881426')
             elif suffix.lower() == 'emote':
@@ -240,20 +342,29 @@ class Fun(commands.Cog):
                                 f'{"<a:walk:776008302210973707>" * 2}\n')
         else:
             if (r1 := random.randint(1, 3)) == 1:
-                await ctx.reply(file=discord.File('./media/furret_walcc.gif'))
+                await self.media.reply(ctx, WALCC_GIF)
             elif r1 == 2:
                 await ctx.reply('https://tenor.com/view/furret-walk-fast-speed-space-gif-17881426')
             elif r1 == 3:
                 await ctx.reply('<a:walk:776008302210973707>' * random.randint(1, 10))
 
     @commands.command()
-    async def sin_counter(self, ctx):
-        desc_count: list = [(k, v) for k, v in sorted(self._sin_counter.items(), key=lambda x: x[1], reverse=True)]
-        msg = ''
-        converter = MemberConverter()
-        for id, count in desc_count:
-            msg += f'{await converter.convert(ctx=ctx, argument=id)} - {count}\n'
-        await ctx.reply(msg)
+    @commands.guild_only()
+    async def sin_counter(self, ctx, page: int = 1):
+        """Show the biggest sinners, 10 per page"""
+        try:
+            rows = await self.sin_leaderboard.page(ctx.guild, page)
+        except IndexError as e:
+            await ctx.reply(str(e))
+            return
+
+        embed = discord.Embed(
+            title='Sin counter',
+            description='\n'.join(f'`{i}.` {name} - {count}' for i, (name, count) in enumerate(rows, start=PAGE_SIZE * (page - 1) + 1)) or 'No sins yet',
+            color=0x25fa30
+        )
+        embed.set_footer(text=f'Page {page}/{self.sin_leaderboard.max_page()} | {len(self.sin_leaderboard)} sinners')
+        await ctx.reply(embed=embed)
 
 
 async def setup(bot):
@@ -0,0 +1,80 @@
+import heapq
+import math
+import time
+from operator import itemgetter
+from typing import Callable, Optional
+
+from discord import Client, ClientException, Guild
+
+PAGE_SIZE = 10
+# sins recorded by other shard processes don't invalidate this one's cache, so it's also dropped after a while
+CACHE_TTL = 60
+QUERY_MEMBERS_LIMIT = 100  # discord's limit of user ids per member request
+
+
+class Leaderboard:
+    """Pages of the highest counters with their holders' names, cached until invalidated
+
+    Only the entries up to the requested page are ranked, with a heap instead of sorting every counter.
+    """
+
+    __slots__ = ('client', 'load', '_counters', '_loaded_at', '_pages')
+
+    def __init__(self, client: Client, load: Callable[[], dict[str, int]]):
+        """
+        :param: client <Client> - to resolve names of members that aren't in the guild
+        :param: load <Callable[[], dict[str, int]]> - user id to count, called again after every invalidation
+        """
+        self.client = client
+        self.load = load
+        self._counters: Optional[dict[str, int]] = None
+        self._loaded_at: float = 0
+        self._pages: dict[tuple[int, int], list[tuple[str, int]]] = {}  # (guild id, page) to (name, count)
+
+    def invalidate(self) -> None:
+        self._counters = None
+        self._pages.clear()
+
+    def _fresh_counters(self) -> dict[str, int]:
+        if self._counters is None or time.monotonic() - self._loaded_at > CACHE_TTL:
+            self.invalidate()
+            self._counters = self.load()
+            self._loaded_at = time.monotonic()
+        return self._counters
+
+    def max_page(self) -> int:
+        return math.ceil(len(self._fresh_counters()) / PAGE_SIZE) or 1
+
+    def __len__(self) -> int:
+        return len(self._fresh_counters())
+
+    async def page(self, guild: Guild, page: int) -> list[tuple[str, int]]:
+        """Names and counts on a page, pages start from 1"""
+        counters = self._fresh_counters()
+        if page < 1 or page > self.max_page():
+            raise IndexError(f"Page specified '{page}' does not exists. Max page available is '{self.max_page()}'")
+
+        if (guild.id, page) not in self._pages:
+            top = heapq.nlargest(PAGE_SIZE * page, counters.items(), key=itemgetter(1))[PAGE_SIZE * (page - 1):]
+            names = await self._resolve(guild, [int(user_id) for user_id, _ in top])
+            self._pages[(guild.id, page)] = [(names[int(user_id)], count) for user_id, count in top]
+        return self._pages[(guild.id, page)]
+
+    async def _resolve(self, guild: Guild, user_ids: list[int]) -> dict[int, str]:
+        """Names from the member cache, the members that aren't cached are requested together"""
+        members = {user_id: member for user_id in user_ids if (member := guild.get_member(user_id))}
+        missing = [user_id for user_id in user_ids if user_id not in members]
+        if missing:
+            try:
+                # not cached, the member cache only keeps members in voice and the page keeps the names anyway
+                for member in await guild.query_members(user_ids=missing[:QUERY_MEMBERS_LIMIT], cache=False):
+                    members[member.id] = member
+            except (ClientException, TimeoutError):  # no members intent, or the gateway didn't answer in time
+                pass
+
+        names = {}
+        for user_id in user_ids:
+            # the user may have left the guild, mentions in embeds show their name without pinging
+            user = members.get(user_id) or self.client.get_user(user_id)
+            names[user_id] = user.display_name if user else f'<@{user_id}>'
+        return names
@@ -0,0 +1,236 @@
+import os
+import sys
+import random
+import struct
+import asyncio
+import logging
+from array import array
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger("markov")
+
+START = 0  # token id before the first word
+END = 1  # token id after the last word
+MAX_STATES = 20000  # word pairs remembered per channel, the least recently seen are forgotten past it
+MAX_TOKENS = 2 * MAX_STATES  # words interned per channel before the ones forgotten pairs used are dropped
+MAX_FOLLOWERS = 64  # words remembered after a pair, a random one is replaced past it
+MAX_LOADED_CHANNELS = 256  # channel models in memory, the least recently used are saved and dropped past it
+MAX_WORDS = 50  # per generated reply
+MAX_WORD_LENGTH = 100
+
+MAGIC = b"FMK1"
+HEADER = struct.Struct("<4sQII")  # magic, guild id, token count, state count
+STATE = struct.Struct("<IIH")  # previous word id, word id, follower count
+
+
+class MarkovModel:
+    """Order 2 markov chain of a channel's messages
+
+    Words are interned to integer ids, and each pair of words maps to an array of the ids seen after it,
+    repeated as often as they were seen, so generating is a random.choice per word.
+    """
+
+    __slots__ = ('guild_id', 'tokens', 'ids', 'states', 'dirty')
+
+    def __init__(self, guild_id: Optional[int] = None):
+        self.guild_id: Optional[int] = guild_id
+        self.tokens: list[str] = ["", ""]  # id to word, START and END
+        self.ids: dict[str, int] = {}  # word to id
+        self.states: OrderedDict[int, array] = OrderedDict()  # pair of word ids to the ids after it, in LRU order
+        self.dirty: bool = False  # changed since last saved
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+    def _intern(self, word: str) -> int:
+        if (i := self.ids.get(word)) is None:
+            i = self.ids[word] = len(self.tokens)
+            self.tokens.append(word)
+        return i
+
+    def learn(self, content: str) -> None:
+        words = [word for word in content.split() if len(word) <= MAX_WORD_LENGTH]
+        if not words:
+            return
+
+        previous, current = START, START
+        for following in (*map(self._intern, words), END):
+            key = previous << 32 | current
+            if (followers := self.states.get(key)) is None:
+                followers = self.states[key] = array("I")
+                if len(self.states) > MAX_STATES:
+                    self.states.popitem(last=False)
+            else:
+                self.states.move_to_end(key)
+
+            if len(followers) < MAX_FOLLOWERS:
+                followers.append(following)
+            else:
+                followers[random.randrange(MAX_FOLLOWERS)] = following
+            previous, current = current, following
+        self.dirty = True
+        if len(self.tokens) > MAX_TOKENS:
+            self.compact()
+
+    def generate(self) -> str:
+        """A reply made of learnt word pairs, empty if nothing was learnt"""
+        words = []
+        previous, current = START, START
+        for _ in range(MAX_WORDS):
+            followers = self.states.get(previous << 32 | current)
+            if not followers:
+                break
+            following = random.choice(followers)
+            if following == END:
+                break
+            words.append(self.tokens[following])
+            previous, current = current, following
+        return " ".join(words)
+
+    def nbytes(self) -> int:
+        return (sum(map(sys.getsizeof, self.tokens)) + sys.getsizeof(self.ids) + sys.getsizeof(self.states)
+                + sum(followers.buffer_info()[1] * followers.itemsize + 64 for followers in self.states.values()))
+
+    def compact(self) -> None:
+        """Drop words only the forgotten pairs used, and renumber the rest"""
+        used = {START, END}
+        for key, followers in self.states.items():
+            used.update((key >> 32, key & 0xFFFFFFFF))
+            used.update(followers)
+        if len(used) == len(self.tokens):
+            return
+
+        kept = sorted(used)
+        remap = [0] * len(self.tokens)  # old id to new id
+        for new, old in enumerate(kept):
+            remap[old] = new
+        self.tokens = [self.tokens[old] for old in kept]
+        self.ids = {word: i for i, word in enumerate(self.tokens) if i > END}
+        self.states = OrderedDict(
+            (remap[key >> 32] << 32 | remap[key & 0xFFFFFFFF], array("I", map(remap.__getitem__, followers)))
+            for key, followers in self.states.items()
+        )
+
+    def snapshot(self) -> tuple[Optional[int], list[str], list[tuple[int, array]]]:
+        """Copies to encode in another thread while the model keeps learning, the follower arrays too since learning
+        appends to them in place. A slice of an array is a memcpy, a full model copies in a few milliseconds"""
+        return self.guild_id, self.tokens[:], [(key, followers[:]) for key, followers in self.states.items()]
+
+    def to_bytes(self) -> bytes:
+        return encode(*self.snapshot())
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "MarkovModel":
+        magic, guild_id, token_count, state_count = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError(f"Not a markov model, starts with {magic!r}")
+        model = cls(guild_id or None)
+
+        offset = HEADER.size
+        (length,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        if token_count:
+            model.tokens.extend(data[offset:offset + length].decode().split("\n"))
+        model.ids = {word: i for i, word in enumerate(model.tokens) if i > END}
+        offset += length
+
+        for _ in range(state_count):
+            previous, current, count = STATE.unpack_from(data, offset)
+            offset += STATE.size
+            followers = array("I")
+            followers.frombytes(data[offset:offset + count * followers.itemsize])
+            if sys.byteorder != "little":
+                followers.byteswap()
+            offset += count * followers.itemsize
+            model.states[previous << 32 | current] = followers
+        return model
+
+
+def encode(guild_id: Optional[int], tokens: list[str], states: list[tuple[int, array]]) -> bytes:
+    words = "\n".join(tokens[END + 1:]).encode()
+    parts = [HEADER.pack(MAGIC, guild_id or 0, len(tokens) - END - 1, len(states)), struct.pack("<I", len(words)), words]
+    for key, followers in states:  # oldest first, so the LRU order survives
+        parts.append(STATE.pack(key >> 32, key & 0xFFFFFFFF, len(followers)))
+        parts.append(followers.tobytes() if sys.byteorder == "little" else byteswapped(followers))
+    return b"".join(parts)
+
+
+def byteswapped(followers: array) -> bytes:
+    swapped = array("I", followers)
+    swapped.byteswap()
+    return swapped.tobytes()
+
+
+class MarkovModels:
+    """Markov models of every channel, loaded from disk on first use and saved when dropped from memory"""
+
+    def __init__(self, directory: str):
+        self.directory: str = directory
+        self._models: OrderedDict[int, MarkovModel] = OrderedDict()  # channel id to model, in LRU order
+        self._loading: dict[int, asyncio.Task] = {}
+        self._saving: dict[int, asyncio.Task] = {}  # evicted models still being written
+        os.makedirs(directory, exist_ok=True)
+
+    def __iter__(self):
+        return iter(self._models.items())
+
+    def _path(self, channel_id: int) -> str:
+        return os.path.join(self.directory, f"{channel_id}.bin")
+
+    def _load_sync(self, channel_id: int, guild_id: Optional[int]) -> MarkovModel:
+        try:
+            with open(self._path(channel_id), "rb") as f:
+                return MarkovModel.from_bytes(f.read())
+        except FileNotFoundError:
+            return MarkovModel(guild_id)
+        except (ValueError, struct.error, UnicodeDecodeError):
+            logger.exception(f"Corrupted markov model of channel {channel_id}, starting over")
+            return MarkovModel(guild_id)
+
+    def _save_sync(self, channel_id: int, snapshot: tuple) -> None:
+        data = encode(*snapshot)
+        path = self._path(channel_id)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)  # never leaves a half written model behind
+
+    async def get(self, channel_id: int, guild_id: Optional[int] = None) -> MarkovModel:
+        if (model := self._models.get(channel_id)) is not None:
+            self._models.move_to_end(channel_id)
+            return model
+
+        if (saving := self._saving.get(channel_id)) is not None:  # evicted a moment ago, read what it wrote
+            await asyncio.shield(saving)
+
+        # concurrent messages of the same channel wait on the same load
+        if channel_id not in self._loading:
+            self._loading[channel_id] = asyncio.create_task(asyncio.to_thread(self._load_sync, channel_id, guild_id))
+        try:
+            model = await asyncio.shield(self._loading[channel_id])
+        finally:
+            self._loading.pop(channel_id, None)
+
+        if channel_id not in self._models:
+            self._models[channel_id] = model
+            while len(self._models) > MAX_LOADED_CHANNELS:
+                evicted_id, evicted = self._models.popitem(last=False)
+                if evicted.dirty:
+                    self._saving[evicted_id] = asyncio.create_task(self._save_evicted(evicted_id, evicted.snapshot()))
+        return self._models[channel_id]
+
+    async def _save_evicted(self, channel_id: int, snapshot: tuple) -> None:
+        try:
+            await asyncio.to_thread(self._save_sync, channel_id, snapshot)
+        finally:
+            self._saving.pop(channel_id, None)
+
+    async def save(self) -> int:
+        """Save the models changed since last saved, returns how many were saved"""
+        dirty = [(channel_id, model) for channel_id, model in self._models.items() if model.dirty]
+        for channel_id, model in dirty:
+            snapshot = model.snapshot()
+            model.dirty = False
+            await asyncio.to_thread(self._save_sync, channel_id, snapshot)
+        await asyncio.gather(*self._saving.values())
+        return len(dirty)
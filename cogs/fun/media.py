@@ -0,0 +1,85 @@
+import os
+import io
+import time
+import asyncio
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+
+import discord
+from discord.ext.commands import Context
+
+DEFAULT_URL_LIFETIME = 86400  # in seconds, for urls without an expiry
+EXPIRY_MARGIN = 3600  # in seconds, urls this close to expiring are uploaded again instead
+
+
+def url_expiry(url: str) -> float:
+    """Unix time the signed CDN url expires at, its ex parameter in hex"""
+    try:
+        return int(parse_qs(urlparse(url).query)['ex'][0], 16)
+    except (KeyError, IndexError, ValueError):
+        return time.time() + DEFAULT_URL_LIFETIME
+
+
+def read_file(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@dataclass(slots=True)
+class Uploaded:
+    url: str
+    message_id: int  # the url stops working if this message is deleted
+    expires_at: float  # in unix time
+
+
+class MediaCache:
+    """Local media uploaded once, then sent again as its CDN url until it expires
+
+    The files are read into memory the first time, so uploading again never reads the disk.
+    """
+
+    __slots__ = ('_files', '_uploaded', 'uploads', 'reuses', 'bytes_uploaded', 'bytes_saved')
+
+    def __init__(self):
+        self._files: dict[str, bytes] = {}  # path to content
+        self._uploaded: dict[str, Uploaded] = {}  # path to its latest upload
+        self.uploads: int = 0
+        self.reuses: int = 0
+        self.bytes_uploaded: int = 0
+        self.bytes_saved: int = 0
+
+    def nbytes(self) -> int:
+        return sum(map(len, self._files.values()))
+
+    async def _read(self, path: str) -> bytes:
+        if (data := self._files.get(path)) is None:
+            data = self._files[path] = await asyncio.to_thread(read_file, path)
+        return data
+
+    def _valid_url(self, path: str) -> Optional[str]:
+        uploaded = self._uploaded.get(path)
+        if uploaded is None or uploaded.expires_at - EXPIRY_MARGIN < time.time():
+            return None
+        return uploaded.url
+
+    def forget(self, message_ids: set[int]) -> None:
+        """Drop the urls of deleted messages, they stopped working"""
+        for path, uploaded in list(self._uploaded.items()):
+            if uploaded.message_id in message_ids:
+                del self._uploaded[path]
+
+    async def reply(self, ctx: Context, path: str) -> discord.Message:
+        data = await self._read(path)
+        if (url := self._valid_url(path)) is not None:
+            self.reuses += 1
+            self.bytes_saved += len(data)
+            return await ctx.reply(url)
+
+        msg = await ctx.reply(file=discord.File(io.BytesIO(data), filename=os.path.basename(path)))
+        self.uploads += 1
+        self.bytes_uploaded += len(data)
+        if msg.attachments:
+            url = msg.attachments[0].url
+            self._uploaded[path] = Uploaded(url, msg.id, url_expiry(url))
+        return msg
@@ -0,0 +1,83 @@
+import re
+import random
+from typing import Callable, Iterator, Optional
+
+CHARACTER_LIMIT = 2000
+UWU_FACES = (' OwO', ' UwU', ' :3', '')
+
+
+class TextTransform:
+    """A text filter made of character substitutions and one regex pass for anything context dependent
+
+    Every step runs in C over the whole text, the only python per match is the replacement callback.
+    """
+
+    __slots__ = ('substitutions', 'table', 'pattern', 'replace')
+
+    def __init__(
+            self,
+            substitutions: Optional[dict[str, str]] = None,
+            pattern: Optional[str] = None,
+            replace: Optional[str | Callable[[re.Match], str]] = None):
+        """
+        :param: substitutions <dict[str, str]> - characters to the text replacing them
+        :param: pattern <str> - regex matched after the substitutions
+        :param: replace <str> - replacement template for every match of the pattern, as in re.sub
+                        <Callable[[re.Match], str]> - or a function returning the replacement of a match
+        """
+        assert (pattern is None) == (replace is None), "A pattern needs a replacement and the other way around"
+        substitutions = substitutions or {}
+        # a str.replace per character beats str.translate by far unless the text is ascii and the table 1 to 1,
+        # but it only gives the same result if no substitution puts back a character that is substituted after it
+        characters = list(substitutions)
+        if any(later in substitutions[character]
+               for i, character in enumerate(characters) for later in characters[i + 1:]):
+            self.substitutions: tuple[tuple[str, str], ...] = ()
+            self.table: Optional[dict[int, str]] = str.maketrans(substitutions)
+        else:
+            self.substitutions = tuple(substitutions.items())
+            self.table = None
+        self.pattern: Optional[re.Pattern] = re.compile(pattern) if pattern else None
+        self.replace = replace
+
+    def __call__(self, text: str) -> str:
+        for old, new in self.substitutions:
+            text = text.replace(old, new)
+        if self.table:
+            text = text.translate(self.table)
+        if self.pattern:
+            text = self.pattern.sub(self.replace, text)
+        return text
+
+
+def split_message(text: str, limit: int = CHARACTER_LIMIT) -> Iterator[str]:
+    """Split text into messages of at most limit characters, on line breaks or spaces where possible"""
+    start = 0
+    while len(text) - start > limit:
+        end = start + limit
+        i = text.rfind('\n', start, end)
+        if i <= start:
+            i = text.rfind(' ', start, end)
+        if i <= start:  # a single word longer than the limit
+            yield text[start:end]
+            start = end
+        else:
+            yield text[start:i]
+            start = i + 1  # the separator is dropped
+    yield text[start:]
+
+
+owo = TextTransform(
+    {'l': 'w', 'r': 'w', 'L': 'W', 'R': 'W', 'h': 'hw', 'H': 'Hw'},
+    r'[.,]',
+    lambda match: UWU_FACES[random.getrandbits(2)] + match[0]  # 2 random bits pick one of the 4 faces
+)
+
+# every other letter, counted across words
+mock = TextTransform(
+    pattern=r'([^\W\d_])([\W\d_]*)([^\W\d_]?)',
+    replace=lambda match: match[1].lower() + match[2] + match[3].upper()
+)
+
+leet = TextTransform({'a': '4', 'A': '4', 'e': '3', 'E': '3', 'i': '1', 'I': '1', 'o': '0', 'O': '0',
+                      's': '5', 'S': '5', 't': '7', 'T': '7'})
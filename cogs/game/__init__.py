@@ -1,6 +1,8 @@
 from cogs.game.minesweeper import Minesweeper
 from discord.ext import commands
+from admission import HEAVY
 import numpy as np
+import asyncio
 from typing import Iterator
 
 
@@ -12,12 +14,15 @@ def translate_board_on_dict(board: np.ndarray, dictionary: dict) -> np.ndarray:
 
 
 class Game(commands.Cog):
+    admission_priority = HEAVY  # board renders
     def __init__(self, bot):
         self.bot = bot
 
-    @commands.command()
-    async def minesweeper(self, ctx, width: int = 10, height: int = 10, mines: int | float = 20, starting_row: int = None, starting_column: int = None):
+    @commands.hybrid_command()
+    async def minesweeper(self, ctx, width: int = 10, height: int = 10, mines: float = 20, starting_row: int = None, starting_column: int = None):
         """Generate a minesweeper board"""
+        if mines >= 1:  # application commands have no int or float option, counts still have to be ints
+            mines = int(mines)
         try:
             board = Minesweeper(width, height, mines=mines, starting_tile=(starting_row, starting_column) if starting_row and starting_column else None)
         except AssertionError as e:
@@ -47,17 +52,23 @@ class Game(commands.Cog):
 
         final_msg = ""
         line = ""
+        chunks = []
         for msg in flatten_to_string(readable_board, wrapper="||"):
             line += msg
 
             if msg == "\n":
                 if len(final_msg) + len(line) > CHARACTER_LIMIT:
-                    await ctx.send(final_msg)
+                    chunks.append(final_msg)
                     final_msg = ""
 
                 final_msg += line
                 line = ""
-        await ctx.send(final_msg)
+        chunks.append(final_msg)
+
+        if ctx.interaction is not None:  # interactions need a response, the rest goes on the dispatcher like usual
+            await ctx.send(chunks.pop(0))
+        # queued on the dispatcher so the chunks are paced to the channel's rate limit
+        await asyncio.gather(*(self.bot.dispatcher.send(ctx.channel, content=chunk) for chunk in chunks))
 
 async def setup(bot):
     await bot.add_cog(Game(bot))
@@ -1,40 +1,195 @@
 from discord import Embed, Reaction, Member, \
-    ClientException
-from discord.ext import commands
+    ClientException, Interaction, app_commands
+from discord.ext import commands, tasks
 from discord.ext.commands import Cog, Bot, Context
 from wavelink import Node, Pool, Queue, Player, Playable, Playlist, Search, Filters, \
-    TrackStartEventPayload, NodeReadyEventPayload, \
-    QueueMode, AutoPlayMode, TrackSource
-from .utils import tm
+    TrackStartEventPayload, TrackEndEventPayload, NodeReadyEventPayload, \
+    QueueMode, AutoPlayMode, Album, Artist, StatsResponsePayload
+from .utils import tm, md_embed_link
 from .embed import QueueEmbed
+from .search import SearchCache
+from .filters import FilterUpdates, PRESETS, DEFAULT_VOLUME, preset
+from .history import ListeningHistory, Play, Period, PERIODS, AUTOPLAY_REQUESTER
 import itertools
 import asyncio
+import json
+import time
 import os
 
 from typing import cast, Optional
 import logging
+from metrics import sample_name
+from admission import CRITICAL, HEAVY, NORMAL
+from memory import Usage, approx_sizeof, add_usage
 
 logger = logging.getLogger("music")
 
+AUTOCOMPLETE_MIN_LENGTH = 3  # shorter queries aren't worth a search
+AUTOCOMPLETE_CHOICES = 25  # discord's limit
+CHOICE_LENGTH = 100  # discord's limit for both names and values
+HISTORY_FLUSH_INTERVAL = 60  # in seconds, plays short of a full batch wait at most this long to be written
+AUTOPLAY_SEEDS = 3  # most played tracks of the guild put in a new player's autoplay queue
+NODE_STATS_TTL = 30  # in seconds, scrapes within it reuse a node's stats instead of asking lavalink again
+
+
+async def acknowledge(ctx: Context) -> None:
+    """React to the command message, interactions have no message to react to so they get an ephemeral reply"""
+    if ctx.interaction is None:
+        await ctx.message.add_reaction("\u2705")
+    else:
+        await ctx.send("\u2705", ephemeral=True)
+
+
+def requested(track: Playable, requester_id: int) -> Playable:
+    """A copy of the track tagged with who requested it, search results are cached and shared between guilds"""
+    copy = Playable(data=track.raw_data)
+    copy.extras = {**dict(track.extras), "requester_id": requester_id}
+    return copy
+
 
 class Music(Cog):
+    admission_priority = CRITICAL  # controls, searches are heavy
+
     def __init__(self, bot: Bot):
         self.bot: Bot = bot
+        self.search_cache: SearchCache = SearchCache()
+        self.filter_updates: FilterUpdates = FilterUpdates()
+        self.history: ListeningHistory = ListeningHistory(bot.store.path)
+        self._playing: dict[int, tuple[Playable, float]] = {}  # guild id to its track and when it started, unix time
+        self._handed_over: bool = False
+        # node to when its stats were fetched and them, None if it couldn't be reached
+        self._node_stats: dict[str, tuple[float, Optional[StatsResponsePayload]]] = {}
 
     async def cog_load(self) -> None:
-        nodes = [Node(
-            uri="http://lavalink:2333",
-            password=os.getenv("LAVALINK_SERVER_PASSWORD")
-        )]
-        await Pool.connect(nodes=nodes, client=self.bot, cache_capacity=100)
+        if not Pool.nodes:  # still connected if the cog was hot reloaded
+            nodes = [Node(
+                uri="http://lavalink:2333",
+                password=os.getenv("LAVALINK_SERVER_PASSWORD")
+            )]
+            await Pool.connect(nodes=nodes, client=self.bot, cache_capacity=100)
+        self.bot.metrics.add_collector("wavelink", self.collect_metrics)
+        self.bot.memory.add_accountant("music.queues", self.account_memory)
+        self.bot.memory.add_accountant("music.search_cache", self.account_search_cache)
+        self.flush_history.start()
 
     async def cog_unload(self) -> None:
-        await Pool.close()
+        await self.filter_updates.flush()
+        self.flush_history.cancel()
+        if not self._handed_over:
+            for guild_id in list(self._playing):
+                self.finish_play(guild_id)
+        await self.history.flush()
+        self.history.close()
+        self.bot.metrics.remove_collector("wavelink")
+        self.bot.memory.remove_accountant("music.queues")
+        self.bot.memory.remove_accountant("music.search_cache")
+        if not self._handed_over:
+            for node in Pool.nodes.values():
+                await node.close(eject=True)  # ejected, so loading the cog again connects a new one
+
+    def export_state(self) -> dict:
+        """Players and their queues live on the voice clients, keeping the nodes connected is all it takes to
+        hand them over, lavalink keeps streaming to discord in the meantime"""
+        self._handed_over = True
+        return {"playing": {
+            guild_id: ({**track.raw_data, "userData": dict(track.extras)}, started_at)  # raw_data misses set extras
+            for guild_id, (track, started_at) in self._playing.items()
+        }}
+
+    def import_state(self, state: dict) -> None:
+        for guild_id, (data, started_at) in state.get("playing", {}).items():
+            self._playing.setdefault(guild_id, (Playable(data=data), started_at))
+
+    @staticmethod
+    def account_memory() -> Usage:
+        """Tracks held in each player's queue, history and autoplay queue"""
+        usage: Usage = {}
+        for node in Pool.nodes.values():
+            for guild_id, player in node.players.items():
+                tracks = [*player.queue, *(player.queue.history or ()), *player.auto_queue]
+                size = sum(approx_sizeof(track, depth=3, follow=(Playable, Album, Artist)) for track in tracks)
+                add_usage(usage, guild_id, len(tracks), size)
+        return usage
+
+    def account_search_cache(self) -> Usage:
+        tracks = self.search_cache.tracks()
+        return {None: (len(tracks), sum(approx_sizeof(track, depth=3, follow=(Playable, Album, Artist)) for track in tracks))}
+
+    async def collect_metrics(self) -> dict[str, float]:
+        samples = {
+            "music_search_cache_entries": len(self.search_cache),
+            "music_search_cache_hits_total": self.search_cache.hits,
+            "music_search_cache_misses_total": self.search_cache.misses,
+            "music_filter_changes_total": self.filter_updates.changes,
+            "music_filter_updates_total": self.filter_updates.updates,
+            "music_filter_updates_saved_total": self.filter_updates.saved,
+            "music_history_plays_total": self.history.recorded,
+            "music_history_pending_plays": len(self.history.pending),
+        }
+        for identifier, node in Pool.nodes.items():
+            samples[sample_name("wavelink_players", node=identifier)] = len(node.players)
+            stats = await self.node_stats(identifier, node)
+            samples[sample_name("lavalink_up", node=identifier)] = int(stats is not None)
+            if stats is None:  # the other samples still get scraped
+                continue
+            samples[sample_name("lavalink_players", node=identifier)] = stats.players
+            samples[sample_name("lavalink_playing_players", node=identifier)] = stats.playing
+            samples[sample_name("lavalink_memory_used_bytes", node=identifier)] = stats.memory.used
+            samples[sample_name("lavalink_cpu_load", node=identifier)] = stats.cpu.lavalink_load
+        return samples
+
+    async def node_stats(self, identifier: str, node: Node) -> Optional[StatsResponsePayload]:
+        """The node's stats, asked from lavalink at most once per NODE_STATS_TTL. None while it can't be reached"""
+        now = time.monotonic()
+        if (cached := self._node_stats.get(identifier)) is not None and now - cached[0] < NODE_STATS_TTL:
+            return cached[1]
+        try:
+            stats = await node.fetch_stats()
+        except Exception as e:
+            logger.warning(f"Could not fetch the stats of lavalink node {identifier}: {e!r}")
+            stats = None
+        self._node_stats[identifier] = (now, stats)
+        return stats
 
     @Cog.listener()
     async def on_wavelink_node_ready(self, payload: NodeReadyEventPayload) -> None:
         logger.info("Wavelink Node connected: %r | Resumed: %s", payload.node, payload.resumed)
 
+    def finish_play(self, guild_id: int) -> None:
+        """Record the guild's playing track to the history, listened for the time since it started"""
+        if (playing := self._playing.pop(guild_id, None)) is None:
+            return
+        track, started_at = playing
+        self.history.record(Play(
+            guild_id=guild_id,
+            requester_id=dict(track.extras).get("requester_id", AUTOPLAY_REQUESTER),
+            identifier=track.identifier,
+            title=track.title,
+            author=track.author,
+            uri=track.uri,
+            data=json.dumps({**track.raw_data, "userData": {}}),  # seeds played again aren't anyone's request
+            started_at=int(started_at),
+            seconds=int(min(time.time() - started_at, track.length / 1000)),  # pauses count too
+        ))
+
+    @tasks.loop(seconds=HISTORY_FLUSH_INTERVAL)
+    async def flush_history(self) -> None:
+        try:
+            await self.history.flush()
+        except Exception:
+            logger.exception("Could not write the listening history, the batch was dropped")
+
+    async def seed_autoplay(self, player: Player) -> None:
+        """Start a new player's autoplay from the guild's favourite tracks, instead of only the first one requested"""
+        seeds = await self.history.seeds(player.guild.id, AUTOPLAY_SEEDS)
+        for data in seeds:
+            player.auto_queue.put(Playable(data=data))
+
+    @Cog.listener()
+    async def on_wavelink_track_end(self, payload: TrackEndEventPayload) -> None:
+        if payload.player:
+            self.finish_play(payload.player.guild.id)
+
     @Cog.listener()
     async def on_wavelink_track_start(self, payload: TrackStartEventPayload) -> None:
         player: Player | None = payload.player
@@ -45,6 +200,9 @@ class Music(Cog):
         original: Playable | None = payload.original
         track: Playable = payload.track
 
+        self.finish_play(player.guild.id)  # in case the previous track's end event never came
+        self._playing[player.guild.id] = (original or track, time.time())  # the original has the requester
+
         embed: Embed = Embed(title="Now Playing")
         embed.description = f"**{track.title}** by `{track.author}`"
 
@@ -59,11 +217,25 @@ class Music(Cog):
 
         await player.home.send(embed=embed, silent=True)
 
-    @commands.command(aliases=['p'])
+    async def check_home(self, ctx: Context, player: Player) -> bool:
+        """Set the channel the player sends updates to, returns False if the guild locks it to another channel"""
+        if not hasattr(player, "home"):
+            player.home = ctx.channel
+        elif player.home != ctx.channel:
+            if self.bot.guild_settings.get(ctx.guild.id).music_home_policy == "follow":
+                player.home = ctx.channel
+            else:
+                await ctx.send(
+                    f"You can only play songs in {player.home.mention}, as the player has already started there.")
+                return False
+        return True
+
+    @commands.hybrid_command(aliases=['p'], extras={"priority": HEAVY})
     async def play(self, ctx: Context, *, query: str):
         """Play a song"""
         if not ctx.guild:
             return
+        await ctx.defer()  # searching can take longer than an interaction can wait for a response
 
         player: Player
         player = cast(Player, ctx.voice_client)  # type: ignore
@@ -77,39 +249,51 @@ class Music(Cog):
             except ClientException:
                 await ctx.send("I was unable to join this voice channel. Please try again.")
                 return
+            await self.seed_autoplay(player)
 
         player.autoplay = AutoPlayMode.enabled
 
-        # Lock the player to this channel...
-        if not hasattr(player, "home"):
-            player.home = ctx.channel
-        elif player.home != ctx.channel:
-            await ctx.send(
-                f"You can only play songs in {player.home.mention}, as the player has already started there.")
+        if not await self.check_home(ctx, player):
             return
 
-        tracks: Search = await Playable.search(query, source=TrackSource.YouTube)
+        tracks: Search = await self.search_cache.search(query)
         if not tracks:
             await ctx.send(f"{ctx.author.mention} - Could not find any tracks with that query. Please try again.")
             return
 
         if isinstance(tracks, Playlist):
             # tracks is a playlist...
-            added: int = await player.queue.put_wait(tracks)
+            added: int = await player.queue.put_wait([requested(track, ctx.author.id) for track in tracks])
             await ctx.send(f"Added the playlist **`{tracks.name}`** ({added} songs) to the queue.")
         else:
-            track: Playable = tracks[0]
+            track: Playable = requested(tracks[0], ctx.author.id)
             await player.queue.put_wait(track)
             await ctx.send(f"Added **`{track}`** to the queue.")
 
         if not player.playing:
             # Play now since we aren't playing anything...
-            await player.play(player.queue.get(), volume=30)
+            await player.play(player.queue.get(), volume=DEFAULT_VOLUME)
+
+    @play.autocomplete("query")
+    async def play_autocomplete(self, interaction: Interaction, current: str) -> list[app_commands.Choice[str]]:
+        """Suggest search results, picking one plays that exact track"""
+        if len(current) < AUTOCOMPLETE_MIN_LENGTH:
+            return []
+
+        tracks: Search = await self.search_cache.search(current)
+        if isinstance(tracks, Playlist):
+            return [app_commands.Choice(name=f"Playlist: {tracks.name}"[:CHOICE_LENGTH], value=current[:CHOICE_LENGTH])]
+        return [
+            app_commands.Choice(name=f"{track.title} - {track.author}"[:CHOICE_LENGTH], value=track.uri)
+            for track in tracks[:AUTOCOMPLETE_CHOICES] if track.uri and len(track.uri) <= CHOICE_LENGTH
+        ]
 
-    @commands.command()
+    @commands.hybrid_command(extras={"priority": HEAVY})
     async def search(self, ctx: Context, number_of_results: Optional[int] = 10, *, query: str):
+        """Search for a song, then reply with the number of the one to play"""
         if not ctx.guild:
             return
+        await ctx.defer()
 
         player: Player
         player = cast(Player, ctx.voice_client)  # type: ignore
@@ -123,18 +307,14 @@ class Music(Cog):
             except ClientException:
                 await ctx.send("I was unable to join this voice channel. Please try again.")
                 return
+            await self.seed_autoplay(player)
 
         player.autoplay = AutoPlayMode.enabled
 
-        # Lock the player to this channel...
-        if not hasattr(player, "home"):
-            player.home = ctx.channel
-        elif player.home != ctx.channel:
-            await ctx.send(
-                f"You can only play songs in {player.home.mention}, as the player has already started there.")
+        if not await self.check_home(ctx, player):
             return
 
-        tracks: Search = await Playable.search(query, source=TrackSource.YouTube)
+        tracks: Search = await self.search_cache.search(query)
 
         if not tracks:
             await ctx.send(f"{ctx.author.mention} - Could not find any search results. Please try again.")
@@ -176,16 +356,16 @@ class Music(Cog):
             if response.content == 'cancel':
                 return
 
-        track: Playable = tracks[int(response.content) - 1]
+        track: Playable = requested(tracks[int(response.content) - 1], ctx.author.id)
         await player.queue.put_wait(track)
         await ctx.send(f"Added **`{track}`** to the queue.")
 
         if not player.playing:
             # Play now since we aren't playing anything...
-            await player.play(player.queue.get(), volume=30)
+            await player.play(player.queue.get(), volume=DEFAULT_VOLUME)
 
 
-    @commands.command(aliases=['s'])
+    @commands.hybrid_command(aliases=['s'])
     async def skip(self, ctx: Context):
         """Skip the current song"""
         player: Player = cast(Player, ctx.voice_client)
@@ -193,22 +373,44 @@ class Music(Cog):
             return
 
         await player.skip(force=True)
-        await ctx.message.add_reaction("\u2705")
+        await acknowledge(ctx)
 
-    @commands.command()
+    @commands.hybrid_command()
     async def speed(self, ctx: Context, speed: int = 100):
-        """Change player volume, in percentages"""
+        """Change player speed, in percentages"""
         player: Player = cast(Player, ctx.voice_client)
         if not player:
             return
 
-        filters: Filters = player.filters
-        filters.timescale.set(pitch=1, speed=speed / 100, rate=1)
-        await player.set_filters(filters)
+        def set_speed(filters: Filters) -> None:
+            filters.timescale.set(pitch=1, speed=speed / 100, rate=1)
 
-        await ctx.message.add_reaction("\u2705")
+        await self.filter_updates.change(player, set_speed)
+        await acknowledge(ctx)
+
+    @commands.hybrid_command(name="filter", aliases=["preset"])
+    async def filter_preset(self, ctx: Context, name: str):
+        """Apply a filter preset, none resets the filters"""
+        player: Player = cast(Player, ctx.voice_client)
+        if not player:
+            return
+        if name not in PRESETS:
+            await ctx.reply(f"Preset can only be one of {', '.join(PRESETS)}")
+            return
+
+        def apply(filters: Filters) -> Filters:
+            filters_ = preset(name)
+            filters_.volume = filters.volume  # the volume isn't part of the sound
+            return filters_
 
-    @commands.command(aliases=["resume"])
+        await self.filter_updates.change(player, apply)
+        await acknowledge(ctx)
+
+    @filter_preset.autocomplete("name")
+    async def filter_preset_autocomplete(self, interaction: Interaction, current: str) -> list[app_commands.Choice[str]]:
+        return [app_commands.Choice(name=name, value=name) for name in PRESETS if name.startswith(current.casefold())]
+
+    @commands.hybrid_command(aliases=["resume"])
     async def pause(self, ctx: Context) -> None:
         """Pause or resume playing."""
         player: Player = cast(Player, ctx.voice_client)
@@ -216,19 +418,23 @@ class Music(Cog):
             return
 
         await player.pause(not player.paused)
-        await ctx.message.add_reaction("\u2705")
+        await acknowledge(ctx)
 
-    @commands.command()
+    @commands.hybrid_command()
     async def volume(self, ctx: Context, volume: int = 100):
         """Change player volume, 1 - 100"""
         player: Player = cast(Player, ctx.voice_client)
         if not player:
             return
 
-        await player.set_volume(volume)
-        await ctx.message.add_reaction("\u2705")
+        def set_volume(filters: Filters) -> None:
+            # the volume filter scales the volume every track starts at, so it merges with the other filter changes
+            filters.volume = volume / DEFAULT_VOLUME
+
+        await self.filter_updates.change(player, set_volume)
+        await acknowledge(ctx)
 
-    @commands.command(aliases=["dc"])
+    @commands.hybrid_command(aliases=["dc"])
     async def disconnect(self, ctx: Context):
         """Disconnect the player"""
         player: Player = cast(Player, ctx.voice_client)
@@ -236,9 +442,10 @@ class Music(Cog):
             return
 
         await player.disconnect()
-        await ctx.message.add_reaction("\u2705")
+        self.finish_play(ctx.guild.id)
+        await acknowledge(ctx)
 
-    @commands.command()
+    @commands.hybrid_command()
     async def stop(self, ctx: Context):
         """Disconnect and clear the player"""
         player: Player = cast(Player, ctx.voice_client)
@@ -247,9 +454,10 @@ class Music(Cog):
 
         await player.disconnect()
         player.queue.reset()
-        await ctx.message.add_reaction("\u2705")
+        self.finish_play(ctx.guild.id)
+        await acknowledge(ctx)
 
-    @commands.command()
+    @commands.hybrid_command()
     async def shuffle(self, ctx: Context):
         """Shuffle the queue"""
         player: Player = cast(Player, ctx.voice_client)
@@ -257,9 +465,9 @@ class Music(Cog):
             return
 
         player.queue.shuffle()
-        await ctx.message.add_reaction("\u2705")
+        await acknowledge(ctx)
 
-    @commands.command(aliases=["ss"])
+    @commands.hybrid_command(aliases=["ss"])
     async def seek(self, ctx: Context, seconds: float):
         """Seek to a timestamp in the current song"""
         player: Player = cast(Player, ctx.voice_client)
@@ -270,7 +478,7 @@ class Music(Cog):
         await player.seek(ms)
         await ctx.reply(f'Seeked to `{seconds:.2f}` seconds')
 
-    @commands.command(aliases=["mv"])
+    @commands.hybrid_command(aliases=["mv"])
     async def move(self, ctx: Context, song_position: int, ending_position: int):
         """Move song from one position to another"""
         player: Player = cast(Player, ctx.voice_client)
@@ -286,7 +494,7 @@ class Music(Cog):
         player.queue.put_at(ending_position - 1, moved_song)
         await ctx.reply(f'Moved `{moved_song.title}` to position `{ending_position}`')
 
-    @commands.command(aliases=["rm"])
+    @commands.hybrid_command(aliases=["rm"])
     async def remove(self, ctx: Context, position: int):
         """Remove the song on a specified position"""
         player: Player = cast(Player, ctx.voice_client)
@@ -301,7 +509,7 @@ class Music(Cog):
             return
         await ctx.reply(f'Removed `{removed.title}`')
 
-    @commands.command(aliases=["cls"])
+    @commands.hybrid_command(aliases=["cls"])
     async def clear(self, ctx: Context):
         """Clear queue. Doesn't affect current playing song"""
         player: Player = cast(Player, ctx.voice_client)
@@ -311,7 +519,7 @@ class Music(Cog):
         player.queue.clear()
         await ctx.reply("Queue cleared")
 
-    @commands.command()
+    @commands.hybrid_command()
     async def loop(self, ctx: Context):
         """Toggle between loop modes"""
         player: Player = cast(Player, ctx.voice_client)
@@ -330,7 +538,7 @@ class Music(Cog):
                 queue.mode = QueueMode.loop
                 await ctx.reply("Looping off. :red_circle:")
 
-    @commands.command(aliases=["np"])
+    @commands.hybrid_command(aliases=["np"])
     async def now_playing(self, ctx: Context):
         """Show the playing song information and progress"""
         player: Player = cast(Player, ctx.voice_client)
@@ -350,7 +558,7 @@ class Music(Cog):
             inline=False)
         await ctx.reply(embed=embed)
 
-    @commands.command(aliases=['q'])
+    @commands.hybrid_command(aliases=['q'])
     async def queue(self, ctx: Context, page: int = 1):
         """Show the queue in embed form with pages"""
         player: Player = cast(Player, ctx.voice_client)
@@ -394,12 +602,65 @@ class Music(Cog):
                 new_page = page + 1
 
             try:
-                await msg.edit(embed=queue_embed.get_page(new_page))
+                embed = queue_embed.get_page(new_page)
             except IndexError:
                 pass
             else:
+                # fast page flipping only sends the last page
+                self.bot.dispatcher.edit(msg, embed=embed)
                 page = new_page
 
+    @commands.hybrid_group(name="history", fallback="time", invoke_without_command=True, extras={"priority": NORMAL})
+    @commands.guild_only()
+    async def history_group(self, ctx: Context, period: Period = "week"):
+        """How long music played in the server"""
+        start = time.perf_counter()
+        plays, seconds = await self.history.listening_time(ctx.guild.id, PERIODS[period])
+        embed = Embed(
+            title=f"Listening time {period_label(period)}",
+            description=f"`{tm.from_millis(seconds * 1000)}` over {plays} tracks"
+        )
+        embed.set_footer(text=f"in {(time.perf_counter() - start) * 1000:.1f}ms")
+        await ctx.reply(embed=embed)
+
+    @history_group.command(name="tracks")
+    @commands.guild_only()  # slash subcommands don't run the group's checks
+    async def history_tracks(self, ctx: Context, period: Period = "week"):
+        """Most played tracks in the server"""
+        start = time.perf_counter()
+        tracks = await self.history.top_tracks(ctx.guild.id, PERIODS[period])
+        embed = Embed(
+            title=f"Top tracks {period_label(period)}",
+            description="\n".join(
+                f"`{i}.` {md_embed_link(track.title, track.uri) if track.uri else track.title} by `{track.author}` "
+                f"- {track.plays} plays, `{tm.from_millis(track.seconds * 1000)}`"
+                for i, track in enumerate(tracks, start=1)
+            ) or "Nothing played yet"
+        )
+        embed.set_footer(text=f"in {(time.perf_counter() - start) * 1000:.1f}ms")
+        await ctx.reply(embed=embed)
+
+    @history_group.command(name="requesters")
+    @commands.guild_only()
+    async def history_requesters(self, ctx: Context, period: Period = "week"):
+        """Members who requested the most music in the server"""
+        start = time.perf_counter()
+        requesters = await self.history.top_requesters(ctx.guild.id, PERIODS[period])
+        embed = Embed(
+            title=f"Top requesters {period_label(period)}",
+            description="\n".join(
+                f"`{i}.` <@{requester.requester_id}> - {requester.plays} tracks, "
+                f"`{tm.from_millis(requester.seconds * 1000)}`"
+                for i, requester in enumerate(requesters, start=1)
+            ) or "Nothing requested yet"
+        )
+        embed.set_footer(text=f"in {(time.perf_counter() - start) * 1000:.1f}ms")
+        await ctx.reply(embed=embed)
+
+
+def period_label(period: str) -> str:
+    return "of all time" if period == "all" else f"of the last {period}"
+
 
 async def setup(bot):
     await bot.add_cog(Music(bot))
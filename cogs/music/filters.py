@@ -0,0 +1,92 @@
+from wavelink import Player, Filters, Equalizer, Timescale, Karaoke, Rotation, Tremolo, LowPass
+
+import asyncio
+import logging
+from typing import Callable, Optional
+
+logger = logging.getLogger("music")
+
+DEFAULT_VOLUME = 30  # player volume every track starts at, the volume command scales it with the volume filter
+FILTER_WINDOW = 0.5  # in seconds, filter changes of a player within it go to lavalink as one update
+
+
+def _bass(*gains: float) -> Equalizer:
+    return Equalizer().set(bands=[{"band": band, "gain": gain} for band, gain in enumerate(gains)])
+
+
+# built once, applying one copies it so the player's filters never share objects with the preset
+PRESETS: dict[str, Filters] = {
+    "none": Filters(),
+    "nightcore": Filters.from_filters(timescale=Timescale({"speed": 1.2, "pitch": 1.2, "rate": 1.0})),
+    "vaporwave": Filters.from_filters(
+        timescale=Timescale({"speed": 0.85, "pitch": 0.8, "rate": 1.0}),
+        equalizer=_bass(0.3, 0.3),
+        tremolo=Tremolo({"frequency": 14.0, "depth": 0.3})
+    ),
+    "slowed": Filters.from_filters(timescale=Timescale({"speed": 0.8, "pitch": 0.9, "rate": 1.0})),
+    "bassboost": Filters.from_filters(equalizer=_bass(0.6, 0.67, 0.67, 0.4, -0.2, 0.15)),
+    "8d": Filters.from_filters(rotation=Rotation({"rotationHz": 0.2})),
+    "karaoke": Filters.from_filters(
+        karaoke=Karaoke({"level": 1.0, "monoLevel": 1.0, "filterBand": 220.0, "filterWidth": 100.0})
+    ),
+    "muffled": Filters.from_filters(low_pass=LowPass({"smoothing": 20.0})),
+}
+
+
+def preset(name: str) -> Filters:
+    return Filters(data=PRESETS[name]())
+
+
+FilterChange = Callable[[Filters], Optional[Filters]]  # edits the filters in place, or returns new ones
+
+
+class FilterUpdates:
+    """Filter and volume changes of each player, merged into one set_filters call per player within a window
+
+    The window starts at a player's first change, so the changes apply at most a window late however many follow.
+    """
+
+    __slots__ = ("window", "_pending", "_in_flight", "changes", "updates")
+
+    def __init__(self, window: float = FILTER_WINDOW):
+        self.window: float = window
+        self._pending: dict[int, tuple[Player, Filters, asyncio.Task]] = {}  # guild id to its next update
+        # guild id to the filters being sent, the player only takes them once lavalink answered
+        self._in_flight: dict[int, Filters] = {}
+        self.changes: int = 0
+        self.updates: int = 0  # set_filters calls made, every change over them saved one
+
+    @property
+    def saved(self) -> int:
+        return self.changes - self.updates - len(self._pending)
+
+    async def change(self, player: Player, change: FilterChange) -> None:
+        """Apply a change to the player's filters, returns once it reached lavalink"""
+        self.changes += 1
+        if (pending := self._pending.get(player.guild.id)) is not None:
+            _, filters, task = pending
+            self._pending[player.guild.id] = (player, change(filters) or filters, task)
+        else:
+            # a copy, the player's own is only replaced on update. an update still on its way is built on, not undone
+            filters = Filters(data=self._in_flight.get(player.guild.id, player.filters)())
+            task = asyncio.create_task(self._update_later(player.guild.id))
+            self._pending[player.guild.id] = (player, change(filters) or filters, task)
+        await asyncio.shield(task)
+
+    async def _update_later(self, guild_id: int) -> None:
+        await asyncio.sleep(self.window)
+        player, filters, _ = self._pending.pop(guild_id)
+        self.updates += 1
+        self._in_flight[guild_id] = filters
+        try:
+            await player.set_filters(filters)
+        finally:
+            if self._in_flight.get(guild_id) is filters:
+                del self._in_flight[guild_id]
+
+    async def flush(self) -> None:
+        """Wait for every pending update, before the cog unloads"""
+        for guild_id, result in zip(list(self._pending), await asyncio.gather(
+                *(task for _, _, task in self._pending.values()), return_exceptions=True)):
+            if isinstance(result, Exception):
+                logger.error(f"Could not update the filters of guild {guild_id}: {result}")
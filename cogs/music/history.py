@@ -0,0 +1,233 @@
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Literal, Optional
+
+logger = logging.getLogger("music")
+
+DAY = 86400  # in seconds, rollups are per UTC day
+BATCH_SIZE = 200  # plays buffered before they're written, the rest go out with the periodic flush
+TOP_LIMIT = 10
+SEED_DAYS = 30  # autoplay seeds come from the most played tracks this recent, all time if there aren't any
+AUTOPLAY_REQUESTER = 0  # requester id of tracks autoplay picked
+
+# rollup table to the columns it's keyed by after the guild id, each row holds plays and seconds listened
+ROLLUPS = {
+    "music_daily_tracks": ("day", "track_id"),
+    "music_daily_requesters": ("day", "requester_id"),
+    "music_total_tracks": ("track_id",),
+    "music_total_requesters": ("requester_id",),
+}
+# periods stats can be asked for, in days. longer ones than a month would sum too many daily rows, all time has its own
+PERIODS = {"day": 1, "week": 7, "month": 30, "all": None}
+Period = Literal["day", "week", "month", "all"]
+
+
+@dataclass(slots=True, frozen=True)
+class Play:
+    guild_id: int
+    requester_id: int
+    identifier: str
+    title: str
+    author: str
+    uri: Optional[str]
+    data: str  # the track's lavalink payload as JSON, so seeds turn back into tracks without a search
+    started_at: int  # in unix time
+    seconds: int  # listened, capped at the track's length
+
+
+def rollup(plays: list[Play], track_ids: dict[str, int], key: tuple[str, ...]) -> dict[tuple, list[int]]:
+    """Plays and seconds of a batch summed per rollup row, so writing it is one upsert per row instead of per play"""
+    rows: dict[tuple, list[int]] = {}
+    for play in plays:
+        values = {"day": play.started_at // DAY, "track_id": track_ids[play.identifier], "requester_id": play.requester_id}
+        totals = rows.setdefault((play.guild_id, *(values[column] for column in key)), [0, 0])
+        totals[0] += 1
+        totals[1] += play.seconds
+    return rows
+
+
+@dataclass(slots=True, frozen=True)
+class TrackStats:
+    title: str
+    author: str
+    uri: Optional[str]
+    plays: int
+    seconds: int
+
+
+@dataclass(slots=True, frozen=True)
+class RequesterStats:
+    requester_id: int
+    plays: int
+    seconds: int
+
+
+class ListeningHistory:
+    """Every play, appended to SQLite in batches, with rollups per day and for all time kept in the same transaction
+
+    Stats only ever read the rollups, which are a row per guild, day and track or requester instead of a row per play,
+    so they stay fast however long the log grows. The writes run in a worker thread like the QOTD history's.
+    """
+
+    def __init__(self, path: str, batch_size: int = BATCH_SIZE):
+        self.batch_size: int = batch_size
+        self.pending: list[Play] = []
+        self.recorded: int = 0
+        self._flushing: Optional[asyncio.Task] = None
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA busy_timeout=5000")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS music_tracks ("
+                "id INTEGER PRIMARY KEY, identifier TEXT NOT NULL UNIQUE, title TEXT NOT NULL, author TEXT NOT NULL, "
+                "uri TEXT, data TEXT NOT NULL)"
+            )
+            # append only, the rollups are what gets read
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS music_plays ("
+                "guild_id INTEGER NOT NULL, requester_id INTEGER NOT NULL, track_id INTEGER NOT NULL, "
+                "started_at INTEGER NOT NULL, seconds INTEGER NOT NULL)"
+            )
+            for name, key in ROLLUPS.items():
+                columns = "".join(f"{column} INTEGER NOT NULL, " for column in key)
+                self.conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {name} (guild_id INTEGER NOT NULL, {columns}"
+                    f"plays INTEGER NOT NULL, seconds INTEGER NOT NULL, PRIMARY KEY (guild_id, {', '.join(key)})) "
+                    f"WITHOUT ROWID"
+                )
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+    def _track_id(self, play: Play) -> int:
+        (track_id,) = self.conn.execute(
+            "INSERT INTO music_tracks (identifier, title, author, uri, data) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (identifier) DO UPDATE SET title = excluded.title, author = excluded.author, "
+            "uri = excluded.uri, data = excluded.data RETURNING id",
+            (play.identifier, play.title, play.author, play.uri, play.data)
+        ).fetchone()
+        return track_id
+
+    def write_sync(self, plays: list[Play]) -> None:
+        """Append the plays and add them to the rollups, in one transaction"""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                track_ids = {play.identifier: self._track_id(play) for play in plays}
+                self.conn.executemany(
+                    "INSERT INTO music_plays (guild_id, requester_id, track_id, started_at, seconds) VALUES (?, ?, ?, ?, ?)",
+                    ((p.guild_id, p.requester_id, track_ids[p.identifier], p.started_at, p.seconds) for p in plays)
+                )
+
+                for name, key in ROLLUPS.items():
+                    columns = ", ".join(("guild_id", *key))
+                    self.conn.executemany(
+                        f"INSERT INTO {name} ({columns}, plays, seconds) VALUES ({', '.join('?' * (len(key) + 3))}) "
+                        f"ON CONFLICT ({columns}) DO UPDATE SET plays = plays + excluded.plays, "
+                        f"seconds = seconds + excluded.seconds",
+                        ((*row, count, seconds) for row, (count, seconds) in rollup(plays, track_ids, key).items())
+                    )
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    @staticmethod
+    def _since(days: Optional[int]) -> int:
+        return 0 if days is None else int(time.time()) // DAY - days + 1
+
+    def top_tracks_sync(self, guild_id: int, days: Optional[int], limit: int = TOP_LIMIT) -> list[TrackStats]:
+        """Most played tracks of the last days, all time if days is None"""
+        if days is None:
+            top = "SELECT track_id, plays, seconds FROM music_total_tracks WHERE guild_id = ? ORDER BY plays DESC, seconds DESC LIMIT ?"
+            args = (guild_id, limit)
+        else:
+            top = ("SELECT track_id, sum(plays) AS plays, sum(seconds) AS seconds FROM music_daily_tracks "
+                   "WHERE guild_id = ? AND day >= ? GROUP BY track_id ORDER BY plays DESC, seconds DESC LIMIT ?")
+            args = (guild_id, self._since(days), limit)
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT title, author, uri, plays, seconds FROM ({top}) JOIN music_tracks ON id = track_id "
+                f"ORDER BY plays DESC, seconds DESC", args
+            ).fetchall()
+        return [TrackStats(*row) for row in rows]
+
+    def _requesters(self, guild_id: int, days: Optional[int]) -> tuple[str, tuple]:
+        """Query for the plays and seconds per requester over the last days, and its arguments"""
+        if days is None:
+            return "SELECT requester_id, plays, seconds FROM music_total_requesters WHERE guild_id = ?", (guild_id,)
+        return ("SELECT requester_id, sum(plays) AS plays, sum(seconds) AS seconds FROM music_daily_requesters "
+                "WHERE guild_id = ? AND day >= ? GROUP BY requester_id"), (guild_id, self._since(days))
+
+    def top_requesters_sync(self, guild_id: int, days: Optional[int], limit: int = TOP_LIMIT) -> list[RequesterStats]:
+        """Members who requested the most, autoplay excluded"""
+        requesters, args = self._requesters(guild_id, days)
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT requester_id, plays, seconds FROM ({requesters}) WHERE requester_id != ? "
+                f"ORDER BY plays DESC, seconds DESC LIMIT ?",
+                (*args, AUTOPLAY_REQUESTER, limit)
+            ).fetchall()
+        return [RequesterStats(*row) for row in rows]
+
+    def listening_time_sync(self, guild_id: int, days: Optional[int]) -> tuple[int, int]:
+        """Plays and seconds listened"""
+        requesters, args = self._requesters(guild_id, days)
+        with self._lock:
+            plays, seconds = self.conn.execute(f"SELECT sum(plays), sum(seconds) FROM ({requesters})", args).fetchone()
+        return plays or 0, seconds or 0
+
+    def seeds_sync(self, guild_id: int, limit: int) -> list[dict]:
+        """Lavalink payloads of the guild's most played recent tracks, to start autoplay from"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT data FROM music_tracks JOIN ("
+                "SELECT track_id, sum(plays) AS total FROM music_daily_tracks WHERE guild_id = ? AND day >= ? "
+                "GROUP BY track_id ORDER BY total DESC LIMIT ?) ON id = track_id ORDER BY total DESC",
+                (guild_id, self._since(SEED_DAYS), limit)
+            ).fetchall() or self.conn.execute(
+                "SELECT data FROM music_tracks JOIN music_total_tracks ON id = track_id WHERE guild_id = ? "
+                "ORDER BY plays DESC LIMIT ?",
+                (guild_id, limit)
+            ).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def record(self, play: Play) -> None:
+        """Buffer a play, a full batch is written in the background"""
+        self.pending.append(play)
+        self.recorded += 1
+        if len(self.pending) >= self.batch_size and (self._flushing is None or self._flushing.done()):
+            self._flushing = asyncio.create_task(self._flush_batch())
+
+    async def _flush_batch(self) -> None:
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Could not write the listening history, the batch was dropped")
+
+    async def flush(self) -> int:
+        """Write the buffered plays, returns how many were written"""
+        plays, self.pending = self.pending, []
+        if plays:
+            await asyncio.to_thread(self.write_sync, plays)
+        return len(plays)
+
+    async def top_tracks(self, guild_id: int, days: Optional[int]) -> list[TrackStats]:
+        return await asyncio.to_thread(self.top_tracks_sync, guild_id, days)
+
+    async def top_requesters(self, guild_id: int, days: Optional[int]) -> list[RequesterStats]:
+        return await asyncio.to_thread(self.top_requesters_sync, guild_id, days)
+
+    async def listening_time(self, guild_id: int, days: Optional[int]) -> tuple[int, int]:
+        return await asyncio.to_thread(self.listening_time_sync, guild_id, days)
+
+    async def seeds(self, guild_id: int, limit: int) -> list[dict]:
+        return await asyncio.to_thread(self.seeds_sync, guild_id, limit)
@@ -0,0 +1,60 @@
+import time
+from collections import OrderedDict
+
+from wavelink import Playable, Playlist, Search, TrackSource
+
+SEARCH_CACHE_SIZE = 256  # queries
+TRACK_CACHE_SIZE = 1024  # tracks from the cached results, by uri
+SEARCH_CACHE_TTL = 600  # seconds, results go stale as videos get uploaded or taken down
+
+
+class SearchCache:
+    """Recent search results, so autocomplete doesn't hit lavalink on every keystroke
+    and picking one of the suggestions doesn't search for it again.
+    """
+
+    def __init__(self, size: int = SEARCH_CACHE_SIZE, ttl: float = SEARCH_CACHE_TTL):
+        self.size: int = size
+        self.ttl: float = ttl
+        self._results: OrderedDict[str, tuple[float, Search]] = OrderedDict()  # query to (cached at, results)
+        self._tracks: OrderedDict[str, Playable] = OrderedDict()
+
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def tracks(self) -> list[Playable]:
+        return [*self._tracks.values()]
+
+    def _cache_tracks(self, results: Search) -> None:
+        if isinstance(results, Playlist):
+            return
+        for track in results:
+            if track.uri:
+                self._tracks[track.uri] = track
+                self._tracks.move_to_end(track.uri)
+        while len(self._tracks) > TRACK_CACHE_SIZE:
+            self._tracks.popitem(last=False)
+
+    async def search(self, query: str) -> Search:
+        if (track := self._tracks.get(query)) is not None:  # a suggestion was picked
+            self.hits += 1
+            return [track]
+
+        key = query.strip().casefold()
+        if (entry := self._results.get(key)) is not None and time.monotonic() - entry[0] < self.ttl:
+            self.hits += 1
+            self._results.move_to_end(key)
+            return entry[1]
+
+        self.misses += 1
+        results: Search = await Playable.search(query, source=TrackSource.YouTube)
+        if results:  # don't keep failed searches around
+            self._results[key] = (time.monotonic(), results)
+            self._results.move_to_end(key)
+            while len(self._results) > self.size:
+                self._results.popitem(last=False)
+            self._cache_tracks(results)
+        return results
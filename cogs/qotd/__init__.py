@@ -1,13 +1,24 @@
-from discord import Message, Thread
+from discord import Message, Thread, Guild, TextChannel, Embed, NotFound
+from discord import app_commands
 from discord.ext import commands
 from discord.ext.commands import Bot
 import re
+import time
+import logging
+from typing import Awaitable, Callable
 
+from cogs.qotd.activation import Activations
 from cogs.qotd.classes import QOTD, QOTDs
+from cogs.qotd.history import QOTDHistory, Entry
+from memory import Usage, account_many
+
+logger = logging.getLogger("qotd")
 
 THREAD_NAME_LENGTH_LIMIT = 100
 QOTD_PATTERN = r" ?QOTD[: ]"
 PIN_REASON = "QOTD"
+BACKFILL_BATCH = 500
+SNIPPET_LENGTH = 200
 
 
 def is_qotd(content: str) -> bool:
@@ -30,6 +41,10 @@ def trim_string_keep_words(string: str, n_chars: int, *, seperator: str = ' ') -
     return string[:i]
 
 
+def entry_from_message(msg: Message) -> Entry:
+    return Entry(msg.id, msg.channel.id, msg.guild.id, int(msg.created_at.timestamp()), msg.clean_content.strip())
+
+
 async def create_qotd_thread(msg: Message) -> Thread:
     stripped_content: str = msg.clean_content.strip()
     if len(stripped_content) > THREAD_NAME_LENGTH_LIMIT:
@@ -39,7 +54,7 @@ async def create_qotd_thread(msg: Message) -> Thread:
 
 
 class QuestionOfTheDay(commands.Cog):
-    qotd_channel_ids = [
+    qotd_channel_ids = [  # always watched, on top of the channels set in each guild's settings
         838658959626862662,  # qotd
         958968475349569558  # test
     ]
@@ -47,19 +62,145 @@ class QuestionOfTheDay(commands.Cog):
     def __init__(self, bot: Bot):
         self.bot: Bot = bot
         self.pinned_qotd = QOTDs(bot=bot)
+        self.history = QOTDHistory(bot.store.path)
+        self.activations = Activations(bot.store)
+        bot.memory.add_accountant("qotd.pinned", self.account_memory)
+        bot.metrics.add_collector("qotd", self.activations.collect_metrics)
+        self.register_trigger()
+        bot.guild_settings.add_listener(self.register_trigger)
+
+    async def cog_unload(self) -> None:
+        self.bot.memory.remove_accountant("qotd.pinned")
+        self.bot.metrics.remove_collector("qotd")
+        self.bot.guild_settings.remove_listener(self.register_trigger)
+        self.bot.triggers.remove("qotd")
+        self.history.close()
+
+    def export_state(self) -> dict:
+        """Cancel the unpin tasks and hand over their QOTDs, which stay in the store until unpinned"""
+        return {"pinned": self.pinned_qotd.export()}
+
+    def import_state(self, state: dict) -> None:
+        self.pinned_qotd.restore_exported(state["pinned"])
+
+    def register_trigger(self, *_) -> None:
+        """(Re)register the QOTD trigger, scoped to the QOTD channels of every guild"""
+        self.bot.triggers.add(
+            "qotd", QOTD_PATTERN, self.create_qotd,
+            flags=re.IGNORECASE,
+            channel_ids={*self.qotd_channel_ids, *self.bot.guild_settings.qotd_channel_ids()},
+            ignore_bots=False
+        )
+
+    def account_memory(self) -> Usage:
+        def guild_id(qotd: QOTD):
+            channel = self.bot.get_channel(qotd.channel_id)
+            return getattr(getattr(channel, "guild", None), "id", None)
+
+        return account_many(((guild_id(qotd), (qotd, task)) for qotd, task in self.pinned_qotd), follow=(QOTD,))
+
+    def activation_steps(self, msg: Message, qotd: QOTD, steps: list[str]) -> dict[str, Callable[[], Awaitable]]:
+        """The steps of activating a QOTD, each one skips what's already done so they can be redone after a crash"""
+        async def thread():
+            if msg.thread is None:
+                await self.activations.retrying("thread", lambda: create_qotd_thread(msg))
+
+        async def pin():
+            if not msg.pinned:
+                await self.activations.retrying("pin", lambda: msg.pin(reason=PIN_REASON))
+            if not self.pinned_qotd.tracking(qotd.msg_id):
+                self.pinned_qotd.add(qotd)
+
+        async def history():
+            duplicates = await self.history.record(entry_from_message(msg))
+            if duplicates:
+                await self.activations.retrying("history", lambda: msg.reply(
+                    "This might have been asked before:\n" + "\n".join(
+                        f"{duplicate.entry.jump_url} <t:{duplicate.entry.created_time}:R> ({duplicate.similarity:.0%} similar)"
+                        for duplicate in duplicates[:3]
+                    ),
+                    suppress_embeds=True
+                ))
+
+        available = {"thread": thread, "pin": pin, "history": history}
+        return {step: available[step] for step in steps}
+
+    async def activate(self, msg: Message, qotd: QOTD, steps: list[str]) -> None:
+        started = time.perf_counter()
+        failed = await self.activations.run(qotd, self.activation_steps(msg, qotd, steps))
+        self.activations.observe(qotd, time.perf_counter() - started, failed)
 
     async def create_qotd(self, msg: Message):
-        """Make message QOTD and schedule removal in a day"""
-        await create_qotd_thread(msg)
-
-        await msg.pin(reason=PIN_REASON)
-        self.pinned_qotd.add(QOTD.from_message(msg))
+        """Make message QOTD, thread it, pin it and schedule removal in a day, and check it against the history"""
+        qotd = QOTD.from_message(msg)
+        steps = ["thread", "pin"] if msg.guild is None else ["thread", "pin", "history"]
+        await self.activations.begin(qotd, steps)  # before any REST call, so a crash halfway gets reconciled on restart
+        await self.activate(msg, qotd, steps)
+
+    async def reconcile(self, guild: Guild) -> None:
+        """Finish activations a crash or an outage left halfway, in the guild's channels"""
+        for qotd, steps in self.activations.unfinished(channel.id for channel in guild.text_channels):
+            try:
+                msg = await guild.get_channel(qotd.channel_id).fetch_message(qotd.msg_id)
+            except NotFound:  # deleted in the meantime, nothing left to activate
+                self.activations.discard(qotd)
+                continue
+            except Exception:
+                logger.exception(f"Could not fetch QOTD {qotd.msg_id} to finish activating it")
+                continue
+            logger.info(f"Finishing the activation of QOTD {qotd.msg_id}, missing {', '.join(steps)}")
+            self.activations.reconciled += 1
+            await self.activate(msg, qotd, steps)
+
+    @commands.hybrid_group(name="qotd")
+    @commands.guild_only()
+    async def qotd_group(self, ctx):
+        """QOTDs asked in this server"""
+        if ctx.invoked_subcommand is None:
+            await ctx.send_help(ctx.command)
+
+    @qotd_group.command(name="search")
+    @commands.guild_only()  # slash subcommands don't run the group's checks
+    async def qotd_search(self, ctx, *, query: str):
+        """Search QOTDs asked before, best matches first"""
+        entries, elapsed = await self.history.search(ctx.guild.id, query)
+        embed = Embed(
+            title=f"QOTDs matching {trim_string_keep_words(query, 50)}",
+            description="\n".join(
+                f"<t:{entry.created_time}:d> [{trim_string_keep_words(entry.content, SNIPPET_LENGTH)}]({entry.jump_url})"
+                for entry in entries
+            ) or "Never asked",
+            color=0x25fa30
+        )
+        embed.set_footer(text=f"{len(entries)} results in {elapsed * 1000:.1f}ms")
+        await ctx.reply(embed=embed)
+
+    @qotd_group.command(name="backfill")
+    @commands.guild_only()
+    @commands.has_permissions(administrator=True)
+    @app_commands.default_permissions(administrator=True)
+    async def qotd_backfill(self, ctx, channel: TextChannel = None, limit: int = None):
+        """Record the QOTDs already in a channel to the history, defaults to the current channel and all its messages"""
+        channel = channel or ctx.channel
+        await ctx.defer()
+        recorded = 0
+        batch = []
+        async for msg in channel.history(limit=limit):
+            if is_qotd(msg.content):
+                batch.append(entry_from_message(msg))
+            if len(batch) >= BACKFILL_BATCH:
+                await self.history.record_many(batch)
+                recorded += len(batch)
+                batch.clear()
+        await self.history.record_many(batch)
+        recorded += len(batch)
+        await ctx.reply(f"Recorded {recorded} QOTDs from {channel.mention}")
 
     @commands.Cog.listener()
-    async def on_message(self, msg: Message):
-        if msg.channel.id in self.qotd_channel_ids \
-                and is_qotd(msg.content):  # check if the message is a qotd
-            await self.create_qotd(msg)
+    async def on_guild_available(self, guild: Guild):
+        """Pick up QOTDs still waiting to be unpinned or activated, the guild is only ever available on the shard that handles it"""
+        self.pinned_qotd.restore(channel.id for channel in guild.text_channels)
+        await self.reconcile(guild)
 
 
 async def setup(bot):
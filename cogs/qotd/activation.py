@@ -0,0 +1,124 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Awaitable, Callable, Iterable, TypeVar
+
+import aiohttp
+from discord import HTTPException
+
+from cogs.qotd.classes import QOTD
+from metrics import Histogram, Samples, sample_name
+from store import SharedStore
+
+logger = logging.getLogger("qotd")
+
+ACTIVATION_NAMESPACE = "qotd_activation"
+ATTEMPTS = 3  # per REST call, the first one included
+BACKOFF = 1.0  # in seconds before the first retry, doubled for every one after it
+
+T = TypeVar("T")
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Errors worth retrying, the connection dropping or a 5xx that outlasted discord.py's own retries.
+    Rate limits are already waited out by discord.py, missing permissions won't fix themselves"""
+    if isinstance(exc, HTTPException):
+        return exc.status >= 500
+    return isinstance(exc, (aiohttp.ClientError, asyncio.TimeoutError, OSError))
+
+
+class StepFailed(Exception):
+    def __init__(self, step: str, transient: bool):
+        super().__init__(f"QOTD activation step {step} failed")
+        self.step: str = step
+        self.transient: bool = transient  # worth trying again on the next restart
+
+
+class Activations:
+    """QOTD activations, the thread, pin and history steps run concurrently and their REST calls are retried
+
+    An activation is written to the shared store before any of its steps start, with the steps still pending,
+    and only removed once they're all done. Whatever a crash or an outage interrupted is redone by reconcile.
+    """
+
+    def __init__(self, store: SharedStore):
+        self.store: SharedStore = store
+        self.latency: Histogram = Histogram()
+        self.last_latency: float = 0.0
+        self.retries: dict[str, int] = defaultdict(int)  # step to count
+        self.failures: dict[str, int] = defaultdict(int)  # step to count
+        self.reconciled: int = 0
+
+    async def begin(self, qotd: QOTD, steps: Iterable[str]) -> None:
+        """Record the steps as pending, awaited so it's written before they start"""
+        await self.store.set_soon(ACTIVATION_NAMESPACE, str(qotd.msg_id),
+                                  {"msg_id": qotd.msg_id, "channel_id": qotd.channel_id,
+                                   "created_time": qotd.created_time, "pending": list(steps)})
+
+    def unfinished(self, channel_ids: Iterable[int]) -> list[tuple[QOTD, list[str]]]:
+        """Stored activations in any of the channels, with the steps they're missing"""
+        channel_ids = set(channel_ids)
+        return [
+            (QOTD(d["msg_id"], d["channel_id"], d["created_time"]), d["pending"])
+            for d in self.store.items(ACTIVATION_NAMESPACE).values() if d["channel_id"] in channel_ids
+        ]
+
+    def discard(self, qotd: QOTD) -> None:
+        self.store.delete_soon(ACTIVATION_NAMESPACE, str(qotd.msg_id))
+
+    async def retrying(self, step: str, call: Callable[[], Awaitable[T]]) -> T:
+        """Await the REST call, retrying transient failures with a backoff. Raises StepFailed once it gives up"""
+        for attempt in range(ATTEMPTS):
+            try:
+                return await call()
+            except Exception as exc:
+                transient = is_transient(exc)
+                if not transient or attempt == ATTEMPTS - 1:
+                    raise StepFailed(step, transient) from exc
+                self.retries[step] += 1
+                delay = BACKOFF * 2 ** attempt
+                logger.info(f"QOTD {step} failed with {exc!r}, retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+
+    async def run(self, qotd: QOTD, steps: dict[str, Callable[[], Awaitable]]) -> list[str]:
+        """Run the steps concurrently, returns the ones that failed
+
+        Steps that failed transiently stay pending in the store for the next reconcile, the others are given up on.
+        """
+        results = await asyncio.gather(*(step() for step in steps.values()), return_exceptions=True)
+        pending, failed = [], []
+        for step, result in zip(steps, results):
+            if isinstance(result, BaseException):
+                failed.append(step)
+                self.failures[step] += 1
+                logger.warning(f"QOTD {qotd.msg_id} could not {step}", exc_info=result)
+                if isinstance(result, StepFailed) and result.transient:
+                    pending.append(step)
+
+        if pending:
+            await self.begin(qotd, pending)
+        else:
+            self.discard(qotd)
+        return failed
+
+    def observe(self, qotd: QOTD, elapsed: float, failed: list[str]) -> None:
+        self.latency.observe(elapsed)
+        self.last_latency = elapsed
+        logger.info(f"QOTD {qotd.msg_id} activated in {elapsed * 1000:.0f}ms"
+                    + (f", {', '.join(failed)} failed" if failed else ""))
+
+    async def collect_metrics(self) -> Samples:
+        samples = {
+            "qotd_activations_total": self.latency.count,
+            "qotd_activation_seconds_sum": self.latency.sum,
+            "qotd_activation_last_seconds": self.last_latency,
+            "qotd_activations_pending": len(self.store.items(ACTIVATION_NAMESPACE)),
+            "qotd_activations_reconciled_total": self.reconciled,
+        }
+        for q in (0.5, 0.95):
+            samples[sample_name("qotd_activation_seconds", quantile=str(q))] = self.latency.quantile(q)
+        for step, count in self.retries.items():
+            samples[sample_name("qotd_activation_retries_total", step=step)] = count
+        for step, count in self.failures.items():
+            samples[sample_name("qotd_activation_failures_total", step=step)] = count
+        return samples
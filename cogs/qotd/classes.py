@@ -5,11 +5,12 @@ import time
 
 import json
 
-from typing import IO
+from typing import IO, Iterable
 from discord import Message
 from discord.ext.commands import Bot
 
 A_DAY_IN_SECONDS = 86400
+QOTD_NAMESPACE = "qotd"
 
 
 @dataclass(slots=True, frozen=True)
@@ -50,12 +51,44 @@ class QOTDs(set):
     def add(self, qotd: QOTD, /) -> None:
         assert isinstance(qotd, QOTD)
 
+        # kept in the shared store until unpinned, so a restart or another shard process can pick it back up
+        self.bot.store.set_soon(QOTD_NAMESPACE, str(qotd.msg_id), dataclasses.asdict(qotd))
         task = asyncio.create_task(self.unpin_task(qotd))
 
         elements = (qotd, task)
         super().add(elements)
 
-        task.add_done_callback(lambda res: self.remove(elements))
+        task.add_done_callback(lambda res: self._done(elements))
+
+    def _done(self, elements: tuple[QOTD, asyncio.Task]) -> None:
+        self.remove(elements)
+        qotd, task = elements
+        if not task.cancelled():  # cancelled on shutdown, still needs unpinning later
+            self.bot.store.delete_soon(QOTD_NAMESPACE, str(qotd.msg_id))
+
+    def tracking(self, msg_id: int) -> bool:
+        return any(qotd.msg_id == msg_id for qotd, _ in self)
+
+    def restore(self, channel_ids: Iterable[int]) -> None:
+        """Reschedule stored QOTDs posted in any of the channels"""
+        channel_ids = set(channel_ids)
+        for d in self.bot.store.items(QOTD_NAMESPACE).values():
+            qotd = QOTD(**d)
+            if qotd.channel_id in channel_ids and not self.tracking(qotd.msg_id):
+                self.add(qotd)
+
+    def export(self) -> list[dict]:
+        """Cancel every unpin task, returns their QOTDs as dicts to reschedule them with restore_exported"""
+        exported = []
+        for qotd, task in list(self):
+            task.cancel()
+            exported.append(dataclasses.asdict(qotd))
+        return exported
+
+    def restore_exported(self, exported: Iterable[dict]) -> None:
+        for d in exported:
+            if not self.tracking(d["msg_id"]):
+                self.add(QOTD(**d))
 
     def save(self, fp: IO):
         # TODO: might be kinda suck for performance reason
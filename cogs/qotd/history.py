@@ -0,0 +1,202 @@
+import re
+import time
+import sqlite3
+import asyncio
+import hashlib
+import threading
+from array import array
+from dataclasses import dataclass
+from typing import Optional
+
+# minhash signatures, split into bands for locality sensitive hashing. questions sharing every row of any band are
+# compared, which finds pairs over about (1 / BANDS) ** (1 / ROWS) = 50% similar
+PERMUTATIONS = 64
+BANDS = 16
+ROWS = PERMUTATIONS // BANDS
+SHINGLE_WORDS = 3
+DUPLICATE_THRESHOLD = 0.6  # estimated jaccard similarity of the shingles
+SEARCH_LIMIT = 10
+
+WORD_PATTERN = re.compile(r"\w+")
+QOTD_PREFIX_PATTERN = re.compile(r" ?QOTD[: ]", flags=re.IGNORECASE)
+
+
+def shingles(content: str) -> set[bytes]:
+    """Word n-grams of the question, without the QOTD prefix"""
+    words = WORD_PATTERN.findall(QOTD_PREFIX_PATTERN.sub("", content, count=1).casefold())
+    if len(words) < SHINGLE_WORDS:
+        return {" ".join(words).encode()} if words else set()
+    return {" ".join(words[i:i + SHINGLE_WORDS]).encode() for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def minhash(content: str) -> Optional[array]:
+    """None for questions without a word, they can't be compared"""
+    # one shake digest per shingle holds a 64 bit hash for every permutation, so the hashing stays in C
+    hashes = [array("Q", hashlib.shake_128(shingle).digest(PERMUTATIONS * 8)) for shingle in shingles(content)]
+    if not hashes:
+        return None
+    return array("Q", map(min, zip(*hashes)))
+
+
+def band_buckets(signature: array) -> list[int]:
+    """A bucket per band, signed to fit in a SQLite integer"""
+    return [int.from_bytes(hashlib.blake2b(signature[i:i + ROWS].tobytes(), digest_size=8).digest(), "little", signed=True)
+            for i in range(0, PERMUTATIONS, ROWS)]
+
+
+def similarity(a: array, b: array) -> float:
+    return sum(x == y for x, y in zip(a, b)) / PERMUTATIONS
+
+
+@dataclass(slots=True, frozen=True)
+class Entry:
+    message_id: int
+    channel_id: int
+    guild_id: int
+    created_time: int  # in unix time
+    content: str
+
+    @property
+    def jump_url(self) -> str:
+        return f"https://discord.com/channels/{self.guild_id}/{self.channel_id}/{self.message_id}"
+
+
+@dataclass(slots=True, frozen=True)
+class Duplicate:
+    entry: Entry
+    similarity: float
+
+
+class QOTDHistory:
+    """Every QOTD asked, full text searchable with FTS5 and checked for near duplicates with minhash
+
+    The queries run in a worker thread so the event loop never waits on the disk, the connection is shared between
+    the threads behind a lock.
+    """
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA busy_timeout=5000")
+            # the rowid is the message id
+            self.conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS qotd_history USING fts5("
+                "content, channel_id UNINDEXED, guild_id UNINDEXED, created_time UNINDEXED, "
+                "tokenize='porter unicode61')"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS qotd_minhash ("
+                "message_id INTEGER PRIMARY KEY, guild_id INTEGER NOT NULL, signature BLOB NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS qotd_bands ("
+                "guild_id INTEGER NOT NULL, band INTEGER NOT NULL, bucket INTEGER NOT NULL, message_id INTEGER NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS qotd_bands_bucket ON qotd_bands (guild_id, band, bucket)")
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self.conn.execute("SELECT count(*) FROM qotd_minhash").fetchone()
+        return count
+
+    def _entry(self, message_id: int) -> Entry:
+        content, channel_id, guild_id, created_time = self.conn.execute(
+            "SELECT content, channel_id, guild_id, created_time FROM qotd_history WHERE rowid = ?", (message_id,)
+        ).fetchone()
+        return Entry(message_id, channel_id, guild_id, created_time, content)
+
+    def _duplicates(self, entry: Entry, signature: Optional[array], buckets: list[int]) -> list[Duplicate]:
+        if signature is None:
+            return []
+        candidates = {
+            message_id for band, bucket in enumerate(buckets)
+            for (message_id,) in self.conn.execute(
+                "SELECT message_id FROM qotd_bands WHERE guild_id = ? AND band = ? AND bucket = ?",
+                (entry.guild_id, band, bucket)
+            )
+        }
+        candidates.discard(entry.message_id)
+
+        duplicates = []
+        for message_id in candidates:
+            (blob,) = self.conn.execute("SELECT signature FROM qotd_minhash WHERE message_id = ?", (message_id,)).fetchone()
+            other = array("Q")
+            other.frombytes(blob)
+            if (score := similarity(signature, other)) >= DUPLICATE_THRESHOLD:
+                duplicates.append(Duplicate(self._entry(message_id), score))
+        return sorted(duplicates, key=lambda duplicate: duplicate.similarity, reverse=True)
+
+    def _add(self, entry: Entry, signature: Optional[array], buckets: list[int]) -> None:
+        if self.conn.execute(
+                "INSERT OR IGNORE INTO qotd_minhash (message_id, guild_id, signature) VALUES (?, ?, ?)",
+                (entry.message_id, entry.guild_id, signature.tobytes() if signature else b"")
+        ).rowcount == 0:  # already recorded
+            return
+        self.conn.execute(
+            "INSERT INTO qotd_history (rowid, content, channel_id, guild_id, created_time) VALUES (?, ?, ?, ?, ?)",
+            (entry.message_id, entry.content, entry.channel_id, entry.guild_id, entry.created_time)
+        )
+        self.conn.executemany(
+            "INSERT INTO qotd_bands (guild_id, band, bucket, message_id) VALUES (?, ?, ?, ?)",
+            ((entry.guild_id, band, bucket, entry.message_id) for band, bucket in enumerate(buckets))
+        )
+
+    def record_sync(self, entry: Entry) -> list[Duplicate]:
+        """Record the QOTD, returns the earlier ones of its guild it's a near duplicate of"""
+        signature = minhash(entry.content)
+        buckets = band_buckets(signature) if signature else []
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                duplicates = self._duplicates(entry, signature, buckets)
+                self._add(entry, signature, buckets)
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+        return duplicates
+
+    def record_many_sync(self, entries: list[Entry]) -> None:
+        hashed = [(entry, signature, band_buckets(signature) if signature else [])
+                  for entry in entries for signature in (minhash(entry.content),)]
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for entry, signature, buckets in hashed:
+                    self._add(entry, signature, buckets)
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def search_sync(self, guild_id: int, query: str, limit: int = SEARCH_LIMIT) -> list[Entry]:
+        """Best matches first, every word of the query has to be in the question"""
+        # quoted so the query is only words, not FTS5 syntax
+        match = " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+        if not match:
+            return []
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT rowid, channel_id, guild_id, created_time, content FROM qotd_history "
+                "WHERE qotd_history MATCH ? AND guild_id = ? ORDER BY rank LIMIT ?",
+                (match, guild_id, limit)
+            ).fetchall()
+        return [Entry(*row) for row in rows]
+
+    async def record(self, entry: Entry) -> list[Duplicate]:
+        return await asyncio.to_thread(self.record_sync, entry)
+
+    async def record_many(self, entries: list[Entry]) -> None:
+        await asyncio.to_thread(self.record_many_sync, entries)
+
+    async def search(self, guild_id: int, query: str, limit: int = SEARCH_LIMIT) -> tuple[list[Entry], float]:
+        """Matches and how long the search took in seconds"""
+        start = time.perf_counter()
+        entries = await asyncio.to_thread(self.search_sync, guild_id, query, limit)
+        return entries, time.perf_counter() - start
@@ -0,0 +1,161 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Literal, Optional
+
+from discord import Message
+from discord.abc import Messageable
+
+logger = logging.getLogger("dispatcher")
+
+# discord allows 5 messages per 5 seconds per channel, creating and editing messages share the limit
+CHANNEL_RATE = 1  # per second
+CHANNEL_BURST = 5
+MAX_PENDING = 50  # per channel, anything more gets dropped
+
+
+class DispatchDropped(Exception):
+    """The channel's outbound queue was full"""
+
+
+@dataclass(slots=True)
+class Operation:
+    kind: Literal["send", "edit"]
+    target: Messageable | Message
+    kwargs: dict
+    future: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+
+@dataclass(slots=True)
+class ChannelQueue:
+    operations: deque[Operation] = field(default_factory=deque)
+    edits: dict[int, Operation] = field(default_factory=dict)  # message id to its pending edit
+    tokens: float = CHANNEL_BURST
+    refilled_at: float = field(default_factory=time.monotonic)
+    worker: Optional[asyncio.Task] = None
+
+
+def channel_id_of(target: Messageable | Message) -> int:
+    return target.channel.id if isinstance(target, Message) else target.id
+
+
+def log_failure(future: asyncio.Future) -> None:
+    """Retrieve exceptions of operations nobody awaited"""
+    if not future.cancelled() and (exc := future.exception()) and not isinstance(exc, DispatchDropped):
+        logger.warning(f"Outbound operation failed: {exc!r}")
+
+
+class Dispatcher:
+    """Per channel outbound queue, paced to the channel's message rate limit.
+
+    Pending edits to the same message are coalesced, only the latest content gets sent.
+    Operations return futures, so callers can await the result or leave them to run in the background.
+    """
+
+    def __init__(self, rate: float = CHANNEL_RATE, burst: int = CHANNEL_BURST, max_pending: int = MAX_PENDING):
+        self.rate: float = rate
+        self.burst: int = burst
+        self.max_pending: int = max_pending
+        self.queues: dict[int, ChannelQueue] = {}
+
+        self.completed: int = 0
+        self.coalesced: int = 0
+        self.dropped: int = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(queue.operations) for queue in self.queues.values())
+
+    def send(self, channel: Messageable, **kwargs) -> asyncio.Future[Message]:
+        operation = Operation("send", channel, kwargs)
+        self._enqueue(operation)
+        return operation.future
+
+    def edit(self, message: Message, **kwargs) -> asyncio.Future[Message]:
+        queue = self.queues.get(message.channel.id)
+        if queue is not None and (pending := queue.edits.get(message.id)) is not None:
+            pending.kwargs.update(kwargs)
+            self.coalesced += 1
+            return pending.future
+
+        operation = Operation("edit", message, kwargs)
+        if self._enqueue(operation):
+            self.queues[message.channel.id].edits[message.id] = operation
+        return operation.future
+
+    def _enqueue(self, operation: Operation) -> bool:
+        """Queue the operation, returns whether it was queued"""
+        operation.future.add_done_callback(log_failure)
+        channel_id = channel_id_of(operation.target)
+        queue = self.queues.setdefault(channel_id, ChannelQueue(tokens=self.burst))
+
+        if len(queue.operations) >= self.max_pending:
+            self.dropped += 1
+            operation.future.set_exception(DispatchDropped(f"Outbound queue for channel {channel_id} is full"))
+            return False
+
+        queue.operations.append(operation)
+        if queue.worker is None:
+            queue.worker = asyncio.create_task(self._drain(channel_id, queue))
+        return True
+
+    async def _take_token(self, queue: ChannelQueue) -> None:
+        while True:
+            now = time.monotonic()
+            queue.tokens = min(self.burst, queue.tokens + (now - queue.refilled_at) * self.rate)
+            queue.refilled_at = now
+            if queue.tokens >= 1:
+                queue.tokens -= 1
+                return
+            await asyncio.sleep((1 - queue.tokens) / self.rate)
+
+    @staticmethod
+    def _pop(queue: ChannelQueue) -> Operation:
+        operation = queue.operations.popleft()
+        if operation.kind == "edit":
+            queue.edits.pop(operation.target.id, None)
+        return operation
+
+    async def _drain(self, channel_id: int, queue: ChannelQueue) -> None:
+        try:
+            while queue.operations:
+                if queue.operations[0].future.done():  # cancelled by the caller
+                    self._pop(queue)
+                    continue
+
+                # the operation stays queued while waiting, so edits can still be coalesced into it
+                await self._take_token(queue)
+                operation = self._pop(queue)
+
+                try:
+                    if operation.kind == "send":
+                        result = await operation.target.send(**operation.kwargs)
+                    else:
+                        result = await operation.target.edit(**operation.kwargs)
+                except Exception as e:
+                    if not operation.future.done():
+                        operation.future.set_exception(e)
+                else:
+                    self.completed += 1
+                    if not operation.future.done():
+                        operation.future.set_result(result)
+        finally:
+            queue.worker = None
+            # the bucket outlives the worker, a burst right after a drain still has to wait for its tokens
+            refill = (self.burst - queue.tokens) / self.rate
+            asyncio.get_running_loop().call_later(refill, self._evict, channel_id, queue)
+
+    def _evict(self, channel_id: int, queue: ChannelQueue) -> None:
+        """Forget an idle channel once its bucket is full again, a fresh one would start out the same"""
+        if queue.worker is None and not queue.operations and self.queues.get(channel_id) is queue:
+            del self.queues[channel_id]
+
+    async def collect_metrics(self) -> dict[str, float]:
+        return {
+            "dispatcher_queue_depth": self.queue_depth,
+            "dispatcher_completed_total": self.completed,
+            "dispatcher_coalesced_total": self.coalesced,
+            "dispatcher_dropped_total": self.dropped,
+        }
@@ -0,0 +1,79 @@
+import os
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Optional, TypeVar
+
+logger = logging.getLogger("event_loop")
+
+T = TypeVar("T")
+
+EVENT_LOOPS = ("asyncio", "uvloop")
+EAGER_TASK_FACTORY = getattr(asyncio, "eager_task_factory", None)  # python 3.12+
+
+
+@dataclass(frozen=True, slots=True)
+class LoopConfig:
+    loop: str = "asyncio"  # one of EVENT_LOOPS
+    eager_tasks: bool = False  # tasks run synchronously until their first await, no loop iteration for quick ones
+
+    def __str__(self) -> str:
+        return f"{self.loop}{' with eager tasks' if self.eager_tasks else ''}"
+
+    def new_event_loop(self) -> asyncio.AbstractEventLoop:
+        if self.loop == "uvloop":
+            import uvloop
+            loop = uvloop.new_event_loop()
+        else:
+            loop = asyncio.new_event_loop()
+        if self.eager_tasks:
+            loop.set_task_factory(EAGER_TASK_FACTORY)
+        return loop
+
+    def run(self, main: Awaitable[T]) -> T:
+        """asyncio.run on this configuration's loop"""
+        with asyncio.Runner(loop_factory=self.new_event_loop) as runner:
+            return runner.run(main)
+
+
+def uvloop_available() -> bool:
+    try:
+        import uvloop  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def available_configs() -> list[LoopConfig]:
+    return [LoopConfig(loop, eager) for loop in EVENT_LOOPS for eager in (False, True)
+            if (loop != "uvloop" or uvloop_available()) and (not eager or EAGER_TASK_FACTORY is not None)]
+
+
+def resolve_loop_config(loop: Optional[str] = None, eager_tasks: Optional[str] = None) -> LoopConfig:
+    """The configuration asked for with EVENT_LOOP and EAGER_TASKS, without the parts this python can't run"""
+    loop = (loop or os.getenv("EVENT_LOOP") or "asyncio").casefold()
+    eager_tasks = (eager_tasks or os.getenv("EAGER_TASKS") or "").casefold() in ("1", "true", "yes", "on")
+
+    if loop not in EVENT_LOOPS:
+        logger.warning(f"EVENT_LOOP can only be one of {', '.join(EVENT_LOOPS)}, not {loop}, using asyncio")
+        loop = "asyncio"
+    elif loop == "uvloop" and not uvloop_available():
+        logger.warning("EVENT_LOOP is uvloop but it isn't installed, using asyncio")
+        loop = "asyncio"
+    if eager_tasks and EAGER_TASK_FACTORY is None:
+        logger.warning("EAGER_TASKS needs python 3.12 or newer, creating tasks as usual")
+        eager_tasks = False
+    return LoopConfig(loop, eager_tasks)
+
+
+def describe_running_loop() -> str:
+    """What the running loop actually is, for the startup log"""
+    loop = asyncio.get_running_loop()
+    factory = loop.get_task_factory()
+    if factory is None:
+        tasks = "default task factory"
+    elif factory is EAGER_TASK_FACTORY:
+        tasks = "eager task factory"
+    else:
+        tasks = f"task factory {getattr(factory, '__qualname__', factory)}"
+    return f"Event loop {type(loop).__module__}.{type(loop).__qualname__} with the {tasks}"
@@ -0,0 +1,101 @@
+import dataclasses
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+
+from store import SharedStore
+
+GUILD_SETTINGS_NAMESPACE = "guild_settings"
+MUSIC_HOME_POLICIES = ("lock", "follow")  # lock - player stays in the first channel, follow - moves to the latest one
+REPLYBOT_MODES = ("echo", "markov")  # echo - repeats the message, markov - says something learnt from the channel
+
+
+@dataclass(slots=True, frozen=True)
+class GuildSettings:
+    prefix: Optional[str] = None  # None for the bot's default prefix
+    prefix_commands: Optional[bool] = None  # None for the bot's default, PREFIX_COMMANDS
+    qotd_channel_ids: tuple[int, ...] = ()
+    reply_rate: Optional[float] = None  # None for the replybot defaults in fun.json
+    replybot_blacklist: Optional[tuple[int, ...]] = None
+    replybot_mode: str = "echo"
+    music_home_policy: str = "lock"
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "GuildSettings":
+        fields = {f.name for f in dataclasses.fields(cls)}
+        data = {k: tuple(v) if isinstance(v, list) else v for k, v in data.items() if k in fields}
+        return cls(**data)
+
+
+Listener = Callable[[int, GuildSettings], None]
+
+
+class GuildSettingsStore:
+    """Per guild settings kept in the shared store, behind an in memory read through cache.
+
+    Settings of the guilds handled by this process are loaded up front, so hot paths like prefix resolution
+    are a dict lookup with no io. Writes go through to the store and update the cache.
+    """
+
+    def __init__(self, store: SharedStore):
+        self.store: SharedStore = store
+        self._cache: dict[int, GuildSettings] = {}
+        self._prefixes: dict[int, str] = {}  # only guilds with a custom prefix
+        self._prefix_commands: dict[int, bool] = {}  # only guilds that turned prefix commands on or off
+        self._listeners: list[Listener] = []
+
+    def _cache_settings(self, guild_id: int, settings: GuildSettings) -> None:
+        self._cache[guild_id] = settings
+        if settings.prefix is None:
+            self._prefixes.pop(guild_id, None)
+        else:
+            self._prefixes[guild_id] = settings.prefix
+        if settings.prefix_commands is None:
+            self._prefix_commands.pop(guild_id, None)
+        else:
+            self._prefix_commands[guild_id] = settings.prefix_commands
+
+    def load_all(self, predicate: Callable[[int], bool] = lambda _: True) -> None:
+        """Warm the cache with every stored guild matching the predicate, in one query"""
+        for key, data in self.store.items(GUILD_SETTINGS_NAMESPACE).items():
+            if predicate(int(key)):
+                self._cache_settings(int(key), GuildSettings.from_dict(data))
+
+    def get(self, guild_id: int) -> GuildSettings:
+        """Settings of the guild, reading it from the store on a cache miss"""
+        settings = self._cache.get(guild_id)
+        if settings is None:
+            data = self.store.get(GUILD_SETTINGS_NAMESPACE, str(guild_id))
+            settings = GuildSettings.from_dict(data) if data else GuildSettings()
+            self._cache_settings(guild_id, settings)
+        return settings
+
+    def prefix(self, guild_id: int) -> Optional[str]:
+        """Custom prefix of the guild, from memory only"""
+        return self._prefixes.get(guild_id)
+
+    def prefix_commands(self, guild_id: int) -> Optional[bool]:
+        """Whether the guild turned prefix commands on or off, from memory only"""
+        return self._prefix_commands.get(guild_id)
+
+    def cached(self) -> dict[int, GuildSettings]:
+        return self._cache
+
+    def update(self, guild_id: int, **changes) -> GuildSettings:
+        settings = dataclasses.replace(self.get(guild_id), **changes)
+        self.store.set_soon(GUILD_SETTINGS_NAMESPACE, str(guild_id), dataclasses.asdict(settings))
+        self._cache_settings(guild_id, settings)
+
+        for listener in self._listeners:
+            listener(guild_id, settings)
+        return settings
+
+    def add_listener(self, listener: Listener) -> None:
+        """Call the listener with the guild id and its new settings on every update"""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Listener) -> None:
+        self._listeners.remove(listener)
+
+    def qotd_channel_ids(self) -> Iterable[int]:
+        for settings in self._cache.values():
+            yield from settings.qotd_channel_ids
@@ -0,0 +1,53 @@
+from typing import Iterable
+from discord import Intents, MemberCacheFlags
+
+# intents every configuration needs, and why
+BASE_INTENTS = {
+    "guilds": "guild, channel and role cache",
+    "guild_messages": "prefix commands",
+    "dm_messages": "prefix commands in direct messages",
+    "message_content": "prefix commands",
+}
+
+# extra intents needed by each extension, and why
+EXTENSION_INTENTS = {
+    "cogs.admin": {
+        "members": "bonk role expansion and member lookups",
+        "voice_states": "moving bonked members",
+    },
+    "cogs.fun": {
+        "members": "sin_counter member lookups",
+        "voice_states": "sinner detection",
+    },
+    "cogs.game": {},
+    "cogs.music": {
+        "voice_states": "voice connections",
+        "guild_reactions": "queue pagination",
+    },
+    "cogs.qotd": {},
+    "cogs.debug": {},
+}
+
+
+def intent_reasons(extensions: Iterable[str]) -> dict[str, list[str]]:
+    """Maps each intent needed by the extensions to the reasons it's enabled"""
+    reasons: dict[str, list[str]] = {name: [reason] for name, reason in BASE_INTENTS.items()}
+    for extension in extensions:
+        for name, reason in EXTENSION_INTENTS.get(extension, {}).items():
+            reasons.setdefault(name, []).append(f"{extension}: {reason}")
+    return reasons
+
+
+def resolve_intents(extensions: Iterable[str]) -> Intents:
+    """Build the minimal intents needed by the extensions. Presences are never requested."""
+    return Intents(**{name: True for name in intent_reasons(extensions)})
+
+
+def resolve_member_cache_flags(intents: Intents) -> MemberCacheFlags:
+    """Only keep members in voice channels cached, anything else gets chunked lazily when it's needed"""
+    return MemberCacheFlags(voice=intents.voice_states, joined=False)
+
+
+def intents_report(extensions: Iterable[str]) -> str:
+    reasons = intent_reasons(extensions)
+    return "Enabled intents:\n" + "\n".join(f"  {name} - {', '.join(why)}" for name, why in reasons.items())
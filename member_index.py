@@ -0,0 +1,279 @@
+import time
+import bisect
+import asyncio
+import logging
+from typing import Iterable
+
+from discord import Client, Guild, Member, User
+from discord.ext import commands
+from discord.ext.commands import Context, Greedy
+
+from memory import Usage, approx_sizeof
+
+logger = logging.getLogger("member_index")
+
+MIN_PREFIX_LENGTH = 3  # shorter prefixes match too many members to mean one
+CHUNK_TIMEOUT = 60.0  # in seconds, for the members of a guild to arrive
+CHUNK_RETRY = 600.0  # in seconds before a guild whose members didn't arrive is chunked again
+CHUNK_TTL = 60.0  # in seconds a guild's chunked members are kept, so a burst of role bonks chunks it once
+
+
+def member_names(member: Member) -> tuple[str, ...]:
+    """Names a member can be looked up by, in the order the stock converter checks them"""
+    return tuple(dict.fromkeys(name for name in (member.nick, member.global_name, member.name) if name))
+
+
+def renamed(names: tuple[str, ...], before: User, after: User) -> tuple[str, ...]:
+    """The names with the user's old username and global name swapped for the new ones, the nickname kept"""
+    renames = {before.name: after.name, before.global_name: after.global_name}
+    return tuple(dict.fromkeys(name for name in (renames.get(name, name) for name in names) if name))
+
+
+def answers_to(member: Member, argument: str, prefix: bool) -> bool:
+    """Whether the member has the name, in any case, or a name starting with it"""
+    argument = argument.casefold()
+    return any(name.casefold() == argument or (prefix and name.casefold().startswith(argument))
+               for name in member_names(member))
+
+
+class GuildMemberIndex:
+    """Member ids by name, both as written and casefolded, with the casefolded names sorted for prefix searches
+
+    Only ids and names are kept, the bot only caches members in voice and the rest are fetched when a lookup hits them.
+    """
+
+    __slots__ = ("exact", "folded", "sorted_folded", "names", "complete")
+
+    def __init__(self, members: Iterable[tuple[int, tuple[str, ...]]] = (), complete: bool = False):
+        self.exact: dict[str, set[int]] = {}
+        self.folded: dict[str, set[int]] = {}
+        self.sorted_folded: list[str] = []
+        self.names: dict[int, tuple[str, ...]] = {}  # member id to the names it's indexed under
+        self.complete: bool = complete  # built from every member of the guild
+        for member_id, names in members:
+            self.add(member_id, names, keep_sorted=False)
+        self.sorted_folded = sorted(self.folded)  # once, inserting every name in order is quadratic
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, member_id: int, names: tuple[str, ...], *, keep_sorted: bool = True) -> None:
+        if (indexed := self.names.get(member_id)) == names:
+            return
+        if indexed is not None:
+            self.remove(member_id)
+        self.names[member_id] = names
+        for name in names:
+            self.exact.setdefault(name, set()).add(member_id)
+            folded = name.casefold()
+            if folded not in self.folded:
+                self.folded[folded] = set()
+                if keep_sorted:
+                    bisect.insort(self.sorted_folded, folded)
+            self.folded[folded].add(member_id)
+
+    def remove(self, member_id: int) -> None:
+        for name in self.names.pop(member_id, ()):
+            self._discard(self.exact, name, member_id)
+            folded = name.casefold()
+            if self._discard(self.folded, folded, member_id):
+                del self.sorted_folded[bisect.bisect_left(self.sorted_folded, folded)]
+
+    @staticmethod
+    def _discard(index: dict[str, set[int]], name: str, member_id: int) -> bool:
+        """Returns whether the name has no members left"""
+        ids = index.get(name)
+        if ids is None:
+            return False
+        ids.discard(member_id)
+        if not ids:
+            del index[name]
+            return True
+        return False
+
+    def lookup(self, name: str) -> set[int]:
+        """Members with exactly this name, or with it in another case if no one has it exactly"""
+        return self.exact.get(name) or self.folded.get(name.casefold(), set())
+
+    def starting_with(self, prefix: str, limit: int = 25) -> set[int]:
+        """Members with a name starting with the prefix, in any case"""
+        prefix = prefix.casefold()
+        ids = set()
+        i = bisect.bisect_left(self.sorted_folded, prefix)
+        while i < len(self.sorted_folded) and self.sorted_folded[i].startswith(prefix) and len(ids) < limit:
+            ids.update(self.folded[self.sorted_folded[i]])
+            i += 1
+        return ids
+
+
+class MemberIndex:
+    """Name indexes of the guilds members were looked up in, kept up to date from member events
+
+    A guild's index is built on its first lookup, so guilds no one looks members up in cost nothing. Unless the guild
+    is chunked, it starts with the cached members and the ones lookups find, while every member is requested from the
+    gateway in the background once, without caching them. Joins, leaves and renames arriving meanwhile are replayed
+    onto the new index before it replaces the old one.
+
+    The members of a chunk are kept for CHUNK_TTL seconds, for the other features that need every member of a guild.
+    """
+
+    def __init__(self, client: Client):
+        self.client: Client = client
+        self._guilds: dict[int, GuildMemberIndex] = {}
+        self._building: dict[int, asyncio.Task] = {}  # guild id to its index being built, the chunk included
+        self._chunking: dict[int, asyncio.Task[list[Member]]] = {}  # guild id to its members being requested
+        # guild id to the member changes since its chunk was requested, names or None for a member that left
+        self._missed: dict[int, list[tuple[int, tuple[str, ...] | None]]] = {}
+        self._failed: dict[int, float] = {}  # guild id to when its members last didn't arrive
+        self._chunks: dict[int, list[Member]] = {}  # guild id to the members of its last chunk, for CHUNK_TTL seconds
+
+    def get(self, guild: Guild) -> GuildMemberIndex:
+        if (index := self._guilds.get(guild.id)) is None:
+            index = self._guilds[guild.id] = GuildMemberIndex(((member.id, member_names(member))
+                                                               for member in guild.members), complete=guild.chunked)
+        if not index.complete and self.client.intents.members \
+                and time.monotonic() - self._failed.get(guild.id, -CHUNK_RETRY) >= CHUNK_RETRY:
+            self._build(guild)
+        return index
+
+    async def members(self, guild: Guild) -> list[Member]:
+        """Every member of the guild, from a chunk of the last CHUNK_TTL seconds if there's one, or a new one.
+        The guild's index is rebuilt from a new one"""
+        if guild.chunked:
+            return guild.members
+        if (members := self._chunks.get(guild.id)) is not None:
+            return members
+        self._build(guild)
+        return await self._chunk(guild)
+
+    def _build(self, guild: Guild) -> None:
+        if guild.id not in self._building:
+            self._missed[guild.id] = []
+            self._building[guild.id] = asyncio.create_task(self._index(guild))
+
+    async def _chunk(self, guild: Guild) -> list[Member]:
+        """The members of the guild, requested once for everyone waiting on them"""
+        if (task := self._chunking.get(guild.id)) is None:
+            task = self._chunking[guild.id] = asyncio.create_task(self._request_chunk(guild))
+        return await asyncio.shield(task)
+
+    async def _request_chunk(self, guild: Guild) -> list[Member]:
+        try:
+            members = await asyncio.wait_for(guild.chunk(cache=False), CHUNK_TIMEOUT)
+        except Exception as e:
+            self._failed[guild.id] = time.monotonic()
+            logger.warning(f"Could not get the members of guild {guild.id}: {e!r}")
+            raise
+        finally:
+            self._chunking.pop(guild.id, None)
+        self._chunks[guild.id] = members
+        asyncio.get_running_loop().call_later(CHUNK_TTL, self._expire, guild.id, members)
+        return members
+
+    def _expire(self, guild_id: int, members: list[Member]) -> None:
+        if self._chunks.get(guild_id) is members:  # not replaced by a newer chunk
+            del self._chunks[guild_id]
+
+    async def _index(self, guild: Guild) -> None:
+        """Index every member of the guild, the current index keeps answering until it's done"""
+        started = time.perf_counter()
+        try:
+            try:
+                members = await self._chunk(guild)
+            except Exception:
+                return  # logged by the request
+            # a few hundred milliseconds for the biggest guilds, too long to hold the event loop for
+            index = await asyncio.to_thread(GuildMemberIndex, [(member.id, member_names(member)) for member in members],
+                                            complete=True)
+        finally:
+            self._building.pop(guild.id, None)
+            missed = self._missed.pop(guild.id, [])
+
+        for member_id, names in missed:
+            if names is None:
+                index.remove(member_id)
+            else:
+                index.add(member_id, names)
+        self._guilds[guild.id] = index  # a removed guild's build is cancelled, it never gets here
+        logger.info(f"Indexed {len(members)} members of guild {guild.id} "
+                    f"in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    def _update(self, guild_id: int, member_id: int, names: tuple[str, ...] | None) -> None:
+        """Index the member under the names, or remove it if None, here and in the index being built"""
+        if (index := self._guilds.get(guild_id)) is not None:
+            if names is None:
+                index.remove(member_id)
+            else:
+                index.add(member_id, names)
+        if (missed := self._missed.get(guild_id)) is not None:
+            missed.append((member_id, names))
+
+    def add(self, member: Member) -> None:
+        self._update(member.guild.id, member.id, member_names(member))
+
+    def remove(self, guild_id: int, member_id: int) -> None:
+        self._update(guild_id, member_id, None)
+
+    def account_memory(self) -> Usage:
+        return {guild_id: (len(index), approx_sizeof(index, depth=3, follow=(GuildMemberIndex,)))
+                for guild_id, index in self._guilds.items()}
+
+    async def on_member_join(self, member: Member) -> None:
+        self.add(member)
+
+    async def on_member_update(self, _before: Member, after: Member) -> None:
+        self.add(after)
+
+    async def on_raw_member_remove(self, payload) -> None:
+        self.remove(payload.guild_id, payload.user.id)
+
+    async def on_user_update(self, before: User, after: User) -> None:
+        """Username or global name changes, which every guild the user is in indexes"""
+        for guild_id, index in self._guilds.items():
+            if (names := index.names.get(after.id)) is not None:
+                self._update(guild_id, after.id, renamed(names, before, after))
+
+    async def on_guild_remove(self, guild: Guild) -> None:
+        self._guilds.pop(guild.id, None)
+        self._failed.pop(guild.id, None)
+        self._chunks.pop(guild.id, None)
+        for tasks in (self._building, self._chunking):
+            if (task := tasks.pop(guild.id, None)) is not None:
+                task.cancel()
+
+
+class IndexedMember(commands.MemberConverter):
+    """MemberConverter with names resolved from the member index instead of scanning every member
+
+    A name matches nicknames, global names and usernames exactly, or in any case if nothing matches exactly.
+    Outside of Greedy, a prefix of at least 3 characters matches too if only one member has it. The member found is
+    fetched by id, and names the index doesn't know, or knows under an old name, are left to the stock converter.
+    """
+
+    async def convert(self, ctx: Context, argument: str) -> Member:
+        _, _, discriminator = argument.rpartition("#")
+        if ctx.guild is None or self._get_id_match(argument) or argument.startswith("<@") \
+                or discriminator == "0" or (len(discriminator) == 4 and discriminator.isdigit()):
+            return await super().convert(ctx, argument)  # ids and mentions are already a lookup, name#0000 is legacy
+
+        index = ctx.bot.member_index.get(ctx.guild)
+        ids, prefix = index.lookup(argument), False
+        if not ids and len(argument) >= MIN_PREFIX_LENGTH and not isinstance(ctx.current_parameter.converter, Greedy):
+            # greedy parsing would eat every word that happens to start a name
+            ids, prefix = index.starting_with(argument, limit=2), True
+            if len(ids) > 1:
+                ids = set()
+
+        for member_id in list(ids):  # resolving reindexes them
+            member = ctx.guild.get_member(member_id) or await self.query_member_by_id(ctx.bot, ctx.guild, member_id)
+            if member is None:  # left without the index hearing about it
+                ctx.bot.member_index.remove(ctx.guild.id, member_id)
+                continue
+            ctx.bot.member_index.add(member)
+            if answers_to(member, argument, prefix):  # not renamed since it was indexed
+                return member
+
+        # only discord knows, and what it finds is indexed for the next lookup
+        member = await super().convert(ctx, argument)
+        ctx.bot.member_index.add(member)
+        return member
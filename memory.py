@@ -0,0 +1,137 @@
+import sys
+import tracemalloc
+import logging
+from collections import defaultdict
+from typing import Callable, Iterable, Optional
+
+from metrics import Samples, sample_name
+
+logger = logging.getLogger("memory")
+
+PRIMITIVES = (str, bytes, int, float, bool, type(None))
+CONTAINERS = (list, tuple, set, frozenset, dict)
+ESTIMATE_SAMPLE_SIZE = 20  # objects sized when estimating big caches
+TRACEMALLOC_FRAMES = 5
+DIFF_TOP = 10
+
+# guild id (None for state that doesn't belong to a guild) to (object count, approximate bytes)
+Usage = dict[Optional[int], tuple[int, int]]
+Accountant = Callable[[], Usage]
+
+
+def approx_sizeof(obj, depth: int = 2, follow: tuple[type, ...] = ()) -> int:
+    """Approximate size of an object and what it owns.
+
+    Only recurses into builtin containers, and into attributes of types in follow. Anything else is assumed to be
+    shared (ie the guild or connection state referenced by every discord object) and isn't counted.
+    """
+    size = sys.getsizeof(obj)
+    if depth <= 0 or isinstance(obj, PRIMITIVES):
+        return size
+
+    if isinstance(obj, dict):
+        children = (*obj.keys(), *obj.values())
+    elif isinstance(obj, CONTAINERS):
+        children = obj
+    else:
+        children = [*getattr(obj, "__dict__", {}).values()]
+        for cls in type(obj).__mro__:
+            for slot in getattr(cls, "__slots__", ()):
+                if slot != "__weakref__" and hasattr(obj, slot):
+                    children.append(getattr(obj, slot))
+
+    for child in children:
+        if isinstance(child, PRIMITIVES + CONTAINERS) or isinstance(child, follow):
+            size += approx_sizeof(child, depth - 1, follow)
+    return size
+
+
+def estimate(objects: list, follow: tuple[type, ...] = ()) -> tuple[int, int]:
+    """Object count and approximate bytes, extrapolated from a sample so big caches stay cheap to account"""
+    if not objects:
+        return 0, 0
+    step = max(1, len(objects) // ESTIMATE_SAMPLE_SIZE)
+    sample = objects[::step]
+    return len(objects), sum(approx_sizeof(obj, follow=follow) for obj in sample) * len(objects) // len(sample)
+
+
+def add_usage(usage: Usage, guild_id: Optional[int], objects: int, size: int) -> None:
+    count, total = usage.get(guild_id, (0, 0))
+    usage[guild_id] = (count + objects, total + size)
+
+
+class MemoryAccounting:
+    """Approximate memory used by each subsystem, per guild.
+
+    Subsystems register accountants that only size their own structures, so nothing walks the whole heap.
+    """
+
+    def __init__(self):
+        self.accountants: dict[str, Accountant] = {}
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+
+    def add_accountant(self, name: str, accountant: Accountant) -> None:
+        self.accountants[name] = accountant
+
+    def remove_accountant(self, name: str) -> None:
+        self.accountants.pop(name, None)
+
+    def usage(self) -> dict[str, Usage]:
+        usage = {}
+        for name, accountant in list(self.accountants.items()):
+            try:
+                usage[name] = accountant()
+            except Exception:
+                logger.exception(f"Memory accountant {name} failed")
+        return usage
+
+    @staticmethod
+    def totals(usage: dict[str, Usage]) -> dict[str, tuple[int, int]]:
+        return {
+            name: (sum(count for count, _ in per_guild.values()), sum(size for _, size in per_guild.values()))
+            for name, per_guild in usage.items()
+        }
+
+    @staticmethod
+    def by_guild(usage: dict[str, Usage]) -> dict[Optional[int], tuple[int, int]]:
+        guilds: Usage = defaultdict(lambda: (0, 0))
+        for per_guild in usage.values():
+            for guild_id, (count, size) in per_guild.items():
+                add_usage(guilds, guild_id, count, size)
+        return guilds
+
+    async def collect_metrics(self) -> Samples:
+        samples = {}
+        for name, (count, size) in self.totals(self.usage()).items():
+            samples[sample_name("memory_objects", subsystem=name)] = count
+            samples[sample_name("memory_approx_bytes", subsystem=name)] = size
+        if tracemalloc.is_tracing():
+            samples["memory_traced_bytes"] = tracemalloc.get_traced_memory()[0]
+        return samples
+
+    # tracemalloc
+    def snapshot(self) -> Optional[list[str]]:
+        """Take a tracemalloc snapshot, starting tracing if needed. Returns the top differences to the last one."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        previous, self._snapshot = self._snapshot, snapshot
+        if previous is None:
+            return None
+        return [str(stat) for stat in snapshot.compare_to(previous, "lineno")[:DIFF_TOP]]
+
+    def stop_tracing(self) -> None:
+        self._snapshot = None
+        tracemalloc.stop()
+
+
+def account_many(items: Iterable[tuple[Optional[int], object]], follow: tuple[type, ...] = ()) -> Usage:
+    """Usage of (guild id, object) pairs, sizing every object"""
+    usage: Usage = {}
+    for guild_id, obj in items:
+        add_usage(usage, guild_id, 1, approx_sizeof(obj, follow=follow))
+    return usage
@@ -0,0 +1,179 @@
+import time
+import asyncio
+import bisect
+import logging
+from collections import defaultdict
+from typing import Awaitable, Callable, Iterator, Optional
+
+logger = logging.getLogger("metrics")
+
+PREFIX = "furret"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # in seconds
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)  # in seconds
+LAG_PROBE_INTERVAL = 0.5  # in seconds
+
+# name to value, name can include prometheus labels, ie 'wavelink_players{node="main"}'
+Samples = dict[str, float]
+Collector = Callable[[], Awaitable[Samples]]
+
+
+def sample_name(name: str, **labels: str) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+class Histogram:
+    """Fixed bucket histogram, only stores the count of each bucket so observing is O(log buckets)"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets: tuple[float, ...] = buckets
+        self.counts: list[int] = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate the quantile by interpolating inside the bucket it falls in"""
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def exposition(self, name: str, **labels: str) -> Iterator[str]:
+        cumulative = 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            cumulative += count
+            yield f"{sample_name(name + '_bucket', **labels, le=str(bound))} {cumulative}"
+        yield f"{sample_name(name + '_sum', **labels)} {self.sum}"
+        yield f"{sample_name(name + '_count', **labels)} {self.count}"
+
+
+class Metrics:
+    """Command, event loop lag and collector metrics, exported in prometheus text format"""
+
+    def __init__(self):
+        self.command_invocations: dict[str, int] = defaultdict(int)
+        self.command_errors: dict[str, int] = defaultdict(int)
+        self.command_latency: dict[str, Histogram] = {}
+        self.loop_lag: Histogram = Histogram(LAG_BUCKETS)
+        self.last_loop_lag: float = 0.0
+        self._lag_probe_due: Optional[float] = None  # loop time the running probe should wake up at
+        self.collectors: dict[str, Collector] = {}
+
+        self._lag_task: Optional[asyncio.Task] = None
+        self._server: Optional[asyncio.Server] = None
+
+    # commands
+    def command_started(self, name: str) -> float:
+        self.command_invocations[name] += 1
+        return time.perf_counter()
+
+    def command_finished(self, name: str, started: float) -> None:
+        elapsed = time.perf_counter() - started
+        try:
+            self.command_latency[name].observe(elapsed)
+        except KeyError:
+            self.command_latency[name] = histogram = Histogram()
+            histogram.observe(elapsed)
+
+    def command_failed(self, name: str) -> None:
+        self.command_errors[name] += 1
+
+    # collectors
+    def add_collector(self, name: str, collector: Collector) -> None:
+        """Register a coroutine function returning gauge samples, called on every scrape"""
+        self.collectors[name] = collector
+
+    def remove_collector(self, name: str) -> None:
+        self.collectors.pop(name, None)
+
+    async def collect(self) -> Samples:
+        samples: Samples = {}
+        for name, collector in list(self.collectors.items()):
+            try:
+                samples.update(await collector())
+            except Exception:
+                logger.exception(f"Metrics collector {name} failed")
+        return samples
+
+    # event loop lag
+    async def _probe_loop_lag(self, interval: float) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._lag_probe_due = loop.time() + interval
+            await asyncio.sleep(interval)
+            self.last_loop_lag = max(0.0, loop.time() - self._lag_probe_due)
+            self.loop_lag.observe(self.last_loop_lag)
+
+    def current_loop_lag(self) -> float:
+        """The last lag measured, or how late the probe is already if that's more"""
+        if self._lag_probe_due is None:
+            return self.last_loop_lag
+        return max(self.last_loop_lag, asyncio.get_running_loop().time() - self._lag_probe_due)
+
+    def start_lag_probe(self, interval: float = LAG_PROBE_INTERVAL) -> None:
+        if self._lag_task is None:
+            self._lag_task = asyncio.create_task(self._probe_loop_lag(interval))
+
+    # export
+    async def exposition(self) -> str:
+        lines = [
+            f"# TYPE {PREFIX}_command_invocations_total counter",
+            *(f'{sample_name(f"{PREFIX}_command_invocations_total", command=k)} {v}' for k, v in self.command_invocations.items()),
+            f"# TYPE {PREFIX}_command_errors_total counter",
+            *(f'{sample_name(f"{PREFIX}_command_errors_total", command=k)} {v}' for k, v in self.command_errors.items()),
+            f"# TYPE {PREFIX}_command_latency_seconds histogram",
+        ]
+        for name, histogram in self.command_latency.items():
+            lines.extend(histogram.exposition(f"{PREFIX}_command_latency_seconds", command=name))
+        lines.append(f"# TYPE {PREFIX}_event_loop_lag_seconds histogram")
+        lines.extend(self.loop_lag.exposition(f"{PREFIX}_event_loop_lag_seconds"))
+
+        for name, value in (await self.collect()).items():
+            lines.append(f"{PREFIX}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    async def _handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):  # skip the headers
+                pass
+
+            if request_line.split(b" ")[1:2] == [b"/metrics"]:
+                status, body = "200 OK", (await self.exposition()).encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def start_server(self, host: str, port: int) -> None:
+        self._server = await asyncio.start_server(self._handle_http, host, port)
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+    async def close(self) -> None:
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+        if self._server is not None:
+            self._server.close()
@@ -0,0 +1,172 @@
+import sys
+import time
+import asyncio
+import logging
+import threading
+from collections import Counter
+from types import FrameType
+from typing import Optional
+
+logger = logging.getLogger("profiler")
+
+DEFAULT_SLOW_CALLBACK_THRESHOLD = 0.1  # in seconds
+SAMPLE_INTERVAL = 0.005  # in seconds
+STACK_DEPTH = 8  # frames shown in slow callback logs
+ATTRIBUTED_MODULES = ("cogs.", "bot")  # frames from these modules are what slow callbacks get blamed on
+
+
+def frame_name(frame: FrameType) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_qualname}"
+
+
+def walk_stack(frame: Optional[FrameType]) -> list[FrameType]:
+    """Frames from the innermost to the outermost"""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    return frames
+
+
+def walk_coroutine(coro) -> list[FrameType]:
+    """Frames of a suspended coroutine chain, from the innermost to the outermost"""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is not None:
+            frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return frames[::-1]
+
+
+def attribute(frames: list[FrameType]) -> Optional[str]:
+    """The innermost frame from the bot's own code, ie a cog listener, command or task"""
+    for frame in frames:
+        if frame.f_globals.get("__name__", "").startswith(ATTRIBUTED_MODULES):
+            return frame_name(frame)
+    return None
+
+
+def collapse(frames: list[FrameType]) -> str:
+    """Collapsed stack line in the format flame graph tools take, outermost frame first"""
+    return ";".join(frame_name(frame) for frame in reversed(frames))
+
+
+class SlowCallbackDetector:
+    """Logs event loop callbacks running longer than the threshold, along with where the time was spent.
+
+    Works by wrapping asyncio's Handle._run while active, so there's no overhead when stopped.
+    A watchdog thread grabs the loop thread's stack while a callback is still running over the threshold.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_SLOW_CALLBACK_THRESHOLD):
+        self.threshold: float = threshold
+        self.slow_callbacks: int = 0
+
+        self._original_run = None
+        self._run_code = None
+        self._loop_thread_id: Optional[int] = None
+        self._running: Optional[tuple[asyncio.Handle, float]] = None
+        self._sampled: dict[int, list[FrameType]] = {}  # id(handle) to the stack captured by the watchdog
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def active(self) -> bool:
+        return self._original_run is not None
+
+    def start(self) -> bool:
+        """Start detecting, must be called from the event loop thread. Returns whether it's on"""
+        if self.active:
+            return True
+        loop = asyncio.get_running_loop()
+        if not isinstance(loop, asyncio.BaseEventLoop):  # uvloop runs its callbacks in C, never through Handle._run
+            logger.warning(f"Slow callback detection needs asyncio's event loop, it can't see into "
+                           f"{type(loop).__module__}.{type(loop).__qualname__} and stays off")
+            return False
+
+        detector = self
+        original_run = self._original_run = asyncio.Handle._run
+
+        def _run(handle):
+            start = time.perf_counter()
+            detector._running = (handle, start)
+            try:
+                original_run(handle)
+            finally:
+                detector._running = None
+                elapsed = time.perf_counter() - start
+                if elapsed >= detector.threshold:
+                    detector._report(handle, elapsed)
+
+        asyncio.Handle._run = _run
+        self._run_code = original_run.__code__
+        self._loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="slow-callback-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(f"Slow callback detection on, threshold {self.threshold * 1000:.0f}ms")
+        return True
+
+    def stop(self) -> None:
+        if not self.active:
+            return
+
+        asyncio.Handle._run = self._original_run
+        self._original_run = None
+        self._stop.set()
+        self._sampled.clear()
+        logger.info("Slow callback detection off")
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.threshold / 2):
+            running = self._running
+            if running is None:
+                continue
+
+            handle, start = running
+            if time.perf_counter() - start >= self.threshold and id(handle) not in self._sampled:
+                frames = walk_stack(sys._current_frames().get(self._loop_thread_id))
+                # cut off the event loop internals, everything from Handle._run outwards
+                cut = next((i for i, frame in enumerate(frames) if frame.f_code is self._run_code), len(frames))
+                self._sampled[id(handle)] = frames[:cut]
+
+    def _report(self, handle: asyncio.Handle, elapsed: float) -> None:
+        self.slow_callbacks += 1
+
+        callback = handle._callback
+        owner = getattr(callback, "__self__", None)
+        source = owner.get_name() if isinstance(owner, asyncio.Task) else getattr(callback, "__qualname__", repr(callback))
+
+        # stack from while it was still running if the watchdog caught it, otherwise where the task is suspended now
+        frames = self._sampled.pop(id(handle), None)
+        if frames is None and isinstance(owner, asyncio.Task):
+            frames = walk_coroutine(owner.get_coro())
+        frames = frames or []
+
+        stack = " < ".join(frame_name(frame) + f":{frame.f_lineno}" for frame in frames[:STACK_DEPTH])
+        logger.warning(
+            f"Slow callback {elapsed * 1000:.0f}ms in {attribute(frames) or source} ({source})\n"
+            f"  {stack or 'no stack'}"
+        )
+
+
+def sample_profile(thread_id: int, duration: float, interval: float = SAMPLE_INTERVAL) -> Counter[str]:
+    """Sample the thread's stack for a duration, returns collapsed stacks and how many times they were seen.
+
+    Blocking, run it in another thread than the one being sampled.
+    """
+    stacks: Counter[str] = Counter()
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            stacks[collapse(walk_stack(frame))] += 1
+            del frame
+        time.sleep(interval)
+    return stacks
+
+
+async def profile_loop(duration: float, interval: float = SAMPLE_INTERVAL) -> Counter[str]:
+    """Sample the running event loop's thread for a duration"""
+    return await asyncio.to_thread(sample_profile, threading.get_ident(), duration, interval)
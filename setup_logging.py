@@ -1,11 +1,107 @@
 import os
+import time
+import json
+import queue
+import atexit
 import discord
 import logging
-from logging import StreamHandler
-from logging.handlers import TimedRotatingFileHandler
+from logging import StreamHandler, LogRecord
+from logging.handlers import TimedRotatingFileHandler, QueueHandler, QueueListener
 
+QUEUE_SIZE = 10000
+# records per second allowed for noisy loggers, warnings and above are never limited
+LOGGER_RATE_LIMITS = {
+    "discord.gateway": 20,
+    "discord.http": 20,
+}
 
-def setup_logging(*, log_directory: str = "./logs") -> None:
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue handler that drops records when the queue is full instead of blocking the event loop"""
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped: int = 0
+
+    def prepare(self, record: LogRecord) -> LogRecord:
+        # the queue is only consumed in process, so leave formatting to the listener thread
+        return record
+
+    def enqueue(self, record: LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per logger, records over the limit are dropped"""
+
+    def __init__(self, limits: dict[str, float]):
+        super().__init__()
+        self.limits: dict[str, float] = limits
+        self.buckets: dict[str, tuple[float, float]] = {}  # logger name to (tokens, last refill time)
+        self.limited: int = 0
+
+    def _limit_for(self, name: str) -> str | None:
+        for limited_name in self.limits:
+            if name == limited_name or name.startswith(limited_name + "."):
+                return limited_name
+        return None
+
+    def filter(self, record: LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+
+        name = self._limit_for(record.name)
+        if name is None:
+            return True
+
+        rate = self.limits[name]
+        now = time.monotonic()
+        tokens, last = self.buckets.get(name, (rate, now))
+        tokens = min(rate, tokens + (now - last) * rate)
+        if tokens < 1:
+            self.buckets[name] = (tokens, now)
+            self.limited += 1
+            return False
+
+        self.buckets[name] = (tokens - 1, now)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "name": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data)
+
+
+async def collect_logging_metrics() -> dict[str, float]:
+    samples = {}
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, DroppingQueueHandler):
+            samples["log_records_dropped_total"] = handler.dropped
+            samples["log_queue_depth"] = handler.queue.qsize()
+            for log_filter in handler.filters:
+                if isinstance(log_filter, RateLimitFilter):
+                    samples["log_records_rate_limited_total"] = log_filter.limited
+    return samples
+
+
+def setup_logging(
+        *,
+        log_directory: str = "./logs",
+        filename: str = "bot.log",
+        json_format: bool = False,
+        queue_size: int = QUEUE_SIZE,
+        rate_limits: dict[str, float] = None) -> QueueListener:
     # info logger to stdout
     stream_handler = StreamHandler()
     stream_handler.setLevel(level=logging.INFO)
@@ -14,10 +110,28 @@ def setup_logging(*, log_directory: str = "./logs") -> None:
     # debug logger to file
     os.makedirs(log_directory, exist_ok=True)
     file_handler = TimedRotatingFileHandler(
-        filename=f"{log_directory}/bot.log",
+        filename=f"{log_directory}/{filename}",
         when="midnight",
         backupCount=7,
         encoding="utf-8"
     )
-    formatter = logging.Formatter('[{asctime}] [{levelname:<8}] {name}: {message}', "%Y-%m-%d %H:%M:%S", style='{')
+    if json_format:
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('[{asctime}] [{levelname:<8}] {name}: {message}', "%Y-%m-%d %H:%M:%S", style='{')
     discord.utils.setup_logging(handler=file_handler, formatter=formatter, level=logging.DEBUG, root=True)
+
+    # move the handlers behind a bounded queue, so formatting and file io happens on the listener thread
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    for handler in handlers:
+        root.removeHandler(handler)
+
+    queue_handler = DroppingQueueHandler(queue.Queue(queue_size))
+    queue_handler.addFilter(RateLimitFilter(LOGGER_RATE_LIMITS if rate_limits is None else rate_limits))
+    root.addHandler(queue_handler)
+
+    listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
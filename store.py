@@ -0,0 +1,125 @@
+import os
+import json
+import asyncio
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger("store")
+
+DEFAULT_PATH = "./data/furret.db"
+
+
+def log_failure(future: asyncio.Future) -> None:
+    """Retrieve exceptions of writes nobody awaited"""
+    if not future.cancelled() and (exc := future.exception()):
+        logger.error(f"Shared store write failed: {exc!r}")
+
+
+class SharedStore:
+    """Small key value store on SQLite in WAL mode, safe to share between shard processes.
+
+    Values are namespaced and stored as json, counters are stored separately so they can be incremented atomically.
+    The event loop writes with the *_soon methods, which run in order on a writer thread with its own connection,
+    so another shard process holding the write lock never stalls the loop. Reads don't wait on writers in WAL mode.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path: str = path
+        self.conn = self._connect()
+        self._writer_conn: Optional[sqlite3.Connection] = None  # opened on the writer thread
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="store-writer",
+                                          initializer=self._connect_writer)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (namespace, key))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS counters ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value INTEGER NOT NULL, PRIMARY KEY (namespace, key))"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # no fsync per commit in WAL mode, writes stay sub millisecond
+        conn.execute("PRAGMA busy_timeout=5000")  # wait on other shard processes holding the write lock
+        return conn
+
+    def _connect_writer(self) -> None:
+        self._writer_conn = self._connect()
+
+    def close(self) -> None:
+        """Finish the pending writes, then close"""
+        self._writer.shutdown(wait=True)
+        if self._writer_conn is not None:
+            self._writer_conn.close()
+        self.conn.close()
+
+    def _write_soon(self, write: Callable[..., Any], *args: Any) -> asyncio.Future:
+        """Run the write on the writer thread, after the ones submitted before it"""
+        future = asyncio.get_running_loop().run_in_executor(self._writer, lambda: write(self._writer_conn, *args))
+        future.add_done_callback(log_failure)
+        return future
+
+    # counters
+    @staticmethod
+    def _increment(conn: sqlite3.Connection, namespace: str, key: str, amount: int) -> int:
+        (value,) = conn.execute(
+            "INSERT INTO counters (namespace, key, value) VALUES (?, ?, ?) "
+            "ON CONFLICT (namespace, key) DO UPDATE SET value = value + excluded.value RETURNING value",
+            (namespace, key, amount)
+        ).fetchone()
+        return value
+
+    def increment(self, namespace: str, key: str, amount: int = 1) -> int:
+        """Atomically increment a counter across all processes, returns the new value"""
+        return self._increment(self.conn, namespace, key, amount)
+
+    def increment_soon(self, namespace: str, key: str, amount: int = 1) -> asyncio.Future[int]:
+        return self._write_soon(self._increment, namespace, key, amount)
+
+    def seed_counters(self, namespace: str, values: dict[str, int]) -> None:
+        """Insert initial counter values, existing counters are left untouched so seeding twice is harmless"""
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO counters (namespace, key, value) VALUES (?, ?, ?)",
+            ((namespace, key, value) for key, value in values.items())
+        )
+
+    def counters(self, namespace: str) -> dict[str, int]:
+        return dict(self.conn.execute("SELECT key, value FROM counters WHERE namespace = ?", (namespace,)))
+
+    # json values
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        row = self.conn.execute("SELECT value FROM kv WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    @staticmethod
+    def _set(conn: sqlite3.Connection, namespace: str, key: str, value: str) -> None:
+        conn.execute(
+            "INSERT INTO kv (namespace, key, value) VALUES (?, ?, ?) "
+            "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value",
+            (namespace, key, value)
+        )
+
+    def set(self, namespace: str, key: str, value: Any) -> None:
+        self._set(self.conn, namespace, key, json.dumps(value))
+
+    def set_soon(self, namespace: str, key: str, value: Any) -> asyncio.Future[None]:
+        """Write from the event loop, awaiting it is only needed to know it's done. The value is dumped right away"""
+        return self._write_soon(self._set, namespace, key, json.dumps(value))
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, namespace: str, key: str) -> None:
+        conn.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._delete(self.conn, namespace, key)
+
+    def delete_soon(self, namespace: str, key: str) -> asyncio.Future[None]:
+        return self._write_soon(self._delete, namespace, key)
+
+    def items(self, namespace: str) -> dict[str, Any]:
+        return {k: json.loads(v) for k, v in self.conn.execute("SELECT key, value FROM kv WHERE namespace = ?", (namespace,))}
@@ -0,0 +1,187 @@
+import re
+import asyncio
+from re import _constants, _parser
+import logging
+import traceback
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterable, Optional
+
+from discord import Message
+
+logger = logging.getLogger("triggers")
+
+# return False to let the next trigger in the same group handle the message instead
+Handler = Callable[[Message], Awaitable[Optional[bool]]]
+
+
+@dataclass(slots=True, frozen=True)
+class Trigger:
+    name: str
+    pattern: Optional[str]  # None matches every message
+    handler: Handler
+    group: str
+    flags: int = 0
+    channel_ids: Optional[frozenset[int]] = None  # None for every channel
+    ignore_bots: bool = True
+    priority: str = "normal"  # admission priority, low priority triggers are shed first under load
+
+
+def _first_chars(items) -> tuple[Optional[set[str]], bool]:
+    """Characters a sequence of parsed regex items can start with, and whether it can match an empty string"""
+    chars: set[str] = set()
+    for op, av in items:
+        if op is _constants.AT:  # anchors and word boundaries don't consume anything
+            continue
+        elif op is _constants.LITERAL:
+            chars.add(chr(av))
+            return chars, False
+        elif op is _constants.IN:
+            for in_op, in_av in av:
+                if in_op is _constants.LITERAL:
+                    chars.add(chr(in_av))
+                elif in_op is _constants.RANGE and in_av[1] - in_av[0] < 256:
+                    chars.update(map(chr, range(in_av[0], in_av[1] + 1)))
+                else:  # negated sets, categories like \w
+                    return None, False
+            return chars, False
+        elif op is _constants.SUBPATTERN:
+            sub_chars, nullable = _first_chars(av[-1])
+        elif op is _constants.BRANCH:
+            sub_chars, nullable = set(), False
+            for branch in av[1]:
+                branch_chars, branch_nullable = _first_chars(branch)
+                if branch_chars is None:
+                    return None, False
+                sub_chars |= branch_chars
+                nullable = nullable or branch_nullable
+        elif op in (_constants.MAX_REPEAT, _constants.MIN_REPEAT):
+            sub_chars, nullable = _first_chars(av[2])
+            nullable = nullable or av[0] == 0
+        else:  # anything else (lookarounds, backreferences, ...) isn't worth narrowing down
+            return None, False
+
+        if sub_chars is None:
+            return None, False
+        chars |= sub_chars
+        if not nullable:
+            return chars, False
+    return chars, True
+
+
+def first_chars(pattern: str, flags: int = 0) -> Optional[frozenset[str]]:
+    """Lowercased characters every match of the pattern starts with, None if it can't be narrowed down"""
+    try:
+        chars, nullable = _first_chars(_parser.parse(pattern, flags))
+    except Exception:  # relies on re internals, never fail a trigger over it
+        return None
+    if chars is None or nullable:
+        return None
+    return frozenset(c.lower() for c in chars)
+
+
+class CompiledTriggers:
+    """Every trigger that applies to a channel, indexed by the first character their matches can start with.
+
+    A message is only tested against the triggers that can match its first character, plus the ones that couldn't
+    be narrowed down, so the cost stays flat as more triggers get registered.
+    """
+
+    def __init__(self, triggers: list[Trigger]):
+        compiled = [(t, re.compile(t.pattern, t.flags) if t.pattern is not None else None) for t in triggers]
+        firsts = [first_chars(t.pattern, t.flags) if t.pattern is not None else None for t in triggers]
+
+        self.always: list[tuple[Trigger, Optional[re.Pattern]]] = [c for c, f in zip(compiled, firsts) if f is None]
+        self.by_first_char: dict[str, list[tuple[Trigger, Optional[re.Pattern]]]] = {}
+        for char in set().union(*(f for f in firsts if f is not None)):
+            # merged with the ones that always run, keeping registration order
+            self.by_first_char[char] = [c for c, f in zip(compiled, firsts) if f is None or char in f]
+
+    def match(self, content: str) -> list[Trigger]:
+        """Triggers whose pattern matches the start of the content (re.match semantics), in registration order"""
+        candidates = self.by_first_char.get(content[:1].lower(), self.always)
+        return [trigger for trigger, pattern in candidates if pattern is None or pattern.match(content)]
+
+
+class TriggerRegistry:
+    """Content triggers declared by cogs, every message is scanned once and only dispatched to matching handlers.
+
+    Patterns are matched at the start of the message like re.match.
+    Within a group, only the first matching trigger whose handler doesn't return False handles the message.
+    """
+
+    def __init__(self, admit: Optional[Callable[[str], bool]] = None):
+        self.triggers: dict[str, Trigger] = {}
+        self.admit: Optional[Callable[[str], bool]] = admit  # whether triggers of a priority should run right now
+        self._compiled: dict[Optional[int], CompiledTriggers] = {}  # channel id to its compiled triggers
+        self._scoped_channels: set[int] = set()
+
+    def add(
+            self,
+            name: str,
+            pattern: Optional[str],
+            handler: Handler,
+            *,
+            group: Optional[str] = None,
+            flags: int = 0,
+            channel_ids: Optional[Iterable[int]] = None,
+            ignore_bots: bool = True,
+            priority: str = "normal") -> None:
+        if pattern is not None:
+            re.compile(pattern, flags)  # fail on registration rather than on the next message
+
+        self.triggers[name] = Trigger(
+            name=name,
+            pattern=pattern,
+            handler=handler,
+            group=group or name,
+            flags=flags,
+            channel_ids=frozenset(channel_ids) if channel_ids is not None else None,
+            ignore_bots=ignore_bots,
+            priority=priority
+        )
+        self._invalidate()
+
+    def remove(self, *names: str) -> None:
+        for name in names:
+            self.triggers.pop(name, None)
+        self._invalidate()
+
+    def _invalidate(self) -> None:
+        self._compiled.clear()
+        self._scoped_channels = {c for t in self.triggers.values() if t.channel_ids for c in t.channel_ids}
+
+    def compiled_for(self, channel_id: int) -> CompiledTriggers:
+        key = channel_id if channel_id in self._scoped_channels else None  # unscoped channels all share one
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            compiled = self._compiled[key] = CompiledTriggers([
+                t for t in self.triggers.values() if t.channel_ids is None or key in t.channel_ids
+            ])
+        return compiled
+
+    def match(self, content: str, channel_id: int) -> list[Trigger]:
+        return self.compiled_for(channel_id).match(content)
+
+    async def _run_group(self, msg: Message, triggers: list[Trigger]) -> None:
+        for trigger in triggers:
+            try:
+                if await trigger.handler(msg) is not False:
+                    return
+            except Exception as exc:
+                logger.error(
+                    f'Ignoring exception in trigger {trigger.name}:\n'
+                    f'{"".join(traceback.format_exception(type(exc), exc, exc.__traceback__))}'
+                )
+                return
+
+    async def dispatch(self, msg: Message) -> None:
+        groups: dict[str, list[Trigger]] = {}
+        for trigger in self.match(msg.content, msg.channel.id):
+            if trigger.ignore_bots and msg.author.bot:
+                continue
+            if self.admit is not None and not self.admit(trigger.priority):
+                continue
+            groups.setdefault(trigger.group, []).append(trigger)
+
+        if groups:
+            await asyncio.gather(*(self._run_group(msg, triggers) for triggers in groups.values()))